@@ -0,0 +1,313 @@
+"""
+Benchmarks of the BigQuery connector hot paths.
+
+Every case runs in its own process against DummyBigQuery, the local
+emulator, with an injected per-call latency and row width, and reports:
+
+ * rows_per_s, bytes_per_s: throughput of the measured method
+ * calls_per_million_rows: API calls needed for one million rows
+ * peak_rss_mb: peak resident memory of the process running the case
+ * call_p50_ms, call_p99_ms: latency percentiles of the API calls
+
+Usage (with kumpel installed, e.g. pip install -e .):
+
+    python benchmarks/bench_bigquery.py --output results.json
+    python benchmarks/bench_bigquery.py --save-baseline
+    python benchmarks/bench_bigquery.py --baseline
+
+Throughput and memory depend on the machine, so baselines are kept per
+machine, in benchmarks/baselines/<machine>.json by default: run
+--save-baseline once on a machine (e.g. on the main branch), then
+--baseline after a change. The exit code is 1 if a case is slower, uses
+more API calls or more memory than the baseline beyond the tolerance.
+Against a baseline of another machine, or of another python version,
+only the API calls per million rows are compared.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import re
+import resource
+import sys
+import threading
+from time import perf_counter
+
+from kumpel import DummyBigQuery
+from kumpel.connectors.batching import row_size
+
+# metric -> True when higher is better
+METRICS = {
+    'rows_per_s': True,
+    'bytes_per_s': True,
+    'calls_per_million_rows': False,
+    'peak_rss_mb': False,
+    'call_p50_ms': False,
+    'call_p99_ms': False,
+}
+
+# metrics which do not depend on the machine
+PORTABLE_METRICS = ('calls_per_million_rows',)
+
+BASELINES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines')
+
+
+def machine_id():
+    """
+    Name of the machine and python version the benchmarks run on.
+    """
+    text = '%s-%s-python%s' % (platform.node(), platform.machine(), platform.python_version())
+    return re.sub(r'[^\w.\-]+', '_', text)
+
+
+def default_baseline():
+    return os.path.join(BASELINES, '%s.json' % machine_id())
+
+
+class TimedClient:
+    """
+    Proxy recording the duration of every client call, including the
+    execute() of raw API requests made through client.bigquery.
+    """
+
+    def __init__(self, client, durations=None, lock=None, root=True):
+        self._client = client
+        self._root = root
+        self.durations = [] if durations is None else durations
+        self._lock = lock or threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if self._root and name == 'bigquery':
+            return TimedClient(attr, self.durations, self._lock, root=False)
+        if not callable(attr):
+            return attr
+        if self._root or name == 'execute':
+            return self._timed(attr)
+
+        def call(*args, **kwargs):
+            return TimedClient(attr(*args, **kwargs), self.durations, self._lock, root=False)
+        return call
+
+    def _timed(self, method):
+        def call(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.durations.append(perf_counter() - start)
+        return call
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def make_rows(count, width):
+    padding = 'x' * width
+    for index in range(count):
+        yield {'id': index, 'name': 'row %i' % index, 'value': index * 0.5,
+               'flag': index % 2 == 0, 'payload': padding}
+
+
+SCHEMA = {'id': 'INTEGER', 'name': 'STRING', 'value': 'FLOAT',
+          'flag': 'BOOLEAN', 'payload': 'STRING'}
+
+
+def connector(latency):
+    bq = DummyBigQuery(latency=latency)
+    bq.create_dataset('bench')
+    bq.create_table('bench', 'rows', SCHEMA)
+    return bq
+
+
+def fill(bq, rows, width):
+    bq.write_to_table('bench', 'rows', make_rows(rows, width), workers=4)
+
+
+def bench_write(config):
+    bq = connector(config['latency'])
+    bq.client = TimedClient(bq.client)
+    rows = list(make_rows(config['rows'], config['width']))
+    start = perf_counter()
+    bq.write_to_table('bench', 'rows', iter(rows),
+                      batch_write=config['batch'], workers=config['workers'])
+    return bq, rows, perf_counter() - start
+
+
+def bench_read_query(config):
+    bq = connector(0.0)
+    fill(bq, config['rows'], config['width'])
+    bq.client.latency = config['latency']
+    bq.client = TimedClient(bq.client)
+    start = perf_counter()
+    rows = list(bq.read_query('SELECT * FROM [bench.rows]', batch_read=config['batch'],
+                              workers=config['workers']))
+    return bq, rows, perf_counter() - start
+
+
+def bench_read_data(config):
+    bq = connector(0.0)
+    fill(bq, config['rows'], config['width'])
+    bq.client.latency = config['latency']
+    bq.client = TimedClient(bq.client)
+    start = perf_counter()
+    rows = list(bq.read_data('bench', 'rows', batch=config['batch'],
+                             workers=config['workers']))
+    return bq, rows, perf_counter() - start
+
+
+def bench_parse_schema(config):
+    schema = ','.join('col_%i:%s' % (i, 'INTEGER' if i % 2 else 'STRING')
+                      for i in range(config['width']))
+    start = perf_counter()
+    for _ in range(config['rows']):
+        DummyBigQuery.parse_schema_from_string(schema)
+    elapsed = perf_counter() - start
+    return None, [schema] * config['rows'], elapsed
+
+
+BENCHMARKS = {
+    'write_to_table': bench_write,
+    'read_query': bench_read_query,
+    'read_data': bench_read_data,
+    'parse_schema_from_string': bench_parse_schema,
+}
+
+CASES = [
+    ('write_to_table', {'rows': 50000, 'width': 20, 'batch': 500, 'workers': 1, 'latency': 0.01}),
+    ('write_to_table', {'rows': 50000, 'width': 20, 'batch': 500, 'workers': 8, 'latency': 0.01}),
+    ('write_to_table', {'rows': 20000, 'width': 2000, 'batch': 10000, 'workers': 4, 'latency': 0.01}),
+    ('read_query', {'rows': 50000, 'width': 20, 'batch': 1000, 'workers': 1, 'latency': 0.01}),
+    ('read_query', {'rows': 50000, 'width': 20, 'batch': 1000, 'workers': 8, 'latency': 0.01}),
+    ('read_data', {'rows': 50000, 'width': 20, 'batch': 1000, 'workers': 8, 'latency': 0.01}),
+    ('parse_schema_from_string', {'rows': 2000, 'width': 300, 'batch': 0, 'workers': 1, 'latency': 0}),
+]
+
+
+def case_name(method, config):
+    return '%s[rows=%i,width=%i,batch=%i,workers=%i,latency=%g]' % (
+        method, config['rows'], config['width'], config['batch'],
+        config['workers'], config['latency'])
+
+
+def run_case(method, config, queue):
+    bq, rows, elapsed = BENCHMARKS[method](config)
+    durations = bq.client.durations if bq is not None else []
+    if rows and isinstance(rows[0], dict):
+        payload = sum(row_size(row) for row in rows)
+    else:
+        payload = sum(len(row) for row in rows)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        peak *= 1024
+    queue.put({
+        'rows_per_s': len(rows) / elapsed,
+        'bytes_per_s': payload / elapsed,
+        'calls_per_million_rows': len(durations) * 1e6 / max(1, len(rows)),
+        'peak_rss_mb': peak / 1024 ** 2,
+        'call_p50_ms': percentile(durations, 0.5) * 1000,
+        'call_p99_ms': percentile(durations, 0.99) * 1000,
+    })
+
+
+def run(cases):
+    results = {}
+    for method, config in cases:
+        # a process per case, so peak memory is not shared between cases
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run_case, args=(method, config, queue))
+        process.start()
+        process.join()
+        name = case_name(method, config)
+        if process.exitcode != 0:
+            raise RuntimeError('Benchmark %s failed.' % name)
+        metrics = queue.get()
+        results[name] = metrics
+        print('%-90s %12.0f rows/s %8.0f calls/M rows %7.1f MB p50 %6.2f ms p99 %6.2f ms'
+              % (name, metrics['rows_per_s'], metrics['calls_per_million_rows'],
+                 metrics['peak_rss_mb'], metrics['call_p50_ms'], metrics['call_p99_ms']))
+    return results
+
+
+def compare(results, baseline, tolerance, metrics=None):
+    """
+    List the metrics which are worse than the baseline by more than
+    tolerance (relative). Latency percentiles are reported but not
+    compared, they depend too much on the machine.
+
+    :param metrics: names of the metrics compared, None for all of them
+    """
+    regressions = []
+    for name, values in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        for metric, higher_is_better in METRICS.items():
+            if metric.startswith('call_p') or metric not in reference:
+                continue
+            if metrics is not None and metric not in metrics:
+                continue
+            old, new = reference[metric], values[metric]
+            if higher_is_better and new < old * (1 - tolerance):
+                regressions.append((name, metric, old, new))
+            if not higher_is_better and new > old * (1 + tolerance) and new - old > 1e-9:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--output', help='write results to this json file')
+    parser.add_argument('--baseline', nargs='?', const=default_baseline(),
+                        help='compare results with this json file, defaults to the '
+                             'baseline of this machine')
+    parser.add_argument('--save-baseline', nargs='?', const=default_baseline(),
+                        help='write results as new baseline, defaults to the '
+                             'baseline of this machine')
+    parser.add_argument('--tolerance', type=float, default=0.3,
+                        help='relative difference allowed before a regression')
+    parser.add_argument('--filter', default='', help='only run cases containing this text')
+    args = parser.parse_args(argv)
+    if args.baseline and not os.path.exists(args.baseline):
+        print('No baseline %s, create it with --save-baseline.' % args.baseline)
+        return 2
+
+    cases = [(method, config) for method, config in CASES
+             if args.filter in case_name(method, config)]
+    results = run(cases)
+    document = {
+        'machine': machine_id(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            with open(path, 'w') as fout:
+                json.dump(document, fout, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as fin:
+            baseline = json.load(fin)
+        metrics = None
+        if baseline.get('machine') != document['machine']:
+            print('Baseline of %s, on %s: only comparing %s.'
+                  % (baseline.get('machine', 'another machine'), document['machine'],
+                     ', '.join(PORTABLE_METRICS)))
+            metrics = PORTABLE_METRICS
+        regressions = compare(results, baseline['results'], args.tolerance, metrics)
+        for name, metric, old, new in regressions:
+            print('REGRESSION %s %s: %.2f -> %.2f' % (name, metric, old, new))
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,6 +1,36 @@
 from kumpel.connectors.big_query_api import (
     BigQueryError,
+    BigQueryJobError,
     BigQuerySchemaParsingError,
     BigQuery,
     DummyBigQuery
 )
+from kumpel.connectors.errors import BigQueryJobTimeout, BigQueryRowError
+from kumpel.connectors.cache import QueryResultCache
+from kumpel.connectors.export import ExportJob, GCSStorage, LocalStorage, Storage
+from kumpel.connectors.flight import SingleFlight
+from kumpel.connectors.instrumentation import (
+    CallEvent,
+    Hook,
+    InMemoryAggregator,
+    PrometheusExporter,
+    profile
+)
+from kumpel.connectors.journal import LoadJournal
+from kumpel.connectors.materialized import MaterializedResult
+from kumpel.connectors.profiling import ColumnProfile, TableProfile
+from kumpel.connectors.records import Record, Rows, RowSchema
+from kumpel.connectors.scheduler import JobScheduler, QueryStep
+from kumpel.connectors.schema import RowEncoder, Schema
+from kumpel.connectors.sync import SyncResult, TableSync, WatermarkStore
+from kumpel.connectors.throttling import AdaptiveLimit, RetryPolicy, Throttle
+from kumpel.connectors.upsert import UpsertResult
+
+
+def __getattr__(name):
+    # asyncio takes tens of milliseconds to import, the async connector
+    # is only imported once it is used
+    if name in ('AsyncBigQuery', 'AsyncRows'):
+        from kumpel.connectors import async_big_query_api
+        return getattr(async_big_query_api, name)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
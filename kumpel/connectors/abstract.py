@@ -1,5 +1,7 @@
 from abc import ABCMeta, abstractmethod
 
+from .instrumentation import Instrumented
+
 
 class BaseConnector(metaclass=ABCMeta):
     """
@@ -17,7 +19,7 @@ class BaseConnector(metaclass=ABCMeta):
         pass
 
 
-class SQLConnector(BaseConnector):
+class SQLConnector(BaseConnector, Instrumented):
     @abstractmethod
     def create_table(self, *args, **kwargs):
         raise NotImplementedError
@@ -45,3 +47,24 @@ class SQLConnector(BaseConnector):
     @abstractmethod
     def write_query_to_table(self):
         raise NotImplementedError
+
+    def quote_table(self, dataset: str, table: str) -> str:
+        """
+        Reference to a table in the queries built by kumpel (e.g. by
+        TableSync), standard sql double quotes by default.
+        """
+        return '%s.%s' % (self.quote_column(dataset), self.quote_column(table))
+
+    def quote_column(self, name: str) -> str:
+        """
+        Column name in the queries built by kumpel.
+        """
+        return '"%s"' % name.replace('"', '""')
+
+    def standard_sql_options(self) -> dict:
+        """
+        Keyword arguments of read_query() running the standard sql
+        queries built by kumpel and reading their current result, not a
+        cached one. None are needed by default.
+        """
+        return {}
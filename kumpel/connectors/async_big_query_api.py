@@ -0,0 +1,496 @@
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from time import perf_counter
+from typing import Awaitable, Callable, List
+
+from .abstract import SQLConnector
+from .batching import AdaptiveBatcher, MAX_REQUEST_BYTES, row_size
+from .big_query_api import BigQuery
+from .errors import BigQueryRowError
+from .instrumentation import CallEvent
+from .jobs import JobWaiter
+from .paging import read_range
+from .streaming import ConcurrentWriter
+from .tabledata import TableShard, decode_row, select_fields
+
+
+class AsyncRows:
+    """
+    Async iterator over a result read page by page. Up to read_ahead
+    pages are requested at the same time, ahead of the consumer, and
+    rows are returned in order:
+
+        async for row in bq.read_query(sql):
+            ...
+
+    Nothing is sent to BigQuery before the first row is asked for.
+    """
+
+    def __init__(self,
+                 start: Callable[[], Awaitable],
+                 fetch: Callable[[int, int], Awaitable],
+                 page_size: int = 1000,
+                 read_ahead: int = 4):
+        """
+        :param start: coroutine function returning the number of rows,
+            e.g. running a query job and waiting for it
+        :param fetch: coroutine function (offset, limit) returning a
+            list of rows
+        :param page_size: number of rows per request
+        :param read_ahead: maximum number of pages requested and not yet
+            consumed
+        """
+        if page_size < 1 or read_ahead < 1:
+            raise ValueError('page_size and read_ahead must be positive integers.')
+        self.start = start
+        self.fetch = fetch
+        self.page_size = page_size
+        self.read_ahead = read_ahead
+        self.row_count = None
+        self._next_offset = 0
+        self._pending = deque()
+        self._rows = deque()
+
+    def _schedule(self):
+        while len(self._pending) < self.read_ahead and self._next_offset < self.row_count:
+            limit = min(self.page_size, self.row_count - self._next_offset)
+            self._pending.append(asyncio.ensure_future(self.fetch(self._next_offset, limit)))
+            self._next_offset += limit
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.row_count is None:
+            self.row_count = await self.start()
+        while not self._rows:
+            self._schedule()
+            if not self._pending:
+                raise StopAsyncIteration
+            try:
+                self._rows = deque(await self._pending.popleft())
+            except BaseException:
+                self.close()
+                raise
+        return self._rows.popleft()
+
+    async def fetch_all(self) -> List[dict]:
+        """
+        :return: list of all the remaining rows
+        """
+        rows = []
+        async for row in self:
+            rows.append(row)
+        return rows
+
+    def close(self) -> None:
+        """
+        Cancel the pages requested and not consumed yet.
+        """
+        while self._pending:
+            self._pending.popleft().cancel()
+
+
+class _AsyncBatches:
+    """
+    Group rows from an iterable or an async iterable in insert requests,
+    with the same bounds as AdaptiveBatcher.batches().
+    """
+
+    def __init__(self, data, batcher: AdaptiveBatcher, encode=None, on_invalid=None):
+        self.batcher = batcher
+        self.encode = encode
+        self.on_invalid = on_invalid
+        if hasattr(data, '__aiter__'):
+            self._source = data.__aiter__()
+            self._sync = False
+        else:
+            self._source = iter(data)
+            self._sync = True
+        self._carry = None
+        self._exhausted = False
+
+    async def _next_row(self):
+        while True:
+            if self._sync:
+                try:
+                    row = next(self._source)
+                except StopIteration:
+                    return None
+            else:
+                try:
+                    row = await self._source.__anext__()
+                except StopAsyncIteration:
+                    return None
+            if self.encode is None:
+                return row
+            try:
+                return self.encode(row)
+            except BigQueryRowError as e:
+                if self.on_invalid is None:
+                    raise
+                self.on_invalid(row, e)
+
+    async def next_batch(self):
+        """
+        :return: list of rows, None when the source is exhausted
+        """
+        batch = []
+        batch_bytes = 0
+        if self._carry is not None:
+            batch.append(self._carry[0])
+            batch_bytes = self._carry[1]
+            self._carry = None
+        while not self._exhausted:
+            row = await self._next_row()
+            if row is None:
+                self._exhausted = True
+                break
+            size = row_size(row)
+            if batch and (batch_bytes + size > self.batcher.max_bytes
+                          or len(batch) >= self.batcher.target_rows):
+                self._carry = (row, size)
+                return batch
+            batch.append(row)
+            batch_bytes += size
+        return batch or None
+
+
+class AsyncBigQuery(SQLConnector):
+    """
+    asyncio version of the BigQuery connector, with the same methods as
+    coroutines. BigQuery-Python is a blocking client, so every API call
+    runs on a thread pool of max_calls threads owned by the connector;
+    everything else happens on the event loop. Job waits sleep with
+    asyncio.sleep and hold no thread, so hundreds of queries and loads
+    can be in flight while only max_calls HTTP requests are.
+
+    Reads return AsyncRows, to be used with async for. Writes accept
+    iterables and async iterables and keep at most max_pending batches
+    in memory.
+    """
+
+    def __init__(self, credentials_file=None, project_id=None, max_calls=32,
+                 connector=None, **kwargs):
+        """
+        :param credentials_file: path to the service account key file
+        :param project_id: BigQuery project
+        :param max_calls: maximum number of API calls made at the same time
+        :param connector: BigQuery (or DummyBigQuery) connector to wrap,
+            built from the other arguments when not given
+        :param kwargs: other arguments of BigQuery
+        """
+        if connector is None:
+            connector = BigQuery(credentials_file, project_id, **kwargs)
+        self.sync = connector
+        self.max_calls = max_calls
+        self._executor = ThreadPoolExecutor(max_workers=max_calls)
+
+    @property
+    def hooks(self):
+        return self.sync.hooks
+
+    @hooks.setter
+    def hooks(self, hooks):
+        self.sync.hooks = hooks
+
+    @property
+    def project_id(self):
+        return self.sync.project_id
+
+    def __repr__(self):
+        return '<AsyncBigQuery %s>' % self.project_id
+
+    __str__ = __repr__
+
+    async def _call(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    def close(self) -> None:
+        """
+        Stop the threads of the connector.
+        """
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.close()
+
+    async def test_connection(self):
+        return await self._call(self.sync.test_connection)
+
+    async def wait_for_job(self, job_id, check=None, max_delay=None, timeout=None):
+        """
+        Wait for a job without blocking the event loop, see
+        BigQuery.wait_for_job().
+
+        :param job_id: id of the BigQuery job
+        :param check: coroutine function returning (complete, result),
+            defaults to client.check_job which works for query jobs
+        :param max_delay: maximum seconds between two checks
+        :param timeout: seconds after which BigQueryJobTimeout is raised
+        :return: result returned by the last check
+        """
+        waiter = self.sync.job_waiter
+        if max_delay is not None or timeout is not None:
+            waiter = JobWaiter(
+                initial_delay=waiter.initial_delay,
+                max_delay=waiter.max_delay if max_delay is None else max_delay,
+                multiplier=waiter.multiplier,
+                timeout=waiter.timeout if timeout is None else timeout
+            )
+        if check is None:
+            # the client is looked up in the executor thread making the call
+            check = partial(self._call, self.sync.api_call, 'check_job',
+                            lambda: self.sync.client.check_job(job_id), job_id=job_id)
+        result, stats = await waiter.wait_async(job_id, check)
+        if self.hooks:
+            self.emit(CallEvent('wait_for_job',
+                                job_id=job_id,
+                                retries=stats.polls - 1,
+                                network_time=stats.poll_time,
+                                poll_time=stats.poll_time))
+        return result
+
+    # metadata
+
+    async def list_datasets(self):
+        return await self._call(self.sync.list_datasets)
+
+    async def list_tables(self, dataset):
+        return await self._call(self.sync.list_tables, dataset)
+
+    async def exists(self, dataset, table=None):
+        return await self._call(self.sync.exists, dataset, table)
+
+    async def get_table(self, dataset, table):
+        return await self._call(self.sync.get_table, dataset, table)
+
+    async def get_schema_from_table(self, dataset, table):
+        return await self._call(self.sync.get_schema_from_table, dataset, table)
+
+    def invalidate(self, dataset, table=None):
+        self.sync.invalidate(dataset, table)
+
+    # tables and datasets
+
+    async def create_table(self, dataset, table, schema, **kwargs):
+        return await self._call(self.sync.create_table, dataset, table, schema, **kwargs)
+
+    async def delete_table(self, dataset, table):
+        return await self._call(self.sync.delete_table, dataset, table)
+
+    async def drop_table(self, dataset, table):
+        return await self._call(self.sync.drop_table, dataset, table)
+
+    async def truncate_table(self, dataset, table):
+        return await self._call(self.sync.truncate_table, dataset, table)
+
+    async def create_dataset(self, dataset):
+        return await self._call(self.sync.create_dataset, dataset)
+
+    async def delete_dataset(self, dataset, delete_contents=False):
+        return await self._call(self.sync.delete_dataset, dataset, delete_contents)
+
+    # reads
+
+    def read_query(self, query, delay=5, batch_read=1000, timeout=None,
+                   read_ahead=4, use_legacy_sql=None):
+        """
+        Run a query and read its result, see BigQuery.read_query(). The
+        result cache of the wrapped connector is not used.
+
+        :param query: sql query to be ran on the bq
+        :param delay: maximum number of seconds between two job checks
+        :param batch_read: number of rows fetched per request
+        :param timeout: seconds after which BigQueryJobTimeout is raised,
+            None to wait until the query completes
+        :param read_ahead: maximum number of pages downloaded and not yet
+            consumed
+        :param use_legacy_sql: False for standard SQL, None for the API
+            default (legacy SQL)
+        :return: AsyncRows
+        """
+        job = {}
+
+        async def start():
+            job_id, _results = await self._call(
+                self.sync.api_call, 'query',
+                lambda: self.sync.client.query(query, use_legacy_sql=use_legacy_sql))
+            logging.info('BQ: running job %s ...' % job_id)
+            job['id'] = job_id
+            return await self.wait_for_job(job_id, max_delay=delay, timeout=timeout)
+
+        def fetch_page(offset, limit):
+            return self.sync.api_call('get_query_rows',
+                                      lambda: self.sync.client.get_query_rows(
+                                          job['id'], offset=offset, limit=limit),
+                                      count_rows=True, job_id=job['id'])
+
+        def fetch(offset, limit):
+            return self._call(read_range, fetch_page, offset, limit)
+
+        return AsyncRows(start, fetch, page_size=batch_read, read_ahead=read_ahead)
+
+    def read_data(self, dataset, table, batch=None, fields=None, read_ahead=4):
+        """
+        Read all records of a table, see BigQuery.read_data().
+
+        :param dataset: BQ dataset name
+        :param table: BQ table name
+        :param batch: number of rows per request, None to read the table
+            through a query job
+        :param fields: list of column names to read, None for all columns
+        :param read_ahead: maximum number of ranges downloaded and not yet
+            consumed
+        :return: AsyncRows
+        """
+        if not batch:
+            columns = ', '.join(fields) if fields else '*'
+            return self.read_query('SELECT %s FROM [%s.%s]' % (columns, dataset, table),
+                                   read_ahead=read_ahead)
+        state = {}
+
+        async def start():
+            resource = await self.get_table(dataset, table)
+            shard = TableShard(dataset, table, 0, int(resource.get('numRows', 0)), fields)
+            state['schema'] = select_fields(resource['schema']['fields'], fields)
+            state['fetch'] = self.sync._table_data_fetcher(shard)
+            return shard.stop
+
+        def fetch_page(offset, limit):
+            return [decode_row(row, state['schema']) for row in state['fetch'](offset, limit)]
+
+        def fetch(offset, limit):
+            return self._call(read_range, fetch_page, offset, limit)
+
+        return AsyncRows(start, fetch, page_size=batch, read_ahead=read_ahead)
+
+    def read_table(self, dataset, table, **kwargs):
+        """
+        Alias of read_data, see SQLConnector.
+        """
+        return self.read_data(dataset, table, **kwargs)
+
+    # writes
+
+    async def write_to_table(self, dataset, table, data, primary_key=None,
+                             batch_write=10000, workers=4, max_pending=None,
+                             max_bytes=MAX_REQUEST_BYTES, target_latency=None,
+                             schema=None, unknown='drop', on_invalid=None):
+        """
+        Streaming insert, see BigQuery.write_to_table().
+
+        :return: number of rows sent to BigQuery
+        """
+        results = await self.stream_to_table(dataset=dataset,
+                                             table=table,
+                                             data=data,
+                                             primary_key=primary_key,
+                                             batch_write=batch_write,
+                                             workers=workers,
+                                             max_pending=max_pending,
+                                             max_bytes=max_bytes,
+                                             target_latency=target_latency,
+                                             schema=schema,
+                                             unknown=unknown,
+                                             on_invalid=on_invalid)
+        return sum(result.rows for result in results)
+
+    async def stream_to_table(self, dataset, table, data, primary_key=None,
+                              batch_write=10000, workers=4, max_pending=None,
+                              max_bytes=MAX_REQUEST_BYTES, target_latency=None,
+                              schema=None, unknown='drop', on_invalid=None):
+        """
+        Streaming insert with several insertAll requests in flight, see
+        BigQuery.stream_to_table(). Rows are read from data, an iterable
+        or an async iterable, only when fewer than max_pending batches
+        are waiting for BigQuery.
+
+        :return: list of BatchResult (index, rows, failed, latency)
+        """
+        if workers < 1:
+            raise ValueError('workers must be a positive integer.')
+        encode = None
+        invalid = []
+        if schema is not None:
+            if on_invalid is None:
+                def on_invalid(row, error):
+                    invalid.append(row)
+                    logging.warning('BQ: invalid row for %s.%s skipped, %s: %s'
+                                    % (dataset, table, error.expression, error.message))
+            encoder = await self._call(self.sync.row_encoder, dataset, table, schema, unknown)
+            encode = encoder.encode
+
+        batcher = AdaptiveBatcher(max_bytes=max_bytes,
+                                  max_rows=batch_write,
+                                  target_latency=target_latency)
+        writer = ConcurrentWriter(self.sync._row_pusher(dataset, table, primary_key),
+                                  batcher=batcher)
+        batches = _AsyncBatches(data, batcher, encode, on_invalid)
+        slots = asyncio.Semaphore(max(max_pending or 2 * workers, workers))
+        running = asyncio.Semaphore(workers)
+        failed = []
+
+        async def send(index, batch, submitted):
+            try:
+                async with running:
+                    return await self._call(writer.send, index, batch, submitted)
+            except BaseException:
+                failed.append(index)
+                raise
+            finally:
+                slots.release()
+
+        tasks = []
+        try:
+            while not failed:
+                await slots.acquire()
+                batch = await batches.next_batch()
+                if batch is None:
+                    slots.release()
+                    break
+                tasks.append(asyncio.ensure_future(send(len(tasks), batch, perf_counter())))
+            results = list(await asyncio.gather(*tasks))
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+        finally:
+            self.invalidate(dataset, table)
+        logging.info('BQ: %i rows in %i batches sent to %s.%s.'
+                     % (sum(r.rows for r in results), len(results), dataset, table))
+        if invalid:
+            logging.warning('BQ: %i invalid rows not sent to %s.%s.'
+                            % (len(invalid), dataset, table))
+        return results
+
+    async def write_query_to_table(self, query, dataset, table, write_disposition=None,
+                                   use_legacy_sql=True, timeout=None):
+        """
+        Run a query and save its result in a table, see
+        BigQuery.write_query_to_table().
+
+        :return: number of rows in the target table
+        """
+        res = await self._call(self.sync.api_call, 'write_to_table',
+                               lambda: self.sync.client.write_to_table(
+                                   query=query,
+                                   dataset=dataset,
+                                   table=table,
+                                   write_disposition=write_disposition,
+                                   allow_large_results=True,
+                                   use_legacy_sql=use_legacy_sql),
+                               dataset=dataset, table=table)
+        job_id = res['jobReference']['jobId']
+        logging.info('BQ: write query to table ...')
+        try:
+            return await self.wait_for_job(job_id, timeout=timeout)
+        finally:
+            self.invalidate(dataset, table)
@@ -0,0 +1,169 @@
+import json
+import threading
+from typing import Callable, Iterable, Iterator, List
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# insertAll limits, see https://cloud.google.com/bigquery/quotas#streaming_inserts
+MAX_REQUEST_BYTES = 10 * 1024 * 1024
+MAX_REQUEST_ROWS = 50000
+
+# recommended request size, used as starting point for adaptive batching
+INITIAL_ADAPTIVE_ROWS = 500
+
+# bytes added by the client around each row: {"json": ..., "insertId": "..."}
+ROW_OVERHEAD_BYTES = 64
+
+# the HTTP status is read from the error itself, a bare '413' in a message
+# may be a row index, a job id or a byte count
+REJECTION_HINTS = (
+    'payload size',
+    'too large',
+    'entity too large',
+    'too many rows',
+)
+
+
+def dumps(row: dict) -> bytes:
+    """
+    Serialize a row to compact json, with orjson when it is installed.
+    Values json can not represent are serialized with str().
+
+    :param row: dict
+    :return: utf-8 encoded json
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(row)
+        except TypeError:
+            pass
+    return json.dumps(row, default=str, separators=(',', ':')).encode('utf-8')
+
+
+def row_size(row: dict) -> int:
+    """
+    Size in bytes of a row once serialized in an insertAll request.
+
+    :param row: dict to be inserted
+    :return: integer, number of bytes
+    """
+    return len(dumps(row)) + ROW_OVERHEAD_BYTES
+
+
+def is_payload_rejection(outcome) -> bool:
+    """
+    Check if a push_rows response or the exception it raised means that
+    the request was refused because of its size or number of rows, in
+    which case sending smaller requests will succeed.
+
+    :param outcome: value returned or exception raised by client.push_rows
+    :return: True if the request was rejected as too large
+    """
+    if isinstance(outcome, Exception):
+        status = getattr(getattr(outcome, 'resp', None), 'status', None)
+        if status is not None and int(status) == 413:
+            return True
+        text = str(outcome)
+    elif isinstance(outcome, dict):
+        errors = outcome.get('insertErrors') or []
+        if any(error.get('index') is not None for error in errors):
+            # errors on single rows, the request itself was accepted
+            return False
+        text = str(errors)
+    else:
+        return False
+    text = text.lower()
+    return any(hint in text for hint in REJECTION_HINTS)
+
+
+class AdaptiveBatcher:
+    """
+    Group rows in insertAll requests bounded both in bytes and in rows.
+
+    Without a target_latency every request holds up to max_rows rows.
+    With a target_latency the number of rows per request starts at 500
+    and is adjusted after each round trip: it grows
+    while requests return faster than the target and shrinks in
+    proportion when they are slower, so that every request carries as
+    much data as the connection allows.
+    """
+
+    def __init__(self,
+                 max_bytes: int = MAX_REQUEST_BYTES,
+                 max_rows: int = MAX_REQUEST_ROWS,
+                 target_latency: float = None,
+                 min_rows: int = 1):
+        """
+        :param max_bytes: maximum size of a request in bytes
+        :param max_rows: maximum number of rows in a request
+        :param target_latency: desired duration of a round trip in
+            seconds, None to keep the batch size fixed at max_rows
+        :param min_rows: lower bound for the adaptive batch size
+        """
+        if max_bytes < 1 or max_rows < 1:
+            raise ValueError('max_bytes and max_rows must be positive integers.')
+        self.max_bytes = min(max_bytes, MAX_REQUEST_BYTES)
+        self.max_rows = min(max_rows, MAX_REQUEST_ROWS)
+        self.min_rows = max(1, min(min_rows, self.max_rows))
+        self.target_latency = target_latency
+        if target_latency is None:
+            self.target_rows = self.max_rows
+        else:
+            # start small and let the observed latency grow the batches
+            self.target_rows = max(self.min_rows, min(self.max_rows, INITIAL_ADAPTIVE_ROWS))
+        self._lock = threading.Lock()
+
+    def batches(self, data: Iterable[dict],
+                size: Callable[[dict], int] = row_size) -> Iterator[List[dict]]:
+        """
+        Split a stream of rows in requests. A single row larger than
+        max_bytes is sent alone and left for BigQuery to reject.
+
+        :param data: iterable of dicts
+        :param size: callable returning the size in bytes of an item of
+            data in a request
+        :return: generator of lists of dicts
+        """
+        batch = []
+        batch_bytes = 0
+        for row in data:
+            row_bytes = size(row)
+            if batch and (batch_bytes + row_bytes > self.max_bytes
+                          or len(batch) >= self.target_rows):
+                yield batch
+                batch = []
+                batch_bytes = 0
+            batch.append(row)
+            batch_bytes += row_bytes
+        if batch:
+            yield batch
+
+    def observe(self, rows: int, latency: float) -> None:
+        """
+        Feed back the duration of a request to tune the batch size.
+
+        :param rows: number of rows in the request
+        :param latency: seconds the request took
+        """
+        if not self.target_latency or rows < self.target_rows // 2:
+            # adaptive sizing disabled or a trailing, partially filled batch
+            return
+        with self._lock:
+            if latency <= self.target_latency:
+                target = self.target_rows * 2
+            else:
+                target = int(self.target_rows * self.target_latency / latency)
+            self.target_rows = max(self.min_rows, min(self.max_rows, target))
+
+    def shrink(self, rows: int) -> None:
+        """
+        Called when a request of the given number of rows was rejected as
+        too large, so following requests are built smaller.
+
+        :param rows: number of rows in the rejected request
+        """
+        with self._lock:
+            self.target_rows = max(self.min_rows, min(self.target_rows, rows // 2))
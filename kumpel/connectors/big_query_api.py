@@ -1,12 +1,57 @@
 import csv
 import logging
-from time import sleep
+import os
+import shutil
+import tempfile
+import time
+import uuid
 from abc import abstractmethod
+from functools import partial
 from typing import Optional, List, Dict
 
-import bigquery
-
 from .abstract import SQLConnector
+from .errors import (
+    BigQueryError,
+    BigQueryJobError,
+    BigQuerySchemaParsingError,
+    SchemaFileNotFound
+)
+from .batching import AdaptiveBatcher, MAX_REQUEST_BYTES, dumps, is_payload_rejection, row_size
+from .cache import QueryResultCache, cache_key, tables_in_query
+from .catalog import MetadataCatalog
+from .clients import ClientPool, create_client
+from .columnar import build_batch, decode_columns
+from .emulator import LocalBigQueryClient
+from .export import (
+    EXPORT_FORMATS,
+    ExportJob,
+    GCSStorage,
+    LocalStorage,
+    ShardReader,
+    Storage,
+    download_files,
+)
+from .flight import SingleFlight
+from .instrumentation import CallEvent
+from .jobs import JobWaiter
+from .materialized import ColumnarWriter, MaterializedResult
+from .journal import LoadJournal, pending_rows
+from .paging import PagePrefetcher
+from .partitions import (
+    decorate,
+    partition_batches,
+    partition_filter,
+    partition_id,
+    partition_range
+)
+from .profiling import TableProfile, build_profile, profile_queries
+from .records import format_rows
+from .scheduler import JobScheduler, QueryStep, dependencies
+from .schema import Schema
+from .streaming import ConcurrentWriter, request_failure
+from .throttling import Throttle
+from .tabledata import TableShard, decode_cell, decode_row, select_fields, split_in_shards, to_fields
+from .upsert import UpsertResult, merge_query
 
 COLUMN_TYPES = [
     'STRING',
@@ -22,66 +67,212 @@ COLUMN_TYPES = [
     'DATETIME'
 ]
 
+# options of write_to_table only used by streaming inserts, with their defaults
+STREAMING_DEFAULTS = {
+    'primary_key': None,
+    'batch_write': 10000,
+    'workers': 1,
+    'max_pending': None,
+    'max_bytes': MAX_REQUEST_BYTES,
+    'target_latency': None,
+    'checkpoint': None,
+    'load_id': None,
+}
 
-class BigQueryError(Exception):
-    """
-    Abstract Exception for BigQuery.
+
+class BigQuery(SQLConnector):
     """
+    Python object for interacting with Google's BiqQuery
+    database. The class defined here is just a simplification
+    of the BigQuery lib from here:
 
-    def __init__(self, expression, message):
-        self.expression = expression
-        self.message = message
+     https://github.com/tylertreat/BigQuery-Python
+    """
 
+    _client = None
 
-class BigQuerySchemaParsingError(BigQueryError):
-    pass
+    def __init__(self, credentials_file, project_id, readonly=True,
+                 swallow_results=True, cache: QueryResultCache = None,
+                 metadata_ttl=300, client=None, client_per_thread=True,
+                 single_flight: SingleFlight = None, throttle: Throttle = None,
+                 storage: Storage = None):
+        """
+        :param credentials_file: path to the service account json key
+        :param project_id: BigQuery project
+        :param readonly: True for a client without write permissions
+        :param swallow_results: False to get the raw API responses from
+            the client instead of True/False, required to tell apart
+            requests rejected because of their size from other errors
+        :param cache: optional QueryResultCache used by read_query
+        :param metadata_ttl: seconds datasets, tables and schemas are kept
+            in memory, 0 to always ask BigQuery
+        :param client: already built client to use instead of creating one,
+            e.g. a LocalBigQueryClient, shared by all threads
+        :param client_per_thread: False to share a single client between
+            threads, see ClientPool
+        :param single_flight: optional SingleFlight, so that read_query
+            calls running a query already running in another thread read
+            the result of its job instead of submitting a new one
+        :param throttle: optional Throttle every client call goes through,
+            pacing them and retrying the idempotent ones, shared by all
+            threads and possibly by several connectors
+        :param storage: Storage exports are read from, defaults to Google
+            Cloud Storage with the same credentials
+        """
+        self.project_id = project_id
+        self.credentials_file = credentials_file
+        self._storage = storage
+        self.throttle = throttle
+        self.result_cache = cache
+        self.single_flight = single_flight
+        self.catalog = MetadataCatalog(ttl=metadata_ttl)
+        # clients are only built when a call is made, see client
+        self.clients = ClientPool(partial(create_client,
+                                          credentials_file=credentials_file,
+                                          project_id=project_id,
+                                          readonly=readonly,
+                                          swallow_results=swallow_results),
+                                  per_thread=client_per_thread)
+        if client is not None:
+            self.client = client
+        self.job_waiter = JobWaiter()
+        self.last_job_stats = None
+        self._schemas = {}
+        self._profiles = {}
+
+    @property
+    def client(self):
+        """
+        BigQuery-Python client of the calling thread, created on first use.
+        """
+        client = self._client
+        if client is None:
+            return self.clients.get()
+        return client
 
+    @client.setter
+    def client(self, client):
+        self._client = client
 
-class SchemaFileNotFound(FileNotFoundError):
-    pass
+    @property
+    def storage(self):
+        """
+        Storage of the exports, GCSStorage built on first use by default.
+        """
+        if self._storage is None:
+            self._storage = GCSStorage(self.credentials_file, self.project_id)
+        return self._storage
 
+    def wait_for_job(self, job_id, check=None, max_delay=None, timeout=None):
+        """
+        Block until a job is complete. The job status is checked right away
+        and then with exponential backoff, see JobWaiter. Timings of the
+        wait are kept in self.last_job_stats.
+
+        :param job_id: id of the BigQuery job
+        :param check: callable returning (complete, result), defaults to
+            client.check_job which works for query jobs
+        :param max_delay: maximum seconds between two checks, defaults to
+            the one of self.job_waiter
+        :param timeout: seconds after which BigQueryJobTimeout is raised,
+            defaults to the one of self.job_waiter
+        :return: result returned by the last check
+        """
+        waiter = self.job_waiter
+        if max_delay is not None or timeout is not None:
+            waiter = JobWaiter(
+                initial_delay=waiter.initial_delay,
+                max_delay=waiter.max_delay if max_delay is None else max_delay,
+                multiplier=waiter.multiplier,
+                timeout=waiter.timeout if timeout is None else timeout
+            )
+        if check is None:
+            check = lambda: self.api_call('check_job',
+                                          lambda: self.client.check_job(job_id),
+                                          job_id=job_id)
+        result, stats = waiter.wait(job_id, check)
+        self.last_job_stats = stats
+        if self.hooks:
+            self.emit(CallEvent('wait_for_job',
+                                job_id=job_id,
+                                retries=stats.polls - 1,
+                                network_time=stats.poll_time,
+                                poll_time=stats.poll_time))
+        return result
+
+    def check_job_state(self, job_id):
+        """
+        Check the state of any kind of job (query, load, extract, copy).
+        Raise BigQueryJobError if the job finished with an error.
 
-class DummyBigQuery(SQLConnector):
-    """
-    Abstract class for a BigQuery connector. Should
-    serve as blueprint for creating the connector
-    and its dummy counterpart.
-    """
+        :param job_id: id of the BigQuery job
+        :return: tuple (complete, job resource)
+        """
+        job = self.api_call('jobs.get', self.client.bigquery.jobs().get(
+            projectId=self.client.project_id,
+            jobId=job_id
+        ).execute, job_id=job_id)
+        status = job.get('status', {})
+        if status.get('state') != 'DONE':
+            return False, job
+        if status.get('errorResult'):
+            raise BigQueryJobError(
+                expression='Job %s failed.' % job_id,
+                message=str(status['errorResult'])
+            )
+        return True, job
 
-    def read_query(self, file_path):
-        for row in self.read_data(file_path):
-            yield row
+    def get_table(self, dataset, table):
+        """
+        Table resource (schema, number of rows, partitioning ...) as
+        returned by the API, empty dict if the table does not exist.
 
-    def read_data(self, file_path):
-        with open(file_path) as fin:
-            csv_reader = csv.DictReader(fin)
-            for row in csv_reader:
-                yield row
+        :param dataset: BQ dataset name
+        :param table: BQ table name
+        :return: dict
+        """
+        return self.api_call('get_table',
+                             lambda: self.client.get_table(dataset, table),
+                             dataset=dataset, table=table)
 
-    def write_to_table(self, data):
-        for row in data:
-            continue
+    def invalidate(self, dataset, table=None):
+        """
+        Forget everything cached about a table, or about a whole dataset
+        when table is None. Called by the methods changing tables.
 
-    def write_query_to_table(self, data):
-        for row in data:
-            continue
+        :param dataset: dataset name
+        :param table: table name
+        """
+        self.catalog.invalidate(dataset, table)
+        if self.result_cache is not None:
+            self.result_cache.invalidate(dataset, table)
+        for key in list(self._profiles):
+            if key[0] == dataset and (table is None or key[1] == table):
+                self._profiles.pop(key, None)
+
+    def refresh(self):
+        """
+        Forget all cached metadata (datasets, tables and schemas).
+        """
+        self.catalog.refresh()
 
+    def __repr__(self):
+        return '<%s project=%s>' % (self.__class__.__name__, self.project_id)
 
-class BigQuery():
-    """ 
-    Python object for interacting with Google's BiqQuery
-    database. The class defined here is just a simplification
-    of the BigQuery lib from here:
+    __str__ = __repr__
 
-     https://github.com/tylertreat/BigQuery-Python
-    """
+    def test_connection(self):
+        """
+        Check that the project can be reached with the current credentials.
 
-    def __init__(self, credentials_file, project_id, readonly=True):
-        self.client = bigquery.get_client(
-            project_id=project_id,
-            json_key_file=credentials_file,
-            readonly=readonly
-        )
+        :return: True if BigQuery answered, False otherwise
+        """
+        try:
+            self.api_call('get_datasets', self.client.get_datasets)
+        except Exception as e:
+            logging.error('BQ: connection test failed.\n%s' % e)
+            return False
+        return True
 
     @staticmethod
     def parse_schema_from_string(schema_string):
@@ -134,7 +325,7 @@ class BigQuery():
         """
         try:
             with open(file_path) as fin:
-                return self.parse_string_schema(fin.read())
+                return self.parse_schema_from_string(fin.read().strip())
         except FileNotFoundError:
             raise SchemaFileNotFound('%s not found.' % file_path)
 
@@ -149,7 +340,29 @@ class BigQuery():
         :param table: BQ target table for which the schema is extracted
         :return: dictionary with the target table's column names and data types
         """
-        return self.client.get_table_schema(dataset=dataset, table=table)
+        return self.catalog.get(
+            ('schema', dataset, table),
+            lambda: self.api_call(
+                'get_table_schema',
+                lambda: self.client.get_table_schema(dataset=dataset, table=table),
+                dataset=dataset, table=table
+            )
+        )
+
+    def table_schema(self, dataset: str, table: str) -> Schema:
+        """
+        Schema of a table as a Schema object, whose compiled row encoders
+        are reused as long as the table schema does not change.
+
+        :param dataset: BQ dataset
+        :param table: BQ table
+        :return: Schema
+        """
+        fields = self.get_schema_from_table(dataset, table)
+        schema = self._schemas.get((dataset, table))
+        if schema is None or schema.fields != fields:
+            schema = self._schemas[(dataset, table)] = Schema(fields)
+        return schema
 
     def dump_schema(self, schema, file_path, dump_type='txt'):
         """
@@ -177,22 +390,85 @@ class BigQuery():
         else:
             return None
 
-    def profile_table(self, dataset: str, table: str) -> None:
-        profile_col_sql = "SELECT {col}, count(1) as c FROM {dataset}.{table} GROUP BY 1;"
-        schema = self.get_schema_from_table(dataset=dataset, table=table)
-        for col, type in schema:
-            pass
+    def profile_table(self, dataset: str, table: str, columns: List[str] = None,
+                      top_k: int = 5, columns_per_query: int = 250,
+                      max_running: int = 10, timeout=None) -> TableProfile:
+        """
+        Statistics of every column of a table: null count, approximate
+        distinct count, min, max, most frequent values and, for strings
+        and bytes, value lengths.
+
+        All columns are profiled by the same scan of the table; wide
+        tables are split in queries of columns_per_query columns which
+        run at the same time. Profiles are kept for as long as the
+        lastModifiedTime of the table does not change.
 
+        :param dataset: BQ dataset name
+        :param table: BQ table name
+        :param columns: column names to profile, None for all columns
+        :param top_k: number of most frequent values to report, 0 for none
+        :param columns_per_query: maximum number of columns per query
+        :param max_running: maximum number of queries running at once
+        :param timeout: seconds after which BigQueryJobTimeout is raised
+        :return: TableProfile
+        """
+        resource = self.get_table(dataset, table)
+        if not resource:
+            raise BigQueryError(expression='Table %s.%s not found.' % (dataset, table),
+                                message='Can not profile a table which does not exist.')
+        fields = select_fields(resource['schema']['fields'], columns)
+        last_modified = resource.get('lastModifiedTime')
+        key = (dataset, table, tuple(field['name'] for field in fields), top_k)
+        profile = self._profiles.get(key)
+        if profile is not None and last_modified is not None \
+                and profile.last_modified == last_modified:
+            logging.info('BQ: profile of %s.%s read from memory.' % (dataset, table))
+            return profile
+
+        queries = profile_queries(dataset, table, fields, top_k, columns_per_query)
+        steps = [QueryStep(sql, use_legacy_sql=False, name='profile %i' % index)
+                 for index, (sql, _indexes) in enumerate(queries)]
+        positions = {id(step): index for index, step in enumerate(steps)}
+        results = []
+        for step, rows in self.run_queries(steps, max_running=max_running,
+                                           timeout=timeout, cache_ttl=0):
+            results.append((queries[positions[id(step)]][1], next(iter(rows))))
+        profile = build_profile(dataset, table, fields, results, last_modified)
+        if last_modified is not None:
+            self._profiles[key] = profile
+        return profile
 
     def list_datasets(self):
         """ List of data sets in this project. Used by other methods as well.
 
         :return: <list> list of strings
         """
-        l = []
-        for dataset in self.client.get_datasets():
-            l.append(dataset[u'datasetReference'][u'datasetId'])
-        return l
+        return sorted(self._datasets())
+
+    def _datasets(self):
+        def load():
+            return frozenset(dataset[u'datasetReference'][u'datasetId']
+                             for dataset in self.api_call('get_datasets',
+                                                          self.client.get_datasets))
+        return self.catalog.get(('datasets',), load)
+
+    def list_tables(self, dataset):
+        """ List of tables in a dataset of this project.
+
+        :param dataset: <string> Name of the dataset
+        :return: <list> list of strings, empty if the dataset does not exist
+        """
+        return sorted(self._tables(dataset))
+
+    def _tables(self, dataset):
+        if dataset not in self._datasets():
+            return frozenset()
+        return self.catalog.get(
+            ('tables', dataset),
+            lambda: frozenset(self.api_call('get_all_tables',
+                                            lambda: self.client.get_all_tables(dataset),
+                                            dataset=dataset))
+        )
 
     def exists(self, dataset, table=None):
         """
@@ -204,12 +480,9 @@ class BigQuery():
         :return: True if table exists False otherwise
         """
         if table:
-            return self.client.check_table(dataset=dataset, table=table)
+            return table in self._tables(dataset)
         else:
-            if dataset in self.list_datasets():
-                return True
-            else:
-                return False
+            return dataset in self._datasets()
 
     def create_table(self,
                      dataset: str,
@@ -233,13 +506,22 @@ class BigQuery():
             return False
         else:
             try:
-                self.client.create_table(dataset=dataset,
-                                         table=table,
-                                         schema=schema,
-                                         time_partitioning=time_partitioning)
+                created = self.api_call('create_table',
+                                        lambda: self.client.create_table(
+                                            dataset=dataset,
+                                            table=table,
+                                            schema=to_fields(schema),
+                                            time_partitioning=time_partitioning),
+                                        dataset=dataset, table=table)
             except Exception as e:
                 logging.error('BQ: Error while creating table %s. %s\n%s' % (dataset, table, e))
+                return False
+            if not created:
+                # the client logged the error and swallowed it
+                logging.error('BQ: Table %s.%s was not created.' % (dataset, table))
+                return False
             else:
+                self.invalidate(dataset, table)
                 logging.info('BQ: Table %s.%s was created!' % (dataset, table))
                 return True
 
@@ -253,12 +535,41 @@ class BigQuery():
         :return: True if table was deleted False if table does not exits
         """
         if self.exists(dataset, table):
-            self.client.delete_table(dataset, table)
+            deleted = self.api_call('delete_table',
+                                    lambda: self.client.delete_table(dataset, table),
+                                    dataset=dataset, table=table)
+            self.invalidate(dataset, table)
+            if not deleted:
+                logging.error('BQ: Table %s.%s was not deleted.' % (dataset, table))
+                return False
             return True
         else:
             logging.info('BQ: %s.%s does no exists.' % (dataset, table))
             return False
 
+    def drop_table(self, dataset, table):
+        """
+        Same as delete_table().
+        """
+        return self.delete_table(dataset, table)
+
+    def truncate_table(self, dataset, table):
+        """
+        Remove all rows of a table. BigQuery can not delete records, so
+        the table is dropped and created again with the same schema.
+
+        :param dataset: Target dataset
+        :param table: Table to be emptied
+        :return: True if the table was truncated False if table does not exits
+        """
+        if not self.exists(dataset, table):
+            logging.info('BQ: %s.%s does no exists.' % (dataset, table))
+            return False
+        schema = self.get_schema_from_table(dataset, table)
+        partitioning = 'timePartitioning' in self.get_table(dataset, table)
+        self.delete_table(dataset, table)
+        return self.create_table(dataset, table, schema, time_partitioning=partitioning)
+
     def create_dataset(self, dataset):
         """ Create a new empty dataset in current BQ project.
 
@@ -270,11 +581,17 @@ class BigQuery():
             return False
         else:
             try:
-                self.client.create_dataset(dataset_id=dataset)
+                created = self.api_call('create_dataset',
+                                        lambda: self.client.create_dataset(dataset_id=dataset),
+                                        dataset=dataset)
+                if not created:
+                    raise BigQueryError(expression='Dataset %s was not created.' % dataset,
+                                        message='BigQuery rejected the request.')
             except Exception as e:
                 logging.error('Error while creating dataset %s\n%s' % (dataset, e))
                 raise e
             else:
+                self.invalidate(dataset)
                 logging.info('Dataset %s was created!' % dataset)
                 return True
 
@@ -290,105 +607,649 @@ class BigQuery():
             logging.info('BQ: Dataset %s does not exists!' % dataset)
             return False
         try:
-            self.client.delete_dataset(dataset, delete_contents)
+            deleted = self.api_call('delete_dataset',
+                                    lambda: self.client.delete_dataset(dataset, delete_contents),
+                                    dataset=dataset)
+            if not deleted:
+                raise BigQueryError(expression='Dataset %s was not deleted.' % dataset,
+                                    message='BigQuery rejected the request.')
         except Exception as e:
             logging.error('BQ: Error while trying to delete dataset %s\n%s' % (dataset, e))
             raise e
         else:
+            self.invalidate(dataset)
             logging.info('Dataset %s has been deleted!' % dataset)
             return True
 
-    def export_to_storage(self, destination_uris, dataset, table, **kwargs):
+    def export_to_storage(self, destination_uris, dataset, table, compression=None,
+                          destination_format='CSV', print_header=True, field_delimiter=',',
+                          delay=5, timeout=None, job=None):
         """
-        IN PROGRESS. NOT REALLY NEEDED unless there is a very large amount of data.
-
-        :param destination_uris:
-        :param dataset:
-        :param table:
-        :return:
+        Export a table (or a table$YYYYMMDD partition) to storage with an
+        extract job, the fast way out of BigQuery for large tables. A
+        destination uri with a '*' wildcard lets BigQuery write the table
+        in many files, written in parallel; the files are then read with
+        read_export(), read_export_batches() or download_export().
+
+        :param destination_uris: gs://bucket/path uri or list of uris,
+            e.g. 'gs://bucket/export/events-*.csv.gz'
+        :param dataset: BQ dataset name
+        :param table: BQ table name
+        :param compression: 'GZIP' or None; 'DEFLATE' or 'SNAPPY' for AVRO
+        :param destination_format: 'CSV', 'NEWLINE_DELIMITED_JSON' or 'AVRO'
+        :param print_header: False to write CSV files without header line
+        :param field_delimiter: delimiter of CSV files
+        :param delay: maximum number of seconds between two job checks
+        :param timeout: seconds after which BigQueryJobTimeout is raised,
+            None to wait until the export completes
+        :param job: optional id of the job
+        :return: ExportJob
         """
-        job = kwargs.pop('job', None)
-        compression = kwargs.pop('job', None)
-        destination_format = kwargs.pop('job', 'CSV')
-        print_header = kwargs.pop('job', True)
-        field_delimiter = kwargs.pop('job', ';')
-
-        job = self.client.export_data_to_uris(
+        if isinstance(destination_uris, str):
+            destination_uris = [destination_uris]
+        if destination_format not in EXPORT_FORMATS:
+            raise ValueError('destination_format must be one of: %s.' % ', '.join(EXPORT_FORMATS))
+        resource = self.get_table(dataset, table)
+        if not resource:
+            raise BigQueryError(expression='Table %s.%s not found.' % (dataset, table),
+                                message='Can not export a table which does not exist.')
+        start = time.monotonic()
+        response = self.api_call('export_data_to_uris', lambda: self.client.export_data_to_uris(
             destination_uris, dataset, table, job, compression,
             destination_format, print_header, field_delimiter
-        )
-        try:
-            _ = self.client.wait_for_job(job, timeout=300)
-        except Exception as e:
-            logging.error('Error while exporting BQ dataset to storage:\n%s\n\n' % e)
-            logging.info('Hint: maybe timeout parameter in wait_for_job needs to be increased.')
-            return False
-        logging.info('Export successful.')
-        return True
+        ), dataset=dataset, table=table)
+        job_id = response['jobReference']['jobId']
+        self.wait_for_job(job_id,
+                          check=lambda: self.check_job_state(job_id),
+                          max_delay=delay,
+                          timeout=timeout)
+        files = []
+        for uri in destination_uris:
+            files.extend(self.storage.list(uri))
+        logging.info('BQ: %s.%s exported to %i files.' % (dataset, table, len(files)))
+        return ExportJob(job_id=job_id,
+                         uris=destination_uris,
+                         files=files,
+                         fields=resource['schema']['fields'],
+                         destination_format=destination_format,
+                         compression=compression,
+                         field_delimiter=field_delimiter,
+                         print_header=print_header,
+                         elapsed=time.monotonic() - start)
+
+    def download_export(self, export, directory, workers=4):
+        """
+        Download the files of an export into a local directory, several
+        at the same time.
+
+        :param export: ExportJob returned by export_to_storage()
+        :param directory: local directory, created if it does not exist
+        :param workers: number of files downloaded at the same time
+        :return: list of local paths, in the order of export.files
+        """
+        return download_files(self.storage, export.files, directory, workers)
+
+    def read_export(self, export, workers=4, read_ahead=2, batch_size=10000,
+                    row_format='dict'):
+        """
+        Read the rows of an export straight from storage: files are
+        downloaded and decoded by a pool of workers, ahead of the
+        consumer, and the rows yielded in the order of the files, with
+        the same types as read_data(). Nulls and empty strings can not
+        be told apart in CSV files, both are read as None.
+
+        :param export: ExportJob returned by export_to_storage()
+        :param workers: number of files read at the same time
+        :param read_ahead: maximum number of decoded batches per file
+            not yet consumed
+        :param batch_size: number of rows decoded at once by a worker
+        :param row_format: 'dict', 'record' or 'tuple', see read_query()
+        :return: generator of rows
+        """
+        fields = export.fields
 
-    def read_query(self, query, delay=5, batch_read=1000):
+        def decode(chunk):
+            return [{field['name']: decode_cell(value, field)
+                     for value, field in zip(cells, fields)} for cells in chunk]
+
+        reader = ShardReader(self.storage, export, workers, read_ahead, batch_size)
+        rows = (row for chunk in reader.chunks(decode) for row in chunk)
+        return format_rows(rows, row_format)
+
+    def read_export_batches(self, export, workers=4, read_ahead=2, batch_size=10000):
+        """
+        Read an export as batches of columns, see read_export() and
+        read_query_batches(). Requires numpy.
+
+        :param export: ExportJob returned by export_to_storage()
+        :param workers: number of files read at the same time
+        :param read_ahead: maximum number of decoded batches per file
+            not yet consumed
+        :param batch_size: maximum number of rows per batch
+        :return: generator of ColumnBatch
+        """
+        fields = export.fields
+
+        def decode(chunk):
+            return build_batch([list(column) for column in zip(*chunk)], fields)
+
+        reader = ShardReader(self.storage, export, workers, read_ahead, batch_size)
+        return reader.chunks(decode)
+
+    def quote_table(self, dataset, table):
+        return '`%s.%s`' % (dataset, table)
+
+    def quote_column(self, name):
+        return '`%s`' % name
+
+    def standard_sql_options(self):
+        return {'use_legacy_sql': False, 'cache_ttl': 0}
+
+    def read_query(self, query, delay=5, batch_read=1000, timeout=None,
+                   workers=2, read_ahead=None, use_legacy_sql=None,
+                   cache_ttl=None, row_format='dict'):
         """
         Run a query on BQ and return the result as a list of dicts.
-        After the request is sent to BQ, script halts for 60 sec
-        to give BQ time to process the request.
+        The job status is checked right away and then with exponential
+        backoff, with at most delay seconds between two checks.
+
+        The reading begins once the query has been completed. Pages of
+        batch_read rows are downloaded by a pool of workers, ahead of
+        the consumer, and yielded in order.
 
-        After that, the reading begins only if the query has been
-        completed, otherwise an error msg will be returned.
+        When the connector has a result cache, a valid cached result is
+        returned without running the query, otherwise the result is
+        cached while being read.
 
-        :param batch_read:
-        :param delay:
+        :param batch_read: number of rows fetched per request
+        :param delay: maximum number of seconds between two job checks
         :param query: sql query to be ran on the bq
+        :param timeout: seconds after which BigQueryJobTimeout is raised,
+            None to wait until the query completes
+        :param workers: number of pages downloaded at the same time
+        :param read_ahead: maximum number of pages downloaded and not yet
+            consumed, defaults to 2 * workers
+        :param use_legacy_sql: False for standard SQL, None for the API
+            default (legacy SQL)
+        :param cache_ttl: seconds the result stays in the cache, None
+            for the cache default and 0 to bypass the cache
+        :param row_format: 'dict' for dicts, 'record' for Records (tuples
+            readable by column name and attribute) or 'tuple' for plain
+            tuples, see records.Rows
         :return: generator of records
         """
-        index = 0
-        batch = batch_read if batch_read < 1000 else 1000
+        return format_rows(self._read_query(query, delay, batch_read, timeout, workers,
+                                            read_ahead, use_legacy_sql, cache_ttl),
+                           row_format)
+
+    def _read_query(self, query, delay, batch_read, timeout, workers,
+                    read_ahead, use_legacy_sql, cache_ttl):
+        if self.result_cache is None or cache_ttl == 0:
+            rows = self._run_query(query, delay, batch_read, timeout,
+                                   workers, read_ahead, use_legacy_sql)
+        else:
+            key = cache_key(query, self.project_id, use_legacy_sql is not False)
+            rows = self.result_cache.get(key)
+            if rows is None:
+                rows = self.result_cache.store(
+                    key,
+                    self._run_query(query, delay, batch_read, timeout,
+                                    workers, read_ahead, use_legacy_sql),
+                    ttl=cache_ttl,
+                    tables=tables_in_query(query)
+                )
+            else:
+                logging.info('BQ: reading query result from cache.')
+        for row in rows:
+            yield row
 
-        job_id, _results = self.client.query(query)
+    def _start_query(self, query, delay, timeout, use_legacy_sql):
+        job_id, _results = self.api_call(
+            'query', lambda: self.client.query(query, use_legacy_sql=use_legacy_sql))
         logging.info('BQ: running job %s ...' % job_id)
-        logging.info(_results)
-
-        complete = False
-        row_count = 0
-
-        while not complete:
-            logging.info('Query still running, sleep for %i seconds ...' % delay)
-            sleep(delay)
-            complete, row_count = self.client.check_job(job_id)
-
-        if complete:
-            while index < row_count:
-                results = self.client.get_query_rows(job_id, offset=index, limit=batch)
-                for row in results:
-                    yield row
-                index += batch
+        row_count = self.wait_for_job(job_id, max_delay=delay, timeout=timeout)
+        return job_id, row_count
+
+    def _run_query(self, query, delay, batch_read, timeout, workers,
+                   read_ahead, use_legacy_sql):
+        if self.single_flight is not None:
+            rows = self._shared_query(query, delay, batch_read, timeout, workers,
+                                      read_ahead, use_legacy_sql)
         else:
-            logging.error('BQ: Error while running query.')
-            logging.info('Tip: please try again or increase the sleep time.')
-            raise Exception('Query did not run successfully')
+            job_id, row_count = self._start_query(query, delay, timeout, use_legacy_sql)
+            rows = self._query_rows(job_id, row_count, batch_read, workers, read_ahead)
+        for row in rows:
+            yield row
+
+    def _shared_query(self, query, delay, batch_read, timeout, workers,
+                      read_ahead, use_legacy_sql):
+        """
+        Read the result of a query through self.single_flight: the first
+        caller submits the job, callers running the same query meanwhile
+        attach to it, and each page is downloaded once for all of them.
+        """
+        key = cache_key(query, self.project_id, use_legacy_sql is not False)
+        flight, leader = self.single_flight.join(key, page_size=batch_read)
+        try:
+            if leader:
+                flight.start(lambda: self._start_query(query, delay, timeout, use_legacy_sql))
+            else:
+                logging.info('BQ: query already running, waiting for its job.')
+
+            def fetch(offset, limit):
+                return self.api_call('get_query_rows',
+                                     lambda: self.client.get_query_rows(flight.job_id,
+                                                                        offset=offset,
+                                                                        limit=limit),
+                                     count_rows=True, job_id=flight.job_id)
+
+            for row in flight.read(fetch, workers, read_ahead):
+                yield row
+        finally:
+            self.single_flight.leave(flight)
+
+    def _query_rows(self, job_id, row_count, batch_read, workers, read_ahead):
+        def fetch(offset, limit):
+            return self.api_call('get_query_rows',
+                                 lambda: self.client.get_query_rows(job_id, offset=offset,
+                                                                    limit=limit),
+                                 count_rows=True, job_id=job_id)
+
+        reader = PagePrefetcher(fetch,
+                                row_count=row_count,
+                                page_size=batch_read,
+                                workers=workers,
+                                read_ahead=read_ahead)
+        for row in reader:
+            yield row
 
-    def read_data(self, dataset, table, batch=None):
+    def run_queries(self, queries, max_running=10, delay=5, timeout=None,
+                    batch_read=1000, workers=2, read_ahead=None, cache_ttl=None):
+        """
+        Run many queries at once and yield their results as soon as they
+        are available, in completion order. Jobs are submitted up to
+        max_running at a time and checked by a single loop, see
+        JobScheduler.
+
+        Queries are sql strings or QueryStep. A QueryStep with a dataset
+        and a table writes its result to that table; steps reading a
+        table written by an earlier step, or naming other steps in
+        depends_on, are only submitted once those steps are complete.
+
+        :param queries: iterable of sql strings or QueryStep
+        :param max_running: maximum number of jobs running at the same time
+        :param delay: maximum number of seconds between two job checks
+        :param timeout: seconds after which BigQueryJobTimeout is raised
+            if a job is still running, None to wait until it completes
+        :param batch_read: number of rows fetched per request
+        :param workers: number of pages of a result downloaded at the same time
+        :param read_ahead: maximum number of pages downloaded and not yet
+            consumed, defaults to 2 * workers
+        :param cache_ttl: seconds results of reads stay in the cache, None
+            for the cache default and 0 to bypass the cache
+        :return: generator of tuples (query as given, result), the result
+            being a generator of records for reads and the number of rows
+            of the destination table for writes
+        """
+        queries = list(queries)
+        steps = [QueryStep(query) if isinstance(query, str) else query for query in queries]
+        waits_for = dependencies(steps)
+
+        # independent reads already in the cache are not run again
+        keys = {}
+        cached = set()
+        if self.result_cache is not None and cache_ttl != 0:
+            for index, step in enumerate(steps):
+                if step.dataset is not None:
+                    continue
+                keys[index] = cache_key(step.query, self.project_id,
+                                        step.use_legacy_sql is not False)
+                rows = None if waits_for[index] else self.result_cache.get(keys[index])
+                if rows is not None:
+                    logging.info('BQ: reading query result from cache.')
+                    cached.add(index)
+                    yield queries[index], rows
+
+        def submit(step):
+            if step.dataset is None:
+                job_id, _results = self.api_call(
+                    'query',
+                    lambda: self.client.query(step.query, use_legacy_sql=step.use_legacy_sql))
+                return job_id
+            res = self.api_call('write_to_table',
+                                lambda: self.client.write_to_table(
+                                    query=step.query,
+                                    dataset=step.dataset,
+                                    table=step.table,
+                                    write_disposition=step.write_disposition,
+                                    allow_large_results=True,
+                                    use_legacy_sql=step.use_legacy_sql),
+                                dataset=step.dataset, table=step.table)
+            return res['jobReference']['jobId']
+
+        def check(job_id):
+            return self.api_call('check_job', lambda: self.client.check_job(job_id),
+                                 job_id=job_id)
+
+        waiter = JobWaiter(initial_delay=self.job_waiter.initial_delay,
+                           max_delay=delay,
+                           multiplier=self.job_waiter.multiplier,
+                           timeout=timeout)
+        scheduler = JobScheduler(submit, check, max_running=max_running, waiter=waiter)
+        for index, job_id, row_count in scheduler.run(steps, skip=cached):
+            step = steps[index]
+            stats = scheduler.stats[index]
+            if self.hooks:
+                self.emit(CallEvent('wait_for_job',
+                                    job_id=job_id,
+                                    retries=stats.polls - 1,
+                                    network_time=stats.poll_time,
+                                    poll_time=stats.poll_time))
+            if step.dataset is not None:
+                self.invalidate(step.dataset, step.table)
+                yield queries[index], row_count
+                continue
+            rows = self._query_rows(job_id, row_count, batch_read, workers, read_ahead)
+            if index in keys:
+                rows = self.result_cache.store(keys[index], rows, ttl=cache_ttl,
+                                               tables=tables_in_query(step.query))
+            yield queries[index], rows
+
+    def write_queries_to_tables(self, steps, max_running=10, delay=5, timeout=None):
+        """
+        Run many queries at once, each writing its result to a table, see
+        run_queries. A query reading a table written by an earlier step
+        runs once that step is complete.
+
+        :param steps: iterable of QueryStep or tuples (query, dataset,
+            table[, write_disposition])
+        :param max_running: maximum number of jobs running at the same time
+        :param delay: maximum number of seconds between two job checks
+        :param timeout: seconds after which BigQueryJobTimeout is raised
+            if a job is still running, None to wait until it completes
+        :return: generator of tuples (step as given, number of rows in the
+            destination table), in completion order
+        """
+        steps = list(steps)
+        queries = [step if isinstance(step, QueryStep) else QueryStep(*step) for step in steps]
+        for query in queries:
+            if query.dataset is None or query.table is None:
+                raise ValueError('No destination table for query: %s' % query.query)
+        positions = {id(query): index for index, query in enumerate(queries)}
+        for query, row_count in self.run_queries(queries, max_running=max_running,
+                                                 delay=delay, timeout=timeout):
+            yield steps[positions[id(query)]], row_count
+
+    def read_data(self, dataset, table, batch=None, fields=None, workers=4,
+                  read_ahead=None, row_format='dict', date_range=None):
         """
         Read all records from a specific table in BQ.
 
-        !!! Batch read needs to be implemented for tables that
-        are to large to be queried in on go.
+        Without batch, the table is read through a query job. With batch,
+        the table data is read directly, without running a query, in
+        ranges of batch rows downloaded in parallel by several workers.
+        Rows are yielded in table order.
 
         :param dataset: BQ dataset name
         :param table:  BA table name to be fetched
-        :param batch: integer
+        :param batch: integer, number of rows per request
+        :param fields: list of column names to read, None for all columns
+        :param workers: number of ranges downloaded at the same time
+        :param read_ahead: maximum number of ranges downloaded and not yet
+            consumed, defaults to 2 * workers
+        :param row_format: 'dict', 'record' or 'tuple', see read_query()
+        :param date_range: tuple (first day, last day) to read only these
+            partitions of a time partitioned table, days being dates or
+            'YYYY-MM-DD' strings, None to read the whole table
         :return: generator of records in a dict form
         """
+        if batch and date_range is not None:
+            return format_rows(self._read_partitions(dataset, table, date_range, batch,
+                                                     fields, workers, read_ahead),
+                               row_format)
         if batch:
-            raise NotImplementedError
+            resource = self.get_table(dataset, table)
+            shard = TableShard(dataset, table, 0, int(resource.get('numRows', 0)), fields)
+            return self.read_shard(shard, batch=batch, workers=workers,
+                                   read_ahead=read_ahead, resource=resource,
+                                   row_format=row_format)
         else:
-            return self.read_query('SELECT * FROM [%s.%s]' % (dataset, table))
+            columns = ', '.join(fields) if fields else '*'
+            query = 'SELECT %s FROM [%s.%s]' % (columns, dataset, table)
+            if date_range is not None:
+                query += ' WHERE %s' % partition_filter(*date_range)
+            return self.read_query(query, row_format=row_format)
+
+    def _read_partitions(self, dataset, table, date_range, batch, fields, workers,
+                         read_ahead):
+        """
+        Read the partitions of a table between two days from the table
+        data of each partition, without a query job.
+        """
+        for partition in partition_range(*date_range):
+            resource = self.get_table(dataset, decorate(table, partition))
+            rows = int(resource.get('numRows', 0))
+            if not rows:
+                continue
+            shard = TableShard(dataset, decorate(table, partition), 0, rows, fields)
+            for row in self.read_shard(shard, batch=batch, workers=workers,
+                                       read_ahead=read_ahead, resource=resource):
+                yield row
+
+    def read_table(self, dataset, table, **kwargs):
+        """
+        Same as read_data().
+        """
+        return self.read_data(dataset, table, **kwargs)
+
+    def read_query_batches(self, query, batch_size=10000, delay=5,
+                           timeout=None, workers=2, read_ahead=None,
+                           use_legacy_sql=None):
+        """
+        Run a query on BQ and return the result as batches of columns.
+        Each page of the result is decoded directly into one numpy array
+        per column, typed after the result schema, plus a null mask per
+        column. Requires numpy.
+
+        :param query: sql query to be ran on the bq
+        :param batch_size: number of rows per batch (and per request)
+        :param delay: maximum number of seconds between two job checks
+        :param timeout: seconds after which BigQueryJobTimeout is raised
+        :param workers: number of pages downloaded at the same time
+        :param read_ahead: maximum number of pages downloaded and not yet
+            consumed, defaults to 2 * workers
+        :param use_legacy_sql: False for standard SQL, None for the API
+            default (legacy SQL)
+        :return: generator of ColumnBatch
+        """
+        schema, reader = self._query_pages(query, batch_size, delay, timeout,
+                                           workers, read_ahead, use_legacy_sql)
+        for page in reader.pages():
+            yield decode_columns(page, schema)
+
+    def materialize(self, query, directory=None, batch_size=10000, delay=5,
+                    timeout=None, workers=2, read_ahead=None, use_legacy_sql=None):
+        """
+        Run a query on BQ and store its result column by column in local
+        files, typed after the result schema. The result is read from
+        the API once and returned as a memory mapped MaterializedResult,
+        which can be iterated any number of times, sliced by rows and
+        read column by column without loading it in memory. Requires
+        numpy.
+
+        :param query: sql query to be ran on the bq
+        :param directory: directory of the files, a temporary directory
+            deleted by MaterializedResult.close() if None
+        :param batch_size: number of rows per request
+        :param delay: maximum number of seconds between two job checks
+        :param timeout: seconds after which BigQueryJobTimeout is raised
+        :param workers: number of pages downloaded at the same time
+        :param read_ahead: maximum number of pages downloaded and not yet
+            written, defaults to 2 * workers
+        :param use_legacy_sql: False for standard SQL, None for the API
+            default (legacy SQL)
+        :return: MaterializedResult
+        """
+        owned = directory is None
+        if owned:
+            directory = tempfile.mkdtemp(prefix='kumpel-')
+        try:
+            schema, reader = self._query_pages(query, batch_size, delay, timeout,
+                                               workers, read_ahead, use_legacy_sql)
+            writer = ColumnarWriter(directory, schema)
+            try:
+                for page in reader.pages():
+                    writer.append(decode_columns(page, schema))
+            finally:
+                writer.close()
+        except BaseException:
+            if owned:
+                shutil.rmtree(directory, ignore_errors=True)
+            raise
+        logging.info('BQ: Query result materialized in %s, %i rows.' % (directory, writer.rows))
+        return MaterializedResult(directory, owned=owned)
+
+    def _query_pages(self, query, batch_size, delay, timeout, workers, read_ahead,
+                     use_legacy_sql):
+        """
+        Run a query and prepare the download of its raw result.
+
+        :return: tuple (schema fields, PagePrefetcher of the result)
+        """
+        job_id, row_count = self._start_query(query, delay, timeout, use_legacy_sql)
+
+        def results(offset, limit):
+            # pages are fetched by worker threads, each with its own client
+            return self.client.bigquery.jobs().getQueryResults(projectId=self.project_id,
+                                                               jobId=job_id,
+                                                               startIndex=offset,
+                                                               maxResults=limit,
+                                                               timeoutMs=0).execute()
+
+        def fetch(offset, limit):
+            return self.api_call('jobs.getQueryResults',
+                                 lambda: results(offset, limit).get('rows', []),
+                                 count_rows=True, job_id=job_id)
+
+        schema = self.api_call('jobs.getQueryResults', lambda: results(0, 0),
+                               job_id=job_id)['schema']['fields']
+        reader = PagePrefetcher(fetch,
+                                row_count=row_count,
+                                page_size=batch_size,
+                                workers=workers,
+                                read_ahead=read_ahead)
+        return schema, reader
+
+    def read_data_batches(self, dataset, table, batch_size=10000, fields=None,
+                          workers=4, read_ahead=None):
+        """
+        Read a table directly from its data, without a query job, as
+        batches of columns. See read_query_batches(). Requires numpy.
+
+        :param dataset: BQ dataset name
+        :param table: BQ table name
+        :param batch_size: number of rows per batch (and per request)
+        :param fields: list of column names to read, None for all columns
+        :param workers: number of ranges downloaded at the same time
+        :param read_ahead: maximum number of ranges downloaded and not yet
+            consumed, defaults to 2 * workers
+        :return: generator of ColumnBatch
+        """
+        resource = self.get_table(dataset, table)
+        shard = TableShard(dataset, table, 0, int(resource.get('numRows', 0)), fields)
+        schema = select_fields(resource['schema']['fields'], fields)
+        reader = PagePrefetcher(self._table_data_fetcher(shard),
+                                row_count=shard.stop,
+                                page_size=batch_size,
+                                workers=workers,
+                                read_ahead=read_ahead)
+        for page in reader.pages():
+            yield decode_columns(page, schema)
+
+    def _table_data_fetcher(self, shard):
+        """
+        Callable (offset, limit) returning raw rows of a shard.
+        """
+        params = {
+            'projectId': self.project_id,
+            'datasetId': shard.dataset,
+            'tableId': shard.table,
+        }
+        if shard.fields:
+            params['selectedFields'] = ','.join(shard.fields)
+
+        def fetch(offset, limit):
+            # called by worker threads, each with its own client
+            return self.api_call(
+                'tabledata.list',
+                lambda: self.client.bigquery.tabledata().list(startIndex=shard.start + offset,
+                                                              maxResults=limit,
+                                                              **params).execute().get('rows', []),
+                count_rows=True, dataset=shard.dataset, table=shard.table
+            )
+        return fetch
+
+    def table_shards(self, dataset, table, shards=4, fields=None):
+        """
+        Split a table in contiguous ranges of rows, to be read in parallel
+        with read_shard() by independent consumers (threads or processes
+        having their own connector).
+
+        :param dataset: BQ dataset name
+        :param table: BQ table name
+        :param shards: number of ranges
+        :param fields: list of column names to read, None for all columns
+        :return: list of TableShard
+        """
+        resource = self.get_table(dataset, table)
+        return split_in_shards(dataset, table, int(resource.get('numRows', 0)),
+                               shards, fields)
+
+    def read_shard(self, shard, batch=10000, workers=1, read_ahead=None,
+                   resource=None, row_format='dict'):
+        """
+        Read a range of rows of a table directly from the table data.
+
+        :param shard: TableShard, see table_shards()
+        :param batch: integer, number of rows per request
+        :param workers: number of requests sent at the same time
+        :param read_ahead: maximum number of requests downloaded and not
+            yet consumed, defaults to 2 * workers
+        :param resource: table resource, fetched when not given
+        :param row_format: 'dict', 'record' or 'tuple', see read_query()
+        :return: generator of records in a dict form
+        """
+        if resource is None:
+            resource = self.get_table(shard.dataset, shard.table)
+        schema = select_fields(resource['schema']['fields'], shard.fields)
+        fetch_rows = self._table_data_fetcher(shard)
+
+        def fetch(offset, limit):
+            return [decode_row(row, schema) for row in fetch_rows(offset, limit)]
+
+        reader = PagePrefetcher(fetch,
+                                row_count=shard.stop - shard.start,
+                                page_size=batch,
+                                workers=workers,
+                                read_ahead=read_ahead)
+        return format_rows(iter(reader), row_format)
 
     def write_to_table(self, dataset, table, data, primary_key=None,
-                       batch_write=10000):
+                       batch_write=10000, workers=1, max_pending=None,
+                       max_bytes=MAX_REQUEST_BYTES, target_latency=None,
+                       schema=None, unknown='drop', on_invalid=None,
+                       checkpoint=None, load_id=None, partition_by=None,
+                       replace_partitions=False, timeout=None):
         """
         The bigquery.insertAll() function currently can not handle more then
         50 000 row at a time. Hence, we need to split the table into batches.
 
+        With partition_by, each row is appended to the partition of its
+        day. With replace_partitions as well, the rows of each day replace
+        the partition of that day with a load job instead, see
+        load_partitions; the options of streaming inserts do not apply
+        then.
+
         Define the size of batch in init_bigquery.py - BATCH_WRITE_SIZE
 
         :param batch_write:
@@ -396,30 +1257,482 @@ class BigQuery():
         :param table: target table in bigquery
         :param data: generator of dicts, data to be uploaded to bigquery
         :param primary_key: field name of the primary key, in case there is one
+        :param workers: number of insert requests sent at the same time
+        :param max_pending: maximum number of batches held in memory while
+            waiting for BigQuery, defaults to 2 * workers
+        :param max_bytes: maximum size in bytes of an insert request
+        :param target_latency: seconds per insert request to aim for when
+            adapting the batch size, None for batches of batch_write rows
+        :param schema: Schema, dict or list of fields to validate and
+            convert rows with before sending them, True for the schema of
+            the target table, None to send rows as they are
+        :param unknown: with a schema, what to do with unknown columns:
+            'drop', 'flag' the row as invalid or 'keep'
+        :param on_invalid: called with each invalid row and its
+            BigQueryRowError, None to log and skip them
+        :param checkpoint: LoadJournal or path of its file, to resume the
+            load where it stopped when it is run again, see stream_to_table
+        :param load_id: name of the load in the journal, defaults to
+            'dataset.table'
+        :param partition_by: date or timestamp column whose day routes
+            each row to its partition of a time partitioned table
+        :param replace_partitions: with partition_by, True to replace the
+            partitions of the days found in data instead of appending to
+            them, the other rows of those days are deleted
+        :param timeout: seconds to wait for the load jobs of the
+            partitions, None to wait until they complete
+        :return: number of rows sent to BigQuery
+        """
+        if replace_partitions:
+            if partition_by is None:
+                raise ValueError('replace_partitions requires partition_by.')
+            options = {'primary_key': primary_key, 'batch_write': batch_write,
+                       'workers': workers, 'max_pending': max_pending,
+                       'max_bytes': max_bytes, 'target_latency': target_latency,
+                       'checkpoint': checkpoint, 'load_id': load_id}
+            ignored = sorted(name for name, default in STREAMING_DEFAULTS.items()
+                             if options[name] != default)
+            if ignored:
+                raise ValueError('%s only apply to streamed rows, not with '
+                                 'replace_partitions.' % ', '.join(ignored))
+            return self.load_partitions(dataset=dataset,
+                                        table=table,
+                                        data=data,
+                                        partition_by=partition_by,
+                                        schema=schema,
+                                        unknown=unknown,
+                                        on_invalid=on_invalid,
+                                        timeout=timeout)
+        results = self.stream_to_table(dataset=dataset,
+                                       table=table,
+                                       data=data,
+                                       primary_key=primary_key,
+                                       batch_write=batch_write,
+                                       workers=workers,
+                                       max_pending=max_pending,
+                                       max_bytes=max_bytes,
+                                       target_latency=target_latency,
+                                       schema=schema,
+                                       unknown=unknown,
+                                       on_invalid=on_invalid,
+                                       checkpoint=checkpoint,
+                                       load_id=load_id,
+                                       partition_by=partition_by)
+        return sum(result.rows for result in results)
+
+    def stream_to_table(self, dataset, table, data, primary_key=None,
+                        batch_write=10000, workers=4, max_pending=None,
+                        max_bytes=MAX_REQUEST_BYTES, target_latency=None,
+                        schema=None, unknown='drop', on_invalid=None,
+                        checkpoint=None, load_id=None, partition_by=None):
+        """
+        Streaming insert with several insertAll requests in flight. Rows
+        are read from data only when a slot is free, so a fast generator
+        never holds more than max_pending batches in memory.
+
+        Requests are bounded both by batch_write rows and max_bytes bytes.
+        A request rejected as too large is split in halves and sent again.
+        Rows are sent with insert ids (primary_key when given), so that a
+        request retried by the throttle does not insert them twice.
+
+        With a checkpoint, the positions of the rows acknowledged by
+        BigQuery are recorded in a local journal, and every row is sent
+        with an insert id derived from primary_key or from its position,
+        so that BigQuery drops the rows sent twice. A load run again with
+        the same load_id and the same data skips the acknowledged rows
+        without sending them; the journal of a load is cleared once all
+        its rows are accepted.
+
+        With partition_by, rows are appended to the table$YYYYMMDD
+        partition of their day, in batches holding a single partition,
+        sent in parallel; rows without a day go to the table itself.
+        BigQuery only accepts streamed rows for partitions of the last 31
+        days and the next 16 days: to write older partitions, or to
+        reload a partition without duplicates, see load_partitions.
+
+        :param dataset: target dataset in bigquery
+        :param table: target table in bigquery
+        :param data: generator of dicts, data to be uploaded to bigquery
+        :param primary_key: field name of the primary key, in case there is one
+        :param batch_write: number of rows per insert request
+        :param workers: number of insert requests sent at the same time
+        :param max_pending: maximum number of batches held in memory while
+            waiting for BigQuery, defaults to 2 * workers
+        :param max_bytes: maximum size in bytes of an insert request
+        :param target_latency: seconds per insert request to aim for when
+            adapting the batch size, None for batches of batch_write rows
+        :param schema: Schema, dict or list of fields to validate and
+            convert rows with before sending them, True for the schema of
+            the target table, None to send rows as they are
+        :param unknown: with a schema, what to do with unknown columns:
+            'drop', 'flag' the row as invalid or 'keep'
+        :param on_invalid: called with each invalid row and its
+            BigQueryRowError, None to log and skip them
+        :param checkpoint: LoadJournal or path of its file, None to send
+            all the rows without insert ids derived from their position
+        :param load_id: name of the load in the journal, defaults to
+            'dataset.table'
+        :param partition_by: date or timestamp column routing the rows to
+            the partitions of an ingestion time partitioned table
+        :return: list of BatchResult (index, rows, failed, latency)
+        """
+        journal = checkpoint
+        if journal is not None and not isinstance(journal, LoadJournal):
+            journal = LoadJournal(journal)
+        load_id = load_id or '%s.%s' % (dataset, table)
+
+        invalid = []
+        if schema is not None:
+            if on_invalid is None:
+                on_invalid = self._invalid_row_logger(dataset, table, invalid)
+            encoder = self.row_encoder(dataset, table, schema, unknown)
+
+        batcher = AdaptiveBatcher(max_bytes=max_bytes,
+                                  max_rows=batch_write,
+                                  target_latency=target_latency)
+        route = None
+        if journal is None:
+            if partition_by is not None:
+                def route(batch):
+                    return decorate(table, partition_id(batch[0].get(partition_by)))
+
+            push = self._row_pusher(dataset, table, primary_key, route)
+            if schema is not None:
+                data = encoder.filter(data, on_invalid)
+            size = row_size
+        else:
+            if partition_by is not None:
+                def route(batch):
+                    return decorate(table, partition_id(batch[0][1].get(partition_by)))
+
+            push = self._checkpoint_pusher(dataset, table, primary_key, journal, load_id, route)
+            acknowledged = journal.acknowledged(load_id)
+            if acknowledged:
+                logging.info('BQ: resuming load %s, %i rows already acknowledged.'
+                             % (load_id, sum(stop - start for start, stop in acknowledged)))
+            data = pending_rows(data, acknowledged,
+                                encode=None if schema is None else encoder.encode,
+                                on_invalid=on_invalid)
+
+            def size(item):
+                return row_size(item[1])
+
+        if route is None:
+            batches = batcher.batches(data, size=size)
+        else:
+            batches = partition_batches(data, lambda item: route([item]), batcher, size=size)
+        writer = ConcurrentWriter(push,
+                                  workers=workers,
+                                  max_pending=max_pending,
+                                  batcher=batcher)
+        try:
+            results = writer.write(batches)
+        finally:
+            self.invalidate(dataset, table)
+        logging.info('BQ: %i rows in %i batches sent to %s.%s.'
+                     % (sum(r.rows for r in results), len(results), dataset, table))
+        if journal is not None:
+            if any(result.failed for result in results):
+                journal.compact(load_id)
+            else:
+                journal.clear(load_id)
+        if invalid:
+            logging.warning('BQ: %i invalid rows not sent to %s.%s.'
+                            % (len(invalid), dataset, table))
+        return results
+
+    @staticmethod
+    def _invalid_row_logger(dataset, table, invalid):
         """
-        rows = 0
-        batch = []
-
-        for row in data:
-            rows += 1
-            batch.append(row)
-            if rows % batch_write == 0:
-                print(batch)
-                self.client.push_rows(dataset=dataset,
-                                      table=table,
-                                      rows=batch,
-                                      insert_id_key=primary_key)
-                batch = []
-        # commit the last rows before exit
-        self.client.push_rows(dataset=dataset,
-                              table=table,
-                              rows=batch,
-                              insert_id_key=primary_key)
-
-        return rows
+        :param invalid: list the invalid rows are appended to
+        :return: on_invalid callback logging and skipping invalid rows
+        """
+        def on_invalid(row, error):
+            invalid.append(row)
+            logging.warning('BQ: invalid row for %s.%s skipped, %s: %s'
+                            % (dataset, table, error.expression, error.message))
+
+        return on_invalid
+
+    def load_to_table(self, dataset, table, data, write_disposition='WRITE_APPEND',
+                      fields=None, time_partitioning=False, schema=None,
+                      unknown='drop', on_invalid=None, timeout=None):
+        """
+        Write rows with a load job of newline delimited JSON. Unlike
+        streaming inserts, load jobs are free, all or nothing, and can
+        replace a table or a table$YYYYMMDD partition of any day.
+
+        :param dataset: target dataset in bigquery
+        :param table: target table in bigquery, or table$YYYYMMDD partition
+        :param data: iterable of dicts
+        :param write_disposition: WRITE_APPEND, WRITE_TRUNCATE (of the
+            partition only, with a decorator) or WRITE_EMPTY
+        :param fields: schema fields of the table, to create it if it does
+            not exist, None for a table which must exist
+        :param time_partitioning: True to create a table partitioned by day
+        :param schema: Schema, dict or list of fields to validate and
+            convert rows with before loading them, True for the schema of
+            the target table, None to load rows as they are
+        :param unknown: with a schema, what to do with unknown columns:
+            'drop', 'flag' the row as invalid or 'keep'
+        :param on_invalid: called with each invalid row and its
+            BigQueryRowError, None to log and skip them
+        :param timeout: seconds after which BigQueryJobTimeout is raised,
+            None to wait until the job completes
+        :return: number of rows loaded
+        """
+        invalid = []
+        lines = self._json_lines(dataset, table.partition('$')[0], data, schema, unknown,
+                                 on_invalid, invalid)
+        descriptor, path = tempfile.mkstemp(prefix='kumpel_', suffix='.json')
+        try:
+            with os.fdopen(descriptor, 'wb') as fout:
+                for _row, line in lines:
+                    fout.write(line)
+                    fout.write(b'\n')
+            if invalid:
+                logging.warning('BQ: %i invalid rows not loaded to %s.%s.'
+                                % (len(invalid), dataset, table))
+            job_id = self._insert_load_job(dataset, table, path, write_disposition,
+                                           fields, time_partitioning)
+            return self._wait_for_load(job_id, timeout)
+        finally:
+            os.remove(path)
+            self.invalidate(dataset, table.partition('$')[0])
+
+    def load_partitions(self, dataset, table, data, partition_by, schema=None,
+                        unknown='drop', on_invalid=None, timeout=None):
+        """
+        Replace the partitions of a time partitioned table with the rows
+        of their day. Rows are spilled to a local file per partition,
+        then each file replaces its table$YYYYMMDD partition with a
+        WRITE_TRUNCATE load job, the jobs running in parallel. A daily
+        reload therefore replaces the rows of the day instead of adding
+        them again, for days of any age. Rows without a day are appended
+        to the table.
+
+        :param dataset: target dataset in bigquery
+        :param table: target table in bigquery, time partitioned
+        :param data: iterable of dicts
+        :param partition_by: date or timestamp column giving the day of
+            each row
+        :param schema: Schema, dict or list of fields to validate and
+            convert rows with before loading them, True for the schema of
+            the target table, None to load rows as they are
+        :param unknown: with a schema, what to do with unknown columns:
+            'drop', 'flag' the row as invalid or 'keep'
+        :param on_invalid: called with each invalid row and its
+            BigQueryRowError, None to log and skip them
+        :param timeout: seconds to wait for each load job, None to wait
+            until they complete
+        :return: number of rows loaded
+        """
+        invalid = []
+        lines = self._json_lines(dataset, table, data, schema, unknown, on_invalid, invalid)
+
+        directory = tempfile.mkdtemp(prefix='kumpel_')
+        try:
+            paths = {}
+
+            def key(item):
+                return partition_id(item[0].get(partition_by))
+
+            # batches of a single partition, appended to the file of the partition
+            batches = partition_batches(lines, key, AdaptiveBatcher(),
+                                        size=lambda item: len(item[1]))
+            for batch in batches:
+                partition = key(batch[0])
+                path = paths.setdefault(partition, os.path.join(
+                    directory, '%s.json' % (partition or 'table')))
+                with open(path, 'ab') as fout:
+                    fout.writelines(line + b'\n' for _row, line in batch)
+
+            jobs = []
+            for partition, path in sorted(paths.items(), key=lambda item: item[0] or ''):
+                disposition = 'WRITE_APPEND' if partition is None else 'WRITE_TRUNCATE'
+                jobs.append(self._insert_load_job(dataset, decorate(table, partition),
+                                                  path, disposition))
+            loaded = sum(self._wait_for_load(job_id, timeout) for job_id in jobs)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+            self.invalidate(dataset, table)
+        logging.info('BQ: %i rows loaded in %i partitions of %s.%s.'
+                     % (loaded, len(jobs), dataset, table))
+        if invalid:
+            logging.warning('BQ: %i invalid rows not loaded to %s.%s.'
+                            % (len(invalid), dataset, table))
+        return loaded
+
+    def _json_lines(self, dataset, table, data, schema, unknown, on_invalid, invalid):
+        """
+        Rows of a load job, converted and serialized in one pass by the
+        RowEncoder of the schema.
+
+        :param invalid: list the invalid rows are appended to when
+            on_invalid is None
+        :return: generator of tuples (row, json line)
+        """
+        if schema is None:
+            return ((row, dumps(row)) for row in data)
+        if on_invalid is None:
+            on_invalid = self._invalid_row_logger(dataset, table, invalid)
+        return self.row_encoder(dataset, table, schema, unknown).encode_lines(data, on_invalid)
+
+    def _insert_load_job(self, dataset, table, path, write_disposition,
+                         fields=None, time_partitioning=False):
+        """
+        Submit a load job of a newline delimited JSON file. The job id is
+        generated here, so the job can be found even if the response of
+        the request is lost.
+
+        :return: job id
+        """
+        client = self.client
+        job_id = 'kumpel_load_%s' % uuid.uuid4().hex
+        load = {
+            'destinationTable': {'projectId': client.project_id,
+                                 'datasetId': dataset,
+                                 'tableId': table},
+            'sourceFormat': 'NEWLINE_DELIMITED_JSON',
+            'writeDisposition': write_disposition,
+            'createDisposition': 'CREATE_NEVER' if fields is None else 'CREATE_IF_NEEDED',
+        }
+        if fields is not None:
+            load['schema'] = {'fields': fields}
+            if time_partitioning:
+                load['timePartitioning'] = {'type': 'DAY'}
+        body = {'jobReference': {'projectId': client.project_id, 'jobId': job_id},
+                'configuration': {'load': load}}
+        self.api_call('jobs.insert',
+                      client.bigquery.jobs().insert(projectId=client.project_id,
+                                                    body=body,
+                                                    media_body=path,
+                                                    media_mime_type='application/octet-stream').execute,
+                      dataset=dataset, table=table, job_id=job_id)
+        logging.info('BQ: running load job %s to %s.%s ...' % (job_id, dataset, table))
+        return job_id
+
+    def _wait_for_load(self, job_id, timeout=None):
+        """
+        Wait for a load job, raise BigQueryJobError if it failed.
+
+        :return: number of rows loaded
+        """
+        job = self.wait_for_job(job_id, check=lambda: self.check_job_state(job_id),
+                                timeout=timeout)
+        return int(job.get('statistics', {}).get('load', {}).get('outputRows', 0))
+
+    def _insert_all(self, dataset, table, body):
+        """
+        Raw tabledata.insertAll request, made with the client of the
+        calling thread. Unlike client.push_rows, which swallows them,
+        errors of the request (413, 429, 5xx ...) are raised.
+
+        :return: insertAll response
+        """
+        client = self.client
+        return client.bigquery.tabledata().insertAll(projectId=client.project_id,
+                                                     datasetId=dataset,
+                                                     tableId=table,
+                                                     body=body).execute()
+
+    def _send_rows(self, dataset, target, body, rows, size, queue_wait):
+        """
+        Send an insertAll request for a ConcurrentWriter: a request of
+        several rows rejected as too large raises, so that it is split,
+        other request errors are logged and returned as a response in
+        which all the rows failed. Every row of body has an insert id,
+        so the throttle may send the request again.
+        """
+        call = partial(self._insert_all, dataset, target, body)
+        try:
+            if not self.hooks and self.throttle is None:
+                return call()
+            return self.api_call('push_rows', call,
+                                 retry=True,
+                                 dataset=dataset,
+                                 table=target,
+                                 rows=rows,
+                                 bytes=size(),
+                                 queue_wait=queue_wait)
+        except Exception as e:
+            if rows > 1 and is_payload_rejection(e):
+                raise
+            logging.error('BQ: insert request to %s.%s failed: %s' % (dataset, target, e))
+            return request_failure(e)
+
+    def _row_pusher(self, dataset, table, primary_key=None, route=None):
+        """
+        Every row is sent with an insert id, the value of primary_key or
+        an id generated once per batch, so that BigQuery drops the rows
+        of a request sent twice.
+
+        :param route: optional callable returning the table (or partition)
+            a batch is sent to
+        :return: callable (batch, queue_wait) sending a batch of rows with
+            insertAll, see ConcurrentWriter
+        """
+        def insert_id(prefix, index, row):
+            if primary_key is not None and row.get(primary_key) is not None:
+                return str(row[primary_key])
+            return '%s:%i' % (prefix, index)
+
+        def push(batch, queue_wait=0.0):
+            target = table if route is None else route(batch)
+            prefix = uuid.uuid4().hex
+            body = {'rows': [{'insertId': insert_id(prefix, index, row), 'json': row}
+                             for index, row in enumerate(batch)]}
+            return self._send_rows(dataset, target, body, len(batch),
+                                   lambda: sum(row_size(row) for row in batch), queue_wait)
+
+        return push
+
+    def _checkpoint_pusher(self, dataset, table, primary_key, journal, load_id, route=None):
+        """
+        :param route: optional callable returning the table (or partition)
+            a batch is sent to
+        :return: callable (batch, queue_wait) sending a batch of tuples
+            (position, row) with insertAll and recording the positions
+            in the journal once BigQuery accepted them
+        """
+        def insert_id(position, row):
+            if primary_key is not None and row.get(primary_key) is not None:
+                return str(row[primary_key])
+            return '%s:%i' % (load_id, position)
+
+        def push(batch, queue_wait=0.0):
+            target = table if route is None else route(batch)
+            body = {'rows': [{'insertId': insert_id(position, row), 'json': row}
+                             for position, row in batch]}
+            response = self._send_rows(dataset, target, body, len(batch),
+                                       lambda: sum(row_size(row) for _, row in batch),
+                                       queue_wait)
+            if not response.get('insertErrors'):
+                journal.record(load_id, [position for position, _ in batch])
+            return response
+
+        return push
+
+    def row_encoder(self, dataset, table, schema=True, unknown='drop'):
+        """
+        Compiled encoder validating and converting rows before a write.
+
+        :param dataset: target dataset in bigquery
+        :param table: target table in bigquery
+        :param schema: Schema, dict or list of fields, True for the schema
+            of the target table
+        :param unknown: what to do with unknown columns: 'drop', 'flag'
+            the row as invalid or 'keep'
+        :return: RowEncoder
+        """
+        if schema is True:
+            schema = self.table_schema(dataset, table)
+        elif not isinstance(schema, Schema):
+            schema = Schema(schema)
+        return schema.encoder(unknown)
 
     def write_query_to_table(self, query, dataset, table, write_disposition=None,
-                             use_legacy_sql=True):
+                             use_legacy_sql=True, timeout=None):
         """
         Run a query in BQ and save the output in a bigquery table
 
@@ -430,23 +1743,180 @@ class BigQuery():
         :param table: Target table where to save the output of the query
         :param write_disposition: What to do if target table already exits:
             WRITE_TRUNCATE, WRITE_APPEND, WRITE_EMPTY
+        :param timeout: seconds after which BigQueryJobTimeout is raised,
+            None to wait until the job completes
+        :return: number of rows in the target table
         """
-        res = self.client.write_to_table(query=query,
-                                         dataset=dataset,
-                                         table=table,
-                                         write_disposition=write_disposition,
-                                         allow_large_results=True,
-                                         use_legacy_sql=use_legacy_sql)
+        res = self.api_call('write_to_table',
+                            lambda: self.client.write_to_table(
+                                query=query,
+                                dataset=dataset,
+                                table=table,
+                                write_disposition=write_disposition,
+                                allow_large_results=True,
+                                use_legacy_sql=use_legacy_sql),
+                            dataset=dataset, table=table)
 
         job_id = res['jobReference']['jobId']
         logging.info('BQ: write query to table ...')
 
-        rows = None
-        job_complete = False
+        try:
+            return self.wait_for_job(job_id, timeout=timeout)
+        finally:
+            self.invalidate(dataset, table)
 
-        while not job_complete:
-            job_complete, rows = self.client.check_job(job_id)
-            logging.info('still writing ...')
-            sleep(5)
+    def upsert_to_table(self, dataset, table, data, keys, staging_dataset=None,
+                        unknown='drop', on_invalid=None, timeout=None,
+                        staging_ttl=86400) -> UpsertResult:
+        """
+        Insert or update rows of a table in one set based operation: the
+        rows are loaded to a staging table with the schema of the target
+        by a load job, applied with a single MERGE statement on the key
+        columns, and the staging table is dropped, whether the upsert
+        succeeded or not. Rows are converted with the schema of the
+        target table before they are staged.
 
-        return rows
+        The target is left untouched when a row is rejected by BigQuery.
+        Each key must appear at most once in data, otherwise the MERGE
+        job fails.
+
+        :param dataset: target dataset in bigquery
+        :param table: target table in bigquery, must exist
+        :param data: iterable of dicts
+        :param keys: name of the key column, or list of names
+        :param staging_dataset: dataset of the staging table, defaults to
+            dataset
+        :param unknown: what to do with unknown columns: 'drop', 'flag'
+            the row as invalid or 'keep'
+        :param on_invalid: called with each invalid row and its
+            BigQueryRowError, None to log and skip them
+        :param timeout: seconds after which BigQueryJobTimeout is raised
+            while waiting for the load or the MERGE job
+        :param staging_ttl: seconds after which BigQuery deletes a staging
+            table left behind by a crashed process
+        :return: UpsertResult
+        """
+        start = time.time()
+        keys = [keys] if isinstance(keys, str) else list(keys)
+        staging_dataset = staging_dataset or dataset
+        fields = self.get_schema_from_table(dataset, table)
+        if not fields:
+            raise BigQueryError(expression='Unknown table.',
+                                message='%s.%s does not exist.' % (dataset, table))
+        missing = set(keys) - {field['name'] for field in fields}
+        if missing:
+            raise BigQueryError(expression='Unknown key columns.',
+                                message='%s.%s has no column %s.'
+                                        % (dataset, table, ', '.join(sorted(missing))))
+
+        staging = '%s_upsert_%s' % (table, uuid.uuid4().hex[:12])
+        try:
+            created = self.api_call('create_table',
+                                    lambda: self.client.create_table(
+                                        dataset=staging_dataset,
+                                        table=staging,
+                                        schema=fields,
+                                        expiration_time=int((start + staging_ttl) * 1000)),
+                                    dataset=staging_dataset, table=staging)
+            if not created:
+                raise BigQueryError(expression='Upsert to %s.%s aborted.' % (dataset, table),
+                                    message='Staging table %s.%s was not created.'
+                                            % (staging_dataset, staging))
+            rows = self.load_to_table(staging_dataset, staging, data,
+                                      write_disposition='WRITE_TRUNCATE',
+                                      schema=fields,
+                                      unknown=unknown,
+                                      on_invalid=on_invalid,
+                                      timeout=timeout)
+            if not rows:
+                logging.info('BQ: nothing to upsert to %s.%s.' % (dataset, table))
+                return UpsertResult(dataset, table, 0, 0, None, time.time() - start)
+
+            sql = merge_query(dataset, table, staging_dataset, staging, fields, keys)
+            job_id, _results = self.api_call(
+                'query', lambda: self.client.query(sql, use_legacy_sql=False))
+            try:
+                self.wait_for_job(job_id, timeout=timeout)
+            finally:
+                self.invalidate(dataset, table)
+            _complete, job = self.check_job_state(job_id)
+        finally:
+            self.api_call('delete_table',
+                          lambda: self.client.delete_table(staging_dataset, staging),
+                          dataset=staging_dataset, table=staging)
+            self.invalidate(staging_dataset, staging)
+
+        affected = int(job.get('statistics', {}).get('query', {}).get('numDmlAffectedRows') or 0)
+        logging.info('BQ: %i rows upserted to %s.%s, %i rows affected.'
+                     % (rows, dataset, table, affected))
+        return UpsertResult(dataset, table, rows, affected, job_id, time.time() - start)
+
+
+class DummyBigQuery(BigQuery):
+    """
+    BigQuery connector running against a local emulator instead of
+    Google's service, see kumpel.connectors.emulator. Behaves like
+    BigQuery, including simulated latency and quotas, so pipelines can
+    be tested and benchmarked offline.
+    """
+
+    def __init__(self, project_id='local', path=':memory:', latency=0.0,
+                 job_latency=0.0, max_calls_per_second=None,
+                 swallow_results=True, error_rate=0.0, storage=None,
+                 export_shard_rows=100000, **kwargs):
+        """
+        :param project_id: name of the emulated project
+        :param path: sqlite database file, ':memory:' for a throw away one
+        :param latency: seconds added to every API call, or dict of
+            seconds per client method name
+        :param job_latency: seconds a job stays running after submission
+        :param max_calls_per_second: API calls above this rate are
+            rejected with a 429 error, None for no limit
+        :param swallow_results: same as for BigQuery
+        :param error_rate: probability of an API call failing with a
+            transient 503 error
+        :param storage: Storage extract jobs write to and exports are
+            read from, defaults to a LocalStorage in a temporary directory
+        :param export_shard_rows: maximum number of rows per exported file
+            for a wildcard uri
+        :param kwargs: other BigQuery options (cache, metadata_ttl, ...)
+        """
+        storage = storage or LocalStorage()
+        client = LocalBigQueryClient(project_id=project_id,
+                                     path=path,
+                                     latency=latency,
+                                     job_latency=job_latency,
+                                     max_calls_per_second=max_calls_per_second,
+                                     swallow_results=swallow_results,
+                                     error_rate=error_rate,
+                                     storage=storage,
+                                     export_shard_rows=export_shard_rows)
+        super().__init__(credentials_file=None,
+                         project_id=project_id,
+                         client=client,
+                         storage=storage,
+                         **kwargs)
+
+    def load_csv(self, dataset, table, file_path, schema=None):
+        """
+        Load a csv file with a header line in a table, created with the
+        given schema when missing.
+
+        :param dataset: target dataset, created when missing
+        :param table: target table
+        :param file_path: csv file
+        :param schema: dict column name -> type, columns not in it are STRING
+        :return: number of rows loaded
+        """
+        schema = schema or {}
+        with open(file_path) as fin:
+            csv_reader = csv.DictReader(fin)
+            if not self.exists(dataset):
+                self.create_dataset(dataset)
+            if not self.exists(dataset, table):
+                columns = csv_reader.fieldnames or []
+                self.create_table(dataset, table,
+                                  {name: schema.get(name, 'STRING') for name in columns})
+            rows = ({k: (None if v == '' else v) for k, v in row.items()}
+                    for row in csv_reader)
+            return self.write_to_table(dataset, table, rows)
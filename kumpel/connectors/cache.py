@@ -0,0 +1,236 @@
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Iterable, Iterator, List, Optional
+
+from .batching import dumps
+
+# number of rows serialized together in a line of a cache file
+CHUNK_ROWS = 1000
+
+TABLE_REFERENCE = re.compile(
+    r'\[(?:[\w\-]+:)?(\w+)\.(\w+)\]'           # legacy [project:dataset.table]
+    r'|`(?:[\w\-]+\.)?(\w+)\.(\w+)`'            # standard `project.dataset.table`
+    r'|\b(?:from|join)\s+(?:[\w\-]+[:.])?(\w+)\.(\w+)\b',
+    re.IGNORECASE
+)
+
+
+def normalize_query(query: str) -> str:
+    """
+    Remove differences between two queries which do not change their
+    result: surrounding and repeated white spaces and trailing ';'.
+
+    :param query: sql query
+    :return: normalized sql query
+    """
+    return ' '.join(query.split()).rstrip(';').strip()
+
+
+def tables_in_query(query: str) -> List[str]:
+    """
+    Extract the tables read by a query, as 'dataset.table' strings.
+
+    :param query: sql query, legacy or standard
+    :return: sorted list of lower case table names
+    """
+    tables = set()
+    for match in TABLE_REFERENCE.finditer(query):
+        groups = [group for group in match.groups() if group]
+        tables.add(('%s.%s' % (groups[0], groups[1])).lower())
+    return sorted(tables)
+
+
+def cache_key(query: str, project_id: str, use_legacy_sql: bool) -> str:
+    """
+    Key of a query in the cache.
+
+    :param query: sql query
+    :param project_id: project in which the query runs
+    :param use_legacy_sql: dialect of the query
+    :return: hex digest
+    """
+    dialect = 'legacy' if use_legacy_sql else 'standard'
+    text = '\n'.join([project_id or '', dialect, normalize_query(query)])
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class QueryResultCache:
+    """
+    On disk cache of query results.
+
+    Each result set is saved in its own file of JSON lines, a line
+    being a chunk [column names, list of value lists], so column names
+    are stored once per chunk instead of once per row. Files only hold
+    data: reading the cache never executes code, whoever wrote it.
+    An sqlite index keeps the expiration date, size, last access and
+    tables read by each entry. Entries are evicted, least recently used
+    first, when the files exceed max_bytes.
+    """
+
+    def __init__(self,
+                 directory: str,
+                 max_bytes: int = 1024 ** 3,
+                 default_ttl: float = 3600):
+        """
+        :param directory: local folder where results are kept
+        :param max_bytes: total size of the cached results
+        :param default_ttl: seconds a result is valid when no ttl is given
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS entries ('
+                       'key TEXT PRIMARY KEY, size INTEGER, expires REAL, '
+                       'accessed REAL, tables TEXT)')
+
+    def _connect(self):
+        return sqlite3.connect(os.path.join(self.directory, 'index.sqlite'),
+                               timeout=30)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + '.jsonl')
+
+    def get(self, key: str) -> Optional[Iterator[dict]]:
+        """
+        Look up a result set.
+
+        :param key: see cache_key()
+        :return: generator of rows or None if the key is missing or expired
+        """
+        now = time.time()
+        with self._lock, self._connect() as db:
+            entry = db.execute('SELECT expires FROM entries WHERE key = ?',
+                               (key,)).fetchone()
+            if entry is None:
+                return None
+            if entry[0] < now or not os.path.exists(self._path(key)):
+                self._remove(db, [key])
+                return None
+            db.execute('UPDATE entries SET accessed = ? WHERE key = ?', (now, key))
+        return self._read(self._path(key))
+
+    @staticmethod
+    def _read(path: str) -> Iterator[dict]:
+        try:
+            fin = open(path, 'rb')
+        except FileNotFoundError:
+            # evicted between the look up and the read
+            return
+        with fin:
+            for line in fin:
+                columns, values = json.loads(line)
+                for row in values:
+                    yield dict(zip(columns, row))
+
+    def store(self,
+              key: str,
+              rows: Iterable[dict],
+              ttl: float = None,
+              tables: List[str] = ()) -> Iterator[dict]:
+        """
+        Pass rows through while writing them to the cache. The entry is
+        added only once all rows have been consumed.
+
+        :param key: see cache_key()
+        :param rows: iterable of dicts
+        :param ttl: seconds the result is valid, defaults to default_ttl
+        :param tables: tables read by the query, used by invalidate()
+        :return: generator of the same rows
+        """
+        ttl = self.default_ttl if ttl is None else ttl
+        path = self._path(key)
+        tmp_path = '%s.%i.%i.tmp' % (path, os.getpid(), threading.get_ident())
+        complete = False
+        try:
+            with open(tmp_path, 'wb') as fout:
+                columns = None
+                chunk = []
+                for row in rows:
+                    keys = tuple(row.keys())
+                    if keys != columns or len(chunk) == CHUNK_ROWS:
+                        if chunk:
+                            fout.write(dumps([columns, chunk]) + b'\n')
+                        columns = keys
+                        chunk = []
+                    chunk.append(tuple(row.values()))
+                    yield row
+                if chunk:
+                    fout.write(dumps([columns, chunk]) + b'\n')
+            complete = True
+            self._commit(key, tmp_path, ttl, tables)
+        finally:
+            if not complete and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _commit(self, key, tmp_path, ttl, tables):
+        size = os.path.getsize(tmp_path)
+        if size > self.max_bytes:
+            os.remove(tmp_path)
+            return
+        now = time.time()
+        with self._lock, self._connect() as db:
+            os.replace(tmp_path, self._path(key))
+            db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                       (key, size, now + ttl, now, ',' + ','.join(tables) + ','))
+            self._evict(db)
+
+    def _evict(self, db):
+        expired = [key for key, in db.execute(
+            'SELECT key FROM entries WHERE expires < ?', (time.time(),))]
+        self._remove(db, expired)
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in db.execute('SELECT key, size FROM entries ORDER BY accessed'):
+            evicted.append(key)
+            total -= size
+            if total <= self.max_bytes:
+                break
+        self._remove(db, evicted)
+
+    def _remove(self, db, keys):
+        for key in keys:
+            db.execute('DELETE FROM entries WHERE key = ?', (key,))
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def invalidate(self, dataset: str, table: str = None) -> int:
+        """
+        Drop the entries of queries reading from a table, or from any
+        table of a dataset when table is None.
+
+        :param dataset: dataset name
+        :param table: table name
+        :return: number of entries dropped
+        """
+        name = dataset if table is None else '%s.%s' % (dataset, table)
+        name = name.lower().replace('_', '\\_')
+        pattern = '%%,%s.%%' % name if table is None else '%%,%s,%%' % name
+        with self._lock, self._connect() as db:
+            keys = [key for key, in db.execute(
+                "SELECT key FROM entries WHERE tables LIKE ? ESCAPE '\\'", (pattern,))]
+            self._remove(db, keys)
+        if keys:
+            logging.info('BQ: %i cached results dropped for %s.%s.'
+                         % (len(keys), dataset, table or '*'))
+        return len(keys)
+
+    def clear(self) -> None:
+        """
+        Drop every entry.
+        """
+        with self._lock, self._connect() as db:
+            keys = [key for key, in db.execute('SELECT key FROM entries')]
+            self._remove(db, keys)
@@ -0,0 +1,92 @@
+import threading
+import time
+from typing import Callable
+
+
+class MetadataCatalog:
+    """
+    In process cache of BigQuery metadata: datasets of the project,
+    tables of each dataset and table schemas. Entries expire after ttl
+    seconds and can be dropped at any time with invalidate() or
+    refresh(), so a connector creating or deleting objects never reads
+    stale metadata of its own changes. Each key has a generation, bumped
+    when it is invalidated: a value loaded while its key was invalidated
+    is returned to its caller but not kept, since it may predate the
+    change.
+
+    Keys are tuples:
+     * ('datasets',): datasets of the project
+     * ('tables', dataset): tables of a dataset
+     * ('schema', dataset, table): schema of a table
+    """
+
+    def __init__(self, ttl: float = 300, clock: Callable[[], float] = time.monotonic):
+        """
+        :param ttl: seconds an entry is valid, 0 disables the catalog
+        :param clock: callable returning the current time in seconds
+        """
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = {}
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def _generation(self, key: tuple) -> tuple:
+        return self._epoch, self._generations.setdefault(key, 0)
+
+    def _bump(self, key: tuple) -> None:
+        self._generations[key] = self._generations.get(key, 0) + 1
+
+    def get(self, key: tuple, loader: Callable[[], object]):
+        """
+        Value of a key, loaded with loader when missing or expired.
+
+        :param key: see class documentation
+        :param loader: callable fetching the value from BigQuery
+        :return: cached or freshly loaded value
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            generation = self._generation(key)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        value = loader()
+        if self.ttl > 0:
+            with self._lock:
+                # skipped when invalidated during the load
+                if self._generation(key) == generation:
+                    self._entries[key] = (now + self.ttl, value)
+        return value
+
+    def invalidate(self, dataset: str, table: str = None) -> None:
+        """
+        Drop the entries describing a table, or a whole dataset and its
+        tables when table is None.
+
+        :param dataset: dataset name
+        :param table: table name
+        """
+        with self._lock:
+            keys = [('tables', dataset)]
+            if table is None:
+                keys.append(('datasets',))
+                # every key looked up is in the generations, including
+                # the ones being loaded for the first time
+                keys += [key for key in self._generations
+                         if key[0] == 'schema' and key[1] == dataset]
+            else:
+                keys.append(('schema', dataset, table))
+            for key in keys:
+                self._entries.pop(key, None)
+                self._bump(key)
+
+    def refresh(self) -> None:
+        """
+        Drop every entry, the next look ups will reach BigQuery.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._generations.clear()
+            self._epoch += 1
@@ -0,0 +1,141 @@
+import json
+import logging
+import os
+import threading
+from typing import Callable
+
+# credentials and discovery documents shared by every connector of the
+# process, so that only the first client pays for them
+_credentials = {}
+_documents = {}
+_lock = threading.Lock()
+
+DISCOVERY_URL = 'https://www.googleapis.com/discovery/v1/apis/bigquery/v2/rest'
+
+
+def load_credentials(credentials_file: str, readonly: bool = True):
+    """
+    Service account credentials of a json key file, read once per file
+    and scope. The credentials object keeps its access token, so clients
+    built from it do not authenticate again until the token expires.
+
+    :param credentials_file: path to the service account json key
+    :param readonly: True for read only credentials
+    :return: tuple (credentials, project id of the key)
+    """
+    key = (os.path.abspath(credentials_file), readonly)
+    with _lock:
+        if key in _credentials:
+            return _credentials[key]
+    from bigquery.client import BIGQUERY_SCOPE, BIGQUERY_SCOPE_READ_ONLY
+    from oauth2client.service_account import ServiceAccountCredentials
+
+    with open(credentials_file) as fin:
+        json_key = json.load(fin)
+    scope = BIGQUERY_SCOPE_READ_ONLY if readonly else BIGQUERY_SCOPE
+    credentials = ServiceAccountCredentials.from_json_keyfile_dict(json_key, scopes=scope)
+    with _lock:
+        return _credentials.setdefault(key, (credentials, json_key.get('project_id')))
+
+
+def discovery_document(http) -> str:
+    """
+    Discovery document of the BigQuery API, downloaded once per process
+    instead of once per client.
+
+    :param http: authorized httplib2.Http
+    :return: json document
+    """
+    with _lock:
+        if DISCOVERY_URL in _documents:
+            return _documents[DISCOVERY_URL]
+    from googleapiclient.errors import HttpError
+
+    response, content = http.request(DISCOVERY_URL)
+    if response.status >= 400:
+        raise HttpError(response, content, uri=DISCOVERY_URL)
+    if isinstance(content, bytes):
+        content = content.decode('utf-8')
+    with _lock:
+        return _documents.setdefault(DISCOVERY_URL, content)
+
+
+def create_client(credentials_file: str,
+                  project_id: str = None,
+                  readonly: bool = True,
+                  swallow_results: bool = True):
+    """
+    Build a BigQuery-Python client. Same as bigquery.get_client(), with
+    credentials and the discovery document cached for the process.
+    bigquery and the Google API libraries are imported on the first call.
+
+    :param credentials_file: path to the service account json key
+    :param project_id: BigQuery project, defaults to the one of the key
+    :param readonly: True for a client without write permissions
+    :param swallow_results: False to get raw responses from the client
+    :return: bigquery.client.BigQueryClient
+    """
+    import httplib2
+    from bigquery.client import BigQueryClient
+    from googleapiclient.discovery import build_from_document
+
+    credentials, key_project_id = load_credentials(credentials_file, readonly)
+    http = credentials.authorize(httplib2.Http())
+    service = build_from_document(discovery_document(http), http=http)
+    logging.debug('BQ: new client for %s.' % (project_id or key_project_id))
+    return BigQueryClient(service, project_id or key_project_id, swallow_results)
+
+
+class ClientPool:
+    """
+    Clients created on first use by a factory: one per thread, as the
+    http connection of a client must not be shared between threads, or a
+    single one for all threads. Clients are never shared with a forked
+    worker process, which creates its own.
+    """
+
+    def __init__(self, factory: Callable[[], object], per_thread: bool = True):
+        """
+        :param factory: callable without arguments returning a new client
+        :param per_thread: False to share one client between all threads
+        """
+        self.factory = factory
+        self.per_thread = per_thread
+        self._local = threading.local()
+        self._shared = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def _new(self):
+        client = self.factory()
+        with self._lock:
+            self.created += 1
+        return client
+
+    def get(self):
+        """
+        :return: the client of the calling thread (or process)
+        """
+        if self._pid != os.getpid():
+            # forked worker: forget the clients of the parent
+            self.clear()
+        if not self.per_thread:
+            if self._shared is None:
+                with self._lock:
+                    if self._shared is None:
+                        self._shared = self.factory()
+                        self.created += 1
+            return self._shared
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self._new()
+        return client
+
+    def clear(self) -> None:
+        """
+        Forget all clients, new ones are created on next use.
+        """
+        self._local = threading.local()
+        self._shared = None
+        self._pid = os.getpid()
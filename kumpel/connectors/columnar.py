@@ -0,0 +1,135 @@
+from collections import OrderedDict
+from typing import Dict, List
+
+from .tabledata import decode_cell
+
+# numpy dtype of each BigQuery type, object for everything else
+NUMPY_TYPES = {
+    'INTEGER': 'int64',
+    'INT64': 'int64',
+    'FLOAT': 'float64',
+    'FLOAT64': 'float64',
+    'BOOLEAN': 'bool',
+    'BOOL': 'bool',
+    'TIMESTAMP': 'float64',
+    'DATE': 'datetime64[D]',
+    'DATETIME': 'datetime64[us]',
+}
+
+# value stored in place of a null, the null mask tells them apart
+FILL_VALUES = {
+    'int64': 0,
+    'float64': float('nan'),
+    'bool': False,
+    'datetime64[D]': 'NaT',
+    'datetime64[us]': 'NaT',
+}
+
+
+def numpy():
+    """
+    numpy is an optional dependency, only needed by the columnar API.
+    """
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError('The columnar API requires numpy, '
+                          'install it with: pip install kumpel[columnar]')
+    return numpy
+
+
+class ColumnBatch:
+    """
+    A batch of rows stored column by column: one numpy array per column
+    and one boolean array per column marking the null values.
+    """
+
+    def __init__(self, columns: Dict[str, object], masks: Dict[str, object]):
+        """
+        :param columns: ordered dict of column name -> numpy array
+        :param masks: dict of column name -> numpy bool array, True for nulls
+        """
+        self.columns = columns
+        self.masks = masks
+
+    def __len__(self):
+        for values in self.columns.values():
+            return len(values)
+        return 0
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __repr__(self):
+        return '<ColumnBatch %i rows x %i columns>' % (len(self), len(self.columns))
+
+
+def _convert(raw: list, field: dict):
+    np = numpy()
+    dtype = column_dtype(field)
+    if dtype == 'object':
+        if field.get('type') in ('RECORD', 'STRUCT') or field.get('mode') == 'REPEATED':
+            raw = [decode_cell(v, field) for v in raw]
+        column = np.empty(len(raw), dtype=object)
+        column[:] = raw
+        return column
+    fill = FILL_VALUES[dtype]
+    if dtype.startswith('datetime64'):
+        return np.array([fill if v is None else v.replace(' ', 'T') for v in raw],
+                        dtype=dtype)
+    if dtype == 'bool':
+        values = (v == 'true' or v is True for v in raw)
+    elif dtype == 'int64':
+        values = (fill if v is None else int(v) for v in raw)
+    else:
+        values = (fill if v is None else float(v) for v in raw)
+    return np.fromiter(values, dtype=dtype, count=len(raw))
+
+
+def column_dtype(field: dict) -> str:
+    """
+    numpy dtype used for a schema field.
+
+    :param field: schema field, dict with at least 'name' and 'type'
+    :return: dtype name
+    """
+    if field.get('mode') == 'REPEATED':
+        return 'object'
+    return NUMPY_TYPES.get(field.get('type'), 'object')
+
+
+def build_batch(raw_columns: List[list], fields: List[dict]) -> ColumnBatch:
+    """
+    Build a ColumnBatch from lists of raw values, one list per field,
+    None marking nulls.
+
+    :param raw_columns: list of lists of values, in the order of fields
+    :param fields: schema fields
+    :return: ColumnBatch
+    """
+    np = numpy()
+    columns = OrderedDict()
+    masks = {}
+    for raw, field in zip(raw_columns, fields):
+        masks[field['name']] = np.fromiter((v is None for v in raw),
+                                           dtype=bool, count=len(raw))
+        columns[field['name']] = _convert(raw, field)
+    return ColumnBatch(columns, masks)
+
+
+def decode_columns(rows: List[dict], fields: List[dict]) -> ColumnBatch:
+    """
+    Convert rows as returned by the API, {'f': [{'v': value}, ...]},
+    directly into typed columns.
+
+    :param rows: list of row resources
+    :param fields: schema fields, in the order of the values
+    :return: ColumnBatch
+    """
+    raw_columns = [[row['f'][index]['v'] for row in rows]
+                   for index in range(len(fields))]
+    return build_batch(raw_columns, fields)
+
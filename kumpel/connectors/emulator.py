@@ -0,0 +1,1113 @@
+"""
+Local emulation of BigQuery, backed by sqlite.
+
+LocalBigQueryClient implements the part of the BigQuery-Python client
+used by kumpel's BigQuery connector (datasets, tables, schemas,
+streaming inserts, query jobs and the raw tabledata/jobs resources), so
+the connector, its batching and its concurrency can run and be
+benchmarked on a laptop, without network. Each call can be slowed down
+by a simulated latency and limited by simulated quotas.
+
+Queries are executed by sqlite: table references such as [ds.table],
+`project.ds.table` or ds.table are translated, everything else must be
+sql that sqlite understands. The BigQuery functions TIMESTAMP_MICROS,
+COUNTIF, APPROX_COUNT_DISTINCT and APPROX_TOP_COUNT (as a json string)
+are available as well, and MERGE statements of the form
+
+    MERGE target T USING source S ON ...
+    WHEN MATCHED THEN UPDATE SET ...
+    WHEN NOT MATCHED THEN INSERT (...) VALUES (...)
+
+Tables created with time_partitioning are partitioned by ingestion day:
+rows are inserted in the partition of a table$YYYYMMDD decorator, or of
+the current day, which queries can filter on with _PARTITIONTIME.
+
+Load jobs read a newline delimited JSON file, given as media_body of
+jobs().insert, into a table or a table$YYYYMMDD partition; with
+WRITE_TRUNCATE, a partition decorator only replaces that partition.
+
+Extract jobs write CSV or newline delimited JSON files, gzipped or not,
+to a Storage (e.g. a LocalStorage directory), split in files of at most
+export_shard_rows rows for wildcard uris.
+"""
+import csv
+import gzip
+import io
+import json
+import logging
+import random
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Union
+
+from .batching import MAX_REQUEST_BYTES, MAX_REQUEST_ROWS, row_size
+from .export import Storage, shard_uri
+from .tabledata import decode_cell, decode_row, to_fields
+
+SQLITE_TYPES = {
+    'INTEGER': 'INTEGER',
+    'FLOAT': 'REAL',
+    'BOOLEAN': 'INTEGER',
+    'TIMESTAMP': 'REAL',
+}
+
+# python type of the values sqlite returns for each BigQuery type
+STORAGE_CLASSES = {
+    'INTEGER': int,
+    'BOOLEAN': int,
+    'FLOAT': float,
+    'TIMESTAMP': float,
+}
+
+TABLE_REFERENCE = re.compile(
+    r'\[(?:[\w\-]+:)?(\w+)\.(\w+)\]'
+    r'|`(?:[\w\-]+\.)?(\w+)\.(\w+)`'
+    r'|(?<=\s)(?:[\w\-]+:)?(\w+)\.(\w+)(?=\s|$|;|\))'
+)
+
+FROM_OR_JOIN = re.compile(r'\b(from|join)\s+$', re.IGNORECASE)
+
+# hidden column holding the partition of the rows of partitioned tables
+PARTITION_COLUMN = '_PARTITIONTIME'
+
+MERGE_STATEMENT = re.compile(
+    r'^\s*MERGE\s+(?:INTO\s+)?(?P<target>\S+)\s+(?:AS\s+)?(?P<t>\w+)\s+'
+    r'USING\s+(?P<source>\S+)\s+(?:AS\s+)?(?P<s>\w+)\s+'
+    r'ON\s+(?P<on>.+?)\s*'
+    r'(?:WHEN\s+MATCHED\s+THEN\s+UPDATE\s+SET\s+(?P<set>.+?)\s*)?'
+    r'(?:WHEN\s+NOT\s+MATCHED(?:\s+BY\s+TARGET)?\s+THEN\s+'
+    r'INSERT\s*\((?P<columns>.+?)\)\s*VALUES\s*\((?P<values>.+)\)\s*)?;?\s*$',
+    re.IGNORECASE | re.DOTALL
+)
+
+
+class EmulatedHttpError(Exception):
+    """
+    Error raised like googleapiclient's HttpError, with the http status
+    in resp.status, so callers can handle both the same way.
+    """
+
+    class _Response:
+        def __init__(self, status):
+            self.status = status
+
+    def __init__(self, status: int, message: str):
+        super().__init__('HttpError %i: %s' % (status, message))
+        self.resp = self._Response(status)
+
+
+class _Request:
+    """
+    Mimics a googleapiclient request: the call happens on execute().
+    """
+
+    def __init__(self, call, **kwargs):
+        self._call = call
+        self._kwargs = kwargs
+
+    def execute(self, num_retries=0):
+        return self._call(**self._kwargs)
+
+
+class _Resource:
+    def __init__(self, **methods):
+        self._methods = methods
+
+    def __getattr__(self, name):
+        try:
+            method = self._methods[name]
+        except KeyError:
+            raise AttributeError(name)
+        return lambda **kwargs: _Request(method, **kwargs)
+
+
+class _Service:
+    """
+    Stand in for the discovery service kept by BigQuery-Python in
+    client.bigquery, limited to the resources used by kumpel.
+    """
+
+    def __init__(self, client):
+        self._client = client
+
+    def jobs(self):
+        return _Resource(get=self._client._api_get_job,
+                         getQueryResults=self._client._api_query_results,
+                         insert=self._client._api_insert_job)
+
+    def tabledata(self):
+        return _Resource(list=self._client._api_list_rows,
+                         insertAll=self._client._api_insert_all)
+
+
+def _to_epoch(value) -> float:
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, datetime):
+        moment = value
+    else:
+        text = str(value).replace(' UTC', '').replace('Z', '').replace('T', ' ')
+        if len(text) == 10:
+            moment = datetime.strptime(text, '%Y-%m-%d')
+        else:
+            moment = datetime.strptime(text[:26], '%Y-%m-%d %H:%M:%S.%f'
+                                       if '.' in text else '%Y-%m-%d %H:%M:%S')
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def _today() -> float:
+    """
+    Start of the current day (UTC), partition of rows inserted without a
+    partition decorator.
+    """
+    return time.time() // 86400 * 86400
+
+
+def _store_value(value, field: dict):
+    """
+    Convert a value of an inserted row to its sqlite representation.
+    Raise ValueError or TypeError when the value does not fit the field.
+    """
+    if value is None:
+        return None
+    col_type = field.get('type')
+    if field.get('mode') == 'REPEATED' or col_type == 'RECORD':
+        return json.dumps(value, default=str)
+    if col_type == 'INTEGER':
+        if isinstance(value, float) and not value.is_integer():
+            raise ValueError('%r is not an integer' % value)
+        return int(value)
+    if col_type == 'FLOAT':
+        return float(value)
+    if col_type == 'BOOLEAN':
+        if isinstance(value, str):
+            if value.lower() not in ('true', 'false'):
+                raise ValueError('%r is not a boolean' % value)
+            return int(value.lower() == 'true')
+        return int(bool(value))
+    if col_type == 'TIMESTAMP':
+        return _to_epoch(value)
+    return str(value)
+
+
+def _api_value(value, field: dict):
+    """
+    Convert a stored value to the representation of the REST API.
+    """
+    if value is None:
+        return None
+    col_type = field.get('type')
+    if field.get('mode') == 'REPEATED':
+        items = json.loads(value) if isinstance(value, str) else value
+        item_field = dict(field, mode='NULLABLE')
+        return [{'v': _api_value(item, item_field)} for item in items]
+    if col_type == 'RECORD':
+        record = json.loads(value) if isinstance(value, str) else value
+        return {'f': [{'v': _api_value(record.get(sub['name']), sub)}
+                      for sub in field.get('fields', [])]}
+    if col_type == 'BOOLEAN':
+        return 'true' if value else 'false'
+    if col_type == 'FLOAT':
+        return repr(float(value))
+    return str(value)
+
+
+def _export_value(value, field: dict):
+    """
+    Convert a stored value to its representation in exported files:
+    INTEGER as strings (as BigQuery writes them in JSON) and TIMESTAMP
+    as 'YYYY-MM-DD HH:MM:SS[.ffffff] UTC'.
+    """
+    if value is None:
+        return None
+    col_type = field.get('type')
+    if field.get('mode') == 'REPEATED' or col_type == 'RECORD':
+        return decode_cell(_api_value(value, field), field)
+    if col_type == 'BOOLEAN':
+        return bool(value)
+    if col_type == 'INTEGER':
+        return str(int(value))
+    if col_type == 'FLOAT':
+        return float(value)
+    if col_type == 'TIMESTAMP':
+        text = datetime.fromtimestamp(value, timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f')
+        return '%s UTC' % text.rstrip('0').rstrip('.')
+    return value
+
+
+def _csv_value(value) -> str:
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def _infer_type(values) -> str:
+    for value in values:
+        if isinstance(value, bool):
+            return 'BOOLEAN'
+        if isinstance(value, int):
+            return 'INTEGER'
+        if isinstance(value, float):
+            return 'FLOAT'
+        if value is not None:
+            return 'STRING'
+    return 'STRING'
+
+
+class _CountIf:
+    def __init__(self):
+        self.count = 0
+
+    def step(self, value):
+        if value:
+            self.count += 1
+
+    def finalize(self):
+        return self.count
+
+
+class _ApproxCountDistinct:
+    def __init__(self):
+        self.values = set()
+
+    def step(self, value):
+        if value is not None:
+            self.values.add(value)
+
+    def finalize(self):
+        return len(self.values)
+
+
+class _ApproxTopCount:
+    def __init__(self):
+        self.counts = Counter()
+        self.size = 1
+
+    def step(self, value, size):
+        self.counts[value] += 1
+        self.size = size
+
+    def finalize(self):
+        return json.dumps([{'value': value, 'count': count}
+                           for value, count in self.counts.most_common(self.size)])
+
+
+FUNCTIONS = (
+    ('TIMESTAMP_MICROS', 1, lambda micros: None if micros is None else micros / 1000000),
+    ('TIMESTAMP', 1, lambda value: None if value is None else _to_epoch(value)),
+)
+
+AGGREGATES = (
+    ('COUNTIF', 1, _CountIf),
+    ('APPROX_COUNT_DISTINCT', 1, _ApproxCountDistinct),
+    ('APPROX_TOP_COUNT', 2, _ApproxTopCount),
+)
+
+
+class LocalBigQueryClient:
+    """
+    sqlite backed stand in for bigquery.client.BigQueryClient.
+
+    Every public call counts in self.calls and can be delayed by a
+    simulated latency. Simulated quotas reject insert requests above
+    max_request_bytes / max_request_rows (413) and calls above
+    max_calls_per_second (429), with EmulatedHttpError. A share
+    error_rate of the calls fails with a transient 503 error.
+
+    As in BigQuery-Python, push_rows, create_table, delete_table,
+    create_dataset and delete_dataset catch these errors and return False
+    when swallowing results (push_rows returns an insertErrors response
+    otherwise); the other methods and the raw API resources raise them.
+    """
+
+    def __init__(self,
+                 project_id: str = 'local',
+                 path: str = ':memory:',
+                 latency: Union[float, Dict[str, float]] = 0.0,
+                 job_latency: float = 0.0,
+                 max_request_bytes: int = MAX_REQUEST_BYTES,
+                 max_request_rows: int = MAX_REQUEST_ROWS,
+                 max_calls_per_second: float = None,
+                 swallow_results: bool = True,
+                 error_rate: float = 0.0,
+                 storage: Storage = None,
+                 export_shard_rows: int = 100000):
+        """
+        :param project_id: name of the emulated project
+        :param path: sqlite database file, ':memory:' for a throw away one
+        :param latency: seconds added to every call, or dict of seconds
+            per method name (e.g. {'push_rows': 0.2, 'query': 0.5})
+        :param job_latency: seconds a job stays running after submission
+        :param max_request_bytes: size above which push_rows is rejected
+        :param max_request_rows: rows above which push_rows is rejected
+        :param max_calls_per_second: calls above this rate are rejected,
+            None for no limit
+        :param swallow_results: same as for bigquery.get_client()
+        :param error_rate: probability of a call failing with a 503 error
+        :param storage: Storage extract jobs write to, None to reject them
+        :param export_shard_rows: maximum number of rows per file written
+            for a wildcard uri
+        """
+        self.project_id = project_id
+        self.latency = latency
+        self.job_latency = job_latency
+        self.max_request_bytes = max_request_bytes
+        self.max_request_rows = max_request_rows
+        self.max_calls_per_second = max_calls_per_second
+        self.swallow_results = swallow_results
+        self.error_rate = error_rate
+        self.storage = storage
+        self.export_shard_rows = export_shard_rows
+        self.calls = Counter()
+        self.bigquery = _Service(self)
+        self._jobs = {}
+        self._recent_calls = []
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        for name, arguments, function in FUNCTIONS:
+            self._db.create_function(name, arguments, function)
+        for name, arguments, aggregate in AGGREGATES:
+            self._db.create_aggregate(name, arguments, aggregate)
+        self._modified = {}
+        self._insert_ids = {}
+        self._db.execute('CREATE TABLE IF NOT EXISTS __datasets__ (dataset TEXT PRIMARY KEY)')
+        self._db.execute('CREATE TABLE IF NOT EXISTS __tables__ ('
+                         'dataset TEXT, tbl TEXT, schema TEXT, partitioning INTEGER, '
+                         'PRIMARY KEY (dataset, tbl))')
+
+    # -- simulation ------------------------------------------------------
+
+    def _call(self, method: str):
+        """
+        Account for a call: count it, apply quotas and latency.
+        """
+        with self._lock:
+            self.calls[method] += 1
+            if self.max_calls_per_second:
+                now = time.monotonic()
+                self._recent_calls = [t for t in self._recent_calls if now - t < 1]
+                if len(self._recent_calls) >= self.max_calls_per_second:
+                    raise EmulatedHttpError(429, 'Exceeded rate limits: too many '
+                                                 'api requests per second.')
+                self._recent_calls.append(now)
+        if self.error_rate and random.random() < self.error_rate:
+            raise EmulatedHttpError(503, 'backendError: Error encountered during '
+                                         'execution. Retrying may solve the problem.')
+        delay = self.latency.get(method, 0.0) if isinstance(self.latency, dict) else self.latency
+        if delay:
+            time.sleep(delay)
+
+    def _swallowed(self, call, failure):
+        """
+        Make a call the way the BigQuery-Python methods catching HttpError
+        do (push_rows, create_table, delete_table ...): the error is
+        logged and the call returns False when swallowing results,
+        failure otherwise. push_rows, with failure None, returns an
+        insertErrors entry without row index holding the error.
+        """
+        try:
+            return call()
+        except EmulatedHttpError as e:
+            logging.error('BQ emulator: %s' % e)
+            if self.swallow_results:
+                return False
+            if failure is None:
+                return {'insertErrors': [{'errors': [{'reason': 'httperror',
+                                                      'message': str(e)}]}]}
+            return failure
+
+    # -- metadata --------------------------------------------------------
+
+    @staticmethod
+    def _name(dataset: str, table: str) -> str:
+        return '"%s.%s"' % (dataset, table)
+
+    def _fields(self, dataset: str, table: str) -> List[dict]:
+        row = self._db.execute('SELECT schema FROM __tables__ WHERE dataset = ? AND tbl = ?',
+                               (dataset, table)).fetchone()
+        if row is None:
+            raise EmulatedHttpError(404, 'Not found: Table %s:%s.%s'
+                                    % (self.project_id, dataset, table))
+        return json.loads(row[0])
+
+    def _partition(self, dataset: str, table: str):
+        """
+        Split a table$YYYYMMDD decorator.
+
+        :return: tuple (table, partition time in seconds since epoch, None
+            without decorator, and False for tables not partitioned)
+        """
+        table, _, decorator = table.partition('$')
+        row = self._db.execute('SELECT partitioning FROM __tables__ WHERE dataset = ? AND tbl = ?',
+                               (dataset, table)).fetchone()
+        if row is None or not row[0]:
+            if decorator:
+                raise EmulatedHttpError(400, 'Invalid table decorator: %s.%s is not '
+                                             'partitioned.' % (dataset, table))
+            return table, False
+        if not decorator:
+            return table, None
+        try:
+            moment = datetime.strptime(decorator, '%Y%m%d')
+        except ValueError:
+            raise EmulatedHttpError(400, 'Invalid partition decorator: %s.' % decorator)
+        return table, moment.replace(tzinfo=timezone.utc).timestamp()
+
+    def _touch(self, dataset: str, table: str) -> None:
+        """
+        Record a change of a table, reported as lastModifiedTime.
+        """
+        now = int(time.time() * 1000)
+        previous = self._modified.get((dataset, table), 0)
+        self._modified[(dataset, table)] = max(now, previous + 1)
+
+    def get_datasets(self):
+        self._call('get_datasets')
+        with self._lock:
+            names = [name for name, in self._db.execute('SELECT dataset FROM __datasets__')]
+        return [{'datasetReference': {'datasetId': name, 'projectId': self.project_id}}
+                for name in names]
+
+    def check_dataset(self, dataset_id):
+        self._call('check_dataset')
+        with self._lock:
+            return self._db.execute('SELECT 1 FROM __datasets__ WHERE dataset = ?',
+                                    (dataset_id,)).fetchone() is not None
+
+    def create_dataset(self, dataset_id, friendly_name=None, description=None,
+                       access=None, location=None, project_id=None):
+        def create():
+            self._call('create_dataset')
+            with self._lock, self._db:
+                self._db.execute('INSERT OR IGNORE INTO __datasets__ VALUES (?)', (dataset_id,))
+            return True
+
+        return self._swallowed(create, {})
+
+    def delete_dataset(self, dataset_id, delete_contents=False, project_id=None):
+        def delete():
+            self._call('delete_dataset')
+            with self._lock, self._db:
+                tables = [t for t, in self._db.execute(
+                    'SELECT tbl FROM __tables__ WHERE dataset = ?', (dataset_id,))]
+                if tables and not delete_contents:
+                    raise EmulatedHttpError(400, 'Dataset %s is still in use' % dataset_id)
+                for table in tables:
+                    self._db.execute('DROP TABLE IF EXISTS %s' % self._name(dataset_id, table))
+                self._db.execute('DELETE FROM __tables__ WHERE dataset = ?', (dataset_id,))
+                self._db.execute('DELETE FROM __datasets__ WHERE dataset = ?', (dataset_id,))
+            return True
+
+        return self._swallowed(delete, {})
+
+    def get_all_tables(self, dataset_id, project_id=None):
+        self._call('get_all_tables')
+        with self._lock:
+            return [t for t, in self._db.execute('SELECT tbl FROM __tables__ WHERE dataset = ?',
+                                                 (dataset_id,))]
+
+    def check_table(self, dataset, table, project_id=None):
+        self._call('check_table')
+        with self._lock:
+            return self._db.execute('SELECT 1 FROM __tables__ WHERE dataset = ? AND tbl = ?',
+                                    (dataset, table)).fetchone() is not None
+
+    def get_table_schema(self, dataset, table, project_id=None):
+        self._call('get_table_schema')
+        with self._lock:
+            try:
+                return self._fields(dataset, table)
+            except EmulatedHttpError:
+                return None
+
+    def get_table(self, dataset, table, project_id=None):
+        self._call('get_table')
+        with self._lock:
+            try:
+                base, partition = self._partition(dataset, table)
+                fields = self._fields(dataset, base)
+            except EmulatedHttpError:
+                return {}
+            sql = 'SELECT count(1) FROM %s' % self._name(dataset, base)
+            if partition:
+                sql += ' WHERE "%s" = %r' % (PARTITION_COLUMN, partition)
+            count, = self._db.execute(sql).fetchone()
+        resource = {
+            'tableReference': {'projectId': self.project_id,
+                               'datasetId': dataset,
+                               'tableId': table},
+            'schema': {'fields': fields},
+            'numRows': str(count),
+            'lastModifiedTime': str(self._modified.get((dataset, base), 0)),
+        }
+        if partition is not False:
+            resource['timePartitioning'] = {'type': 'DAY'}
+        return resource
+
+    def create_table(self, dataset, table, schema, expiration_time=None,
+                     time_partitioning=False, project_id=None):
+        def create():
+            self._call('create_table')
+            with self._lock, self._db:
+                self._create_table(dataset, table, to_fields(schema), time_partitioning)
+            return True
+
+        return self._swallowed(create, {})
+
+    def _create_table(self, dataset, table, fields, time_partitioning=False):
+        if self._db.execute('SELECT 1 FROM __datasets__ WHERE dataset = ?',
+                            (dataset,)).fetchone() is None:
+            raise EmulatedHttpError(404, 'Not found: Dataset %s:%s' % (self.project_id, dataset))
+        columns = ', '.join('"%s" %s' % (field['name'], SQLITE_TYPES.get(field['type'], 'TEXT'))
+                            for field in fields)
+        if time_partitioning:
+            columns += ', "%s" REAL' % PARTITION_COLUMN
+        self._db.execute('CREATE TABLE %s (%s)' % (self._name(dataset, table), columns))
+        self._db.execute('INSERT INTO __tables__ VALUES (?, ?, ?, ?)',
+                         (dataset, table, json.dumps(fields), int(bool(time_partitioning))))
+        self._touch(dataset, table)
+
+    def delete_table(self, dataset, table, project_id=None):
+        def delete():
+            self._call('delete_table')
+            with self._lock, self._db:
+                self._db.execute('DROP TABLE IF EXISTS %s' % self._name(dataset, table))
+                self._db.execute('DELETE FROM __tables__ WHERE dataset = ? AND tbl = ?',
+                                 (dataset, table))
+                self._modified.pop((dataset, table), None)
+                self._insert_ids.pop((dataset, table), None)
+            return True
+
+        return self._swallowed(delete, {})
+
+    # -- streaming inserts -----------------------------------------------
+
+    def _insert_all(self, dataset, table, rows, insert_ids=None,
+                    skip_invalid_rows=None, ignore_unknown_values=None) -> List[dict]:
+        """
+        Insert rows like tabledata.insertAll. Rows with an insert id
+        already inserted in the table are dropped, as BigQuery does.
+
+        :return: list of insertErrors
+        """
+        if len(rows) > self.max_request_rows:
+            raise EmulatedHttpError(400, 'too many rows present in the request, '
+                                         'limit: %i' % self.max_request_rows)
+        if sum(row_size(row) for row in rows) > self.max_request_bytes:
+            raise EmulatedHttpError(413, 'Request payload size exceeds the limit: '
+                                         '%i bytes.' % self.max_request_bytes)
+        insert_ids = insert_ids or [None] * len(rows)
+        errors = []
+        with self._lock:
+            table, partition = self._partition(dataset, table)
+            fields = self._fields(dataset, table)
+            names = [field['name'] for field in fields]
+            by_name = {field['name']: field for field in fields}
+            seen = self._insert_ids.setdefault((dataset, table), set())
+            values = []
+            ids = set()
+            for index, (row, insert_id) in enumerate(zip(rows, insert_ids)):
+                unknown = set(row) - set(by_name)
+                if unknown and not ignore_unknown_values:
+                    errors.append({'index': index, 'errors': [
+                        {'reason': 'invalid', 'message': 'no such field: %s.'
+                                                         % ', '.join(sorted(unknown))}]})
+                    continue
+                try:
+                    value = [_store_value(row.get(name), by_name[name]) for name in names]
+                except (TypeError, ValueError) as e:
+                    errors.append({'index': index, 'errors': [
+                        {'reason': 'invalid', 'message': str(e)}]})
+                    continue
+                if insert_id is not None:
+                    if insert_id in seen or insert_id in ids:
+                        continue
+                    ids.add(insert_id)
+                if partition is not False:
+                    value.append(partition or _today())
+                values.append(value)
+            if errors and not skip_invalid_rows:
+                # BigQuery drops the whole request when a row is invalid,
+                # the valid rows being reported as stopped
+                invalid = {error['index'] for error in errors}
+                errors.extend({'index': index, 'errors': [{'reason': 'stopped', 'message': ''}]}
+                              for index in range(len(rows)) if index not in invalid)
+                errors.sort(key=lambda error: error['index'])
+                values = []
+                ids = set()
+            if values:
+                if partition is not False:
+                    names.append(PARTITION_COLUMN)
+                with self._db:
+                    self._db.executemany(
+                        'INSERT INTO %s (%s) VALUES (%s)'
+                        % (self._name(dataset, table), ', '.join('"%s"' % name for name in names),
+                           ', '.join('?' * len(names))),
+                        values)
+                seen.update(ids)
+                self._touch(dataset, table)
+        return errors
+
+    def push_rows(self, dataset, table, rows, insert_id_key=None,
+                  skip_invalid_rows=None, ignore_unknown_values=None,
+                  template_suffix=None, project_id=None):
+        def push():
+            self._call('push_rows')
+            insert_ids = None
+            if insert_id_key is not None:
+                insert_ids = [row.get(insert_id_key) for row in rows]
+            errors = self._insert_all(dataset, table + (template_suffix or ''), rows,
+                                      insert_ids, skip_invalid_rows, ignore_unknown_values)
+            response = {'kind': 'bigquery#tableDataInsertAllResponse'}
+            if errors:
+                response['insertErrors'] = errors
+            if self.swallow_results:
+                return not errors
+            return response
+
+        # the request errors are reported like BigQuery-Python does
+        return self._swallowed(push, None)
+
+    # -- query jobs ------------------------------------------------------
+
+    def _translate(self, query: str) -> str:
+        """
+        Turn BigQuery table references in sqlite quoted names.
+        """
+        def replace(match):
+            dataset, table = [group for group in match.groups() if group]
+            if match.group(0)[0] not in '[`' and not FROM_OR_JOIN.search(
+                    match.string[:match.start()]):
+                return match.group(0)
+            return self._name(dataset, table)
+        return TABLE_REFERENCE.sub(replace, query)
+
+    def _execute(self, query: str):
+        """
+        Run a select and return (fields, list of stored value tuples).
+        """
+        sql = self._translate(query).strip().rstrip(';')
+        with self._lock:
+            try:
+                cursor = self._db.execute(sql)
+            except sqlite3.Error as e:
+                raise EmulatedHttpError(400, 'Invalid query: %s' % e)
+            records = cursor.fetchall()
+            names = [column[0] for column in cursor.description or []]
+            if PARTITION_COLUMN in names:
+                # pseudo column, only returned under another name
+                kept = [index for index, name in enumerate(names) if name != PARTITION_COLUMN]
+                names = [names[index] for index in kept]
+                records = [tuple(record[index] for index in kept) for record in records]
+            known = {}
+            for dataset, table in set(re.findall(r'"(\w+)\.(\w+)"', sql)):
+                try:
+                    for field in self._fields(dataset, table):
+                        known.setdefault(field['name'], field)
+                except EmulatedHttpError:
+                    pass
+        fields = []
+        for index, name in enumerate(names):
+            sample = next((record[index] for record in records
+                           if record[index] is not None), None)
+            field = known.get(name)
+            if field is None or (sample is not None and not isinstance(
+                    sample, STORAGE_CLASSES.get(field['type'], str))):
+                # computed column, possibly named like a table column
+                field = {'name': name, 'type': _infer_type([sample]), 'mode': 'NULLABLE'}
+            fields.append(dict(field, name=name))
+        return fields, records
+
+    def _new_job(self, kind: str, fields=None, records=None, error=None, job_id=None,
+                 **extra):
+        job_id = job_id or 'job_%s' % uuid.uuid4().hex
+        job = {
+            'kind': kind,
+            'submitted': time.monotonic(),
+            'fields': fields or [],
+            'records': records or [],
+            'error': error,
+        }
+        job.update(extra)
+        with self._lock:
+            self._jobs[job_id] = job
+        return job_id
+
+    def _job(self, job_id: str) -> dict:
+        try:
+            return self._jobs[job_id]
+        except KeyError:
+            raise EmulatedHttpError(404, 'Not found: Job %s' % job_id)
+
+    def _done(self, job: dict) -> bool:
+        return time.monotonic() - job['submitted'] >= self.job_latency
+
+    def _merge(self, match) -> int:
+        """
+        Run a MERGE statement as an UPDATE ... FROM and an INSERT of the
+        source rows matching no target row before the update.
+
+        :return: number of rows updated or inserted
+        """
+        parts = match.groupdict()
+        target = '%s AS %s' % (parts['target'], parts['t'])
+        source = '%s AS %s' % (parts['source'], parts['s'])
+        with self._lock:
+            try:
+                with self._db:
+                    unmatched = [row[0] for row in self._db.execute(
+                        'SELECT %s.rowid FROM %s WHERE NOT EXISTS (SELECT 1 FROM %s WHERE %s)'
+                        % (parts['s'], source, target, parts['on']))]
+                    affected = 0
+                    if parts['set']:
+                        affected += self._db.execute(
+                            'UPDATE %s SET %s FROM %s WHERE %s'
+                            % (target, parts['set'], source, parts['on'])).rowcount
+                    if parts['columns'] and unmatched:
+                        affected += self._db.execute(
+                            'INSERT INTO %s (%s) SELECT %s FROM %s '
+                            'WHERE %s.rowid IN (SELECT value FROM json_each(?))'
+                            % (parts['target'], parts['columns'], parts['values'],
+                               source, parts['s']),
+                            (json.dumps(unmatched),)).rowcount
+            except sqlite3.Error as e:
+                raise EmulatedHttpError(400, 'Invalid query: %s' % e)
+            dataset, table = parts['target'].strip('"').split('.')
+            self._touch(dataset, table)
+        return affected
+
+    def query(self, query, max_results=None, timeout=0, dry_run=False,
+              use_legacy_sql=None, external_udf_uris=None):
+        self._call('query')
+        merge = MERGE_STATEMENT.match(self._translate(query))
+        if merge is not None:
+            affected = self._merge(merge)
+            statistics = {'query': {'numDmlAffectedRows': str(affected)}}
+            return self._new_job('query', resource={'statistics': statistics}), []
+        fields, records = self._execute(query)
+        job_id = self._new_job('query', fields, records)
+        return job_id, []
+
+    def check_job(self, job_id):
+        self._call('check_job')
+        job = self._job(job_id)
+        if not self._done(job):
+            return False, 0
+        if job['error']:
+            raise EmulatedHttpError(400, job['error'])
+        return True, len(job['records'])
+
+    def _api_rows(self, fields, records, offset, limit):
+        if limit is None:
+            limit = len(records)
+        return [{'f': [{'v': _api_value(value, field)} for value, field in zip(record, fields)]}
+                for record in records[offset:offset + limit]]
+
+    def get_query_rows(self, job_id, offset=None, limit=None, timeout=0):
+        self._call('get_query_rows')
+        job = self._job(job_id)
+        rows = self._api_rows(job['fields'], job['records'], offset or 0, limit)
+        return [decode_row(row, job['fields']) for row in rows]
+
+    def get_query_schema(self, job_id):
+        self._call('get_query_schema')
+        return self._job(job_id)['fields']
+
+    def write_to_table(self, query, dataset=None, table=None, external_udf_uris=None,
+                       allow_large_results=None, use_query_cache=None, priority=None,
+                       create_disposition=None, write_disposition=None,
+                       use_legacy_sql=None, maximum_billing_tier=None, flatten=None,
+                       project_id=None):
+        self._call('write_to_table')
+        error = None
+        records = []
+        try:
+            fields, records = self._execute(query)
+            with self._lock, self._db:
+                exists = self._db.execute(
+                    'SELECT 1 FROM __tables__ WHERE dataset = ? AND tbl = ?',
+                    (dataset, table)).fetchone() is not None
+                if not exists:
+                    self._create_table(dataset, table, fields)
+                else:
+                    target = self._fields(dataset, table)
+                    count, = self._db.execute('SELECT count(1) FROM %s'
+                                              % self._name(dataset, table)).fetchone()
+                    disposition = write_disposition or 'WRITE_EMPTY'
+                    if disposition == 'WRITE_EMPTY' and count:
+                        raise EmulatedHttpError(409, 'Already Exists: Table %s.%s'
+                                                % (dataset, table))
+                    if disposition == 'WRITE_TRUNCATE':
+                        _table, partition = self._partition(dataset, table)
+                        self._db.execute('DROP TABLE %s' % self._name(dataset, table))
+                        self._db.execute('DELETE FROM __tables__ WHERE dataset = ? AND tbl = ?',
+                                         (dataset, table))
+                        self._create_table(dataset, table, fields, partition is not False)
+                    elif [f['name'] for f in target] != [f['name'] for f in fields]:
+                        raise EmulatedHttpError(400, 'Invalid schema update.')
+                if records:
+                    names = ', '.join('"%s"' % field['name'] for field in fields)
+                    self._db.executemany(
+                        'INSERT INTO %s (%s) VALUES (%s)'
+                        % (self._name(dataset, table), names, ', '.join('?' * len(fields))),
+                        records)
+                    self._touch(dataset, table)
+        except EmulatedHttpError as e:
+            error = str(e)
+        job_id = self._new_job('query', records=records, error=error)
+        return {'jobReference': {'projectId': self.project_id, 'jobId': job_id}}
+
+    def export_data_to_uris(self, destination_uris, dataset, table, job=None,
+                            compression=None, destination_format=None,
+                            print_header=None, field_delimiter=None, project_id=None):
+        self._call('export_data_to_uris')
+        if isinstance(destination_uris, str):
+            destination_uris = [destination_uris]
+        destination_format = destination_format or 'CSV'
+        error = None
+        counts = []
+        try:
+            if self.storage is None:
+                raise EmulatedHttpError(400, 'No storage to export to, see '
+                                             'LocalBigQueryClient(storage=...).')
+            with self._lock:
+                table_name, partition = self._partition(dataset, table)
+                fields = self._fields(dataset, table_name)
+                columns = ', '.join('"%s"' % field['name'] for field in fields)
+                where = ''
+                if partition:
+                    where = ' WHERE "%s" = %r' % (PARTITION_COLUMN, partition)
+                records = self._db.execute('SELECT %s FROM %s%s' % (
+                    columns, self._name(dataset, table_name), where)).fetchall()
+            counts = self._export(records, fields, destination_uris, compression,
+                                  destination_format, print_header is not False,
+                                  field_delimiter or ',')
+        except EmulatedHttpError as e:
+            error = str(e)
+        resource = {
+            'configuration': {'extract': {
+                'destinationUris': destination_uris,
+                'sourceTable': {'projectId': self.project_id,
+                                'datasetId': dataset,
+                                'tableId': table},
+                'compression': compression or 'NONE',
+                'destinationFormat': destination_format,
+            }},
+            'statistics': {'extract': {
+                'destinationUriFileCounts': [str(count) for count in counts],
+            }},
+        }
+        job_id = self._new_job('extract', error=error, resource=resource)
+        return {'jobReference': {'projectId': self.project_id, 'jobId': job_id}}
+
+    def _export(self, records, fields, uris, compression, destination_format,
+                print_header, field_delimiter) -> List[int]:
+        """
+        Write the records of a table to files, as an extract job.
+
+        :return: number of files written per uri
+        """
+        if destination_format not in ('CSV', 'NEWLINE_DELIMITED_JSON'):
+            raise EmulatedHttpError(400, 'Export format %s is not supported by the emulator.'
+                                    % destination_format)
+        if destination_format == 'CSV' and any(field.get('mode') == 'REPEATED'
+                                               or field.get('type') == 'RECORD'
+                                               for field in fields):
+            raise EmulatedHttpError(400, 'Operation cannot be performed on a nested schema.')
+        if any('*' not in uri for uri in uris):
+            if len(uris) > 1:
+                raise EmulatedHttpError(400, 'Several destination uris must all '
+                                             'contain a wildcard.')
+            shards = [records]
+        else:
+            size = self.export_shard_rows
+            shards = [records[start:start + size]
+                      for start in range(0, len(records), size)] or [[]]
+        counts = [0] * len(uris)
+        for index, shard in enumerate(shards):
+            position = index % len(uris)
+            uri = shard_uri(uris[position], counts[position])
+            counts[position] += 1
+            with self.storage.open(uri, 'wb') as fileobj:
+                if (compression or 'NONE').upper() == 'GZIP':
+                    fileobj = gzip.GzipFile(fileobj=fileobj, mode='wb')
+                text = io.TextIOWrapper(fileobj, encoding='utf-8', newline='')
+                rows = ([_export_value(value, field) for value, field in zip(record, fields)]
+                        for record in shard)
+                if destination_format == 'CSV':
+                    writer = csv.writer(text, delimiter=field_delimiter, lineterminator='\n')
+                    if print_header:
+                        writer.writerow([field['name'] for field in fields])
+                    writer.writerows([_csv_value(value) for value in row] for row in rows)
+                else:
+                    for row in rows:
+                        text.write(json.dumps({field['name']: value
+                                               for field, value in zip(fields, row)
+                                               if value is not None}))
+                        text.write('\n')
+                text.close()
+        return counts
+
+    # -- raw API resources -----------------------------------------------
+
+    def _api_get_job(self, projectId, jobId):
+        self._call('jobs.get')
+        job = self._job(jobId)
+        status = {'state': 'DONE' if self._done(job) else 'RUNNING'}
+        if status['state'] == 'DONE' and job['error']:
+            status['errorResult'] = {'reason': 'invalid', 'message': job['error']}
+        resource = {'jobReference': {'projectId': projectId, 'jobId': jobId},
+                    'status': status}
+        resource.update(job.get('resource', {}))
+        return resource
+
+    def _api_insert_job(self, projectId, body, media_body=None, media_mime_type=None):
+        self._call('jobs.insert')
+        job_id = body.get('jobReference', {}).get('jobId')
+        with self._lock:
+            if job_id in self._jobs:
+                raise EmulatedHttpError(409, 'Already Exists: Job %s:%s' % (projectId, job_id))
+        load = body.get('configuration', {}).get('load')
+        if load is None:
+            raise EmulatedHttpError(400, 'Only load jobs can be inserted in the emulator.')
+        error = None
+        rows = 0
+        try:
+            rows = self._load(load, media_body)
+        except EmulatedHttpError as e:
+            error = str(e)
+        resource = {'configuration': {'load': load},
+                    'statistics': {'load': {'outputRows': str(rows)}}}
+        job_id = self._new_job('load', error=error, job_id=job_id, resource=resource)
+        return {'jobReference': {'projectId': projectId, 'jobId': job_id},
+                'configuration': {'load': load}}
+
+    def _load(self, load: dict, path: str) -> int:
+        """
+        Run a load job of a newline delimited JSON file, all or nothing.
+
+        :return: number of rows loaded
+        """
+        if load.get('sourceFormat') != 'NEWLINE_DELIMITED_JSON':
+            raise EmulatedHttpError(400, 'Only NEWLINE_DELIMITED_JSON loads are supported '
+                                         'by the emulator.')
+        destination = load['destinationTable']
+        dataset, table = destination['datasetId'], destination['tableId']
+        name = table.partition('$')[0]
+        with open(path, 'rb') as fin:
+            try:
+                rows = [json.loads(line) for line in fin if line.strip()]
+            except ValueError as e:
+                raise EmulatedHttpError(400, 'Error while reading data: %s' % e)
+        with self._lock, self._db:
+            exists = self._db.execute('SELECT 1 FROM __tables__ WHERE dataset = ? AND tbl = ?',
+                                      (dataset, name)).fetchone() is not None
+            if not exists:
+                if load.get('createDisposition', 'CREATE_IF_NEEDED') == 'CREATE_NEVER':
+                    raise EmulatedHttpError(404, 'Not found: Table %s:%s.%s'
+                                            % (self.project_id, dataset, name))
+                if not load.get('schema'):
+                    raise EmulatedHttpError(400, 'No schema specified on job or table.')
+                self._create_table(dataset, name, load['schema']['fields'],
+                                   'timePartitioning' in load)
+            name, partition = self._partition(dataset, table)
+            fields = self._fields(dataset, name)
+            names = [field['name'] for field in fields]
+            by_name = {field['name']: field for field in fields}
+            values = []
+            for index, row in enumerate(rows):
+                unknown = set(row) - set(by_name)
+                if unknown and not load.get('ignoreUnknownValues'):
+                    raise EmulatedHttpError(400, 'Error while reading data, row %i: no such '
+                                                 'field: %s.' % (index, ', '.join(sorted(unknown))))
+                try:
+                    value = [_store_value(row.get(column), by_name[column]) for column in names]
+                except (TypeError, ValueError) as e:
+                    raise EmulatedHttpError(400, 'Error while reading data, row %i: %s'
+                                            % (index, e))
+                if partition is not False:
+                    value.append(partition or _today())
+                values.append(value)
+            where = ''
+            if partition:
+                where = ' WHERE "%s" = %r' % (PARTITION_COLUMN, partition)
+            count, = self._db.execute('SELECT count(1) FROM %s%s'
+                                      % (self._name(dataset, name), where)).fetchone()
+            disposition = load.get('writeDisposition', 'WRITE_APPEND')
+            if disposition == 'WRITE_EMPTY' and count:
+                raise EmulatedHttpError(409, 'Already Exists: Table %s.%s' % (dataset, table))
+            if disposition == 'WRITE_TRUNCATE':
+                self._db.execute('DELETE FROM %s%s' % (self._name(dataset, name), where))
+            if partition is not False:
+                names.append(PARTITION_COLUMN)
+            self._db.executemany(
+                'INSERT INTO %s (%s) VALUES (%s)'
+                % (self._name(dataset, name), ', '.join('"%s"' % column for column in names),
+                   ', '.join('?' * len(names))),
+                values)
+            self._touch(dataset, name)
+        return len(values)
+
+    def _api_query_results(self, projectId, jobId, startIndex=0, maxResults=None,
+                           timeoutMs=None, pageToken=None):
+        self._call('jobs.getQueryResults')
+        job = self._job(jobId)
+        complete = self._done(job)
+        response = {
+            'jobReference': {'projectId': projectId, 'jobId': jobId},
+            'jobComplete': complete,
+            'schema': {'fields': job['fields']},
+        }
+        if complete:
+            response['totalRows'] = str(len(job['records']))
+            response['rows'] = self._api_rows(job['fields'], job['records'],
+                                              int(startIndex or 0), maxResults)
+        return response
+
+    def _api_list_rows(self, projectId, datasetId, tableId, startIndex=0,
+                       maxResults=None, selectedFields=None, pageToken=None):
+        self._call('tabledata.list')
+        with self._lock:
+            tableId, partition = self._partition(datasetId, tableId)
+            fields = self._fields(datasetId, tableId)
+            if selectedFields:
+                selected = selectedFields.split(',')
+                fields = [field for field in fields if field['name'] in selected]
+            columns = ', '.join('"%s"' % field['name'] for field in fields)
+            where = ''
+            if partition:
+                where = ' WHERE "%s" = %r' % (PARTITION_COLUMN, partition)
+            sql = 'SELECT %s FROM %s%s LIMIT ? OFFSET ?' % (columns,
+                                                             self._name(datasetId, tableId),
+                                                             where)
+            limit = -1 if maxResults is None else int(maxResults)
+            records = self._db.execute(sql, (limit, int(startIndex or 0))).fetchall()
+            count, = self._db.execute('SELECT count(1) FROM %s%s'
+                                      % (self._name(datasetId, tableId), where)).fetchone()
+        return {
+            'kind': 'bigquery#tableDataList',
+            'totalRows': str(count),
+            'rows': self._api_rows(fields, records, 0, None),
+        }
+
+    def _api_insert_all(self, projectId, datasetId, tableId, body):
+        self._call('tabledata.insertAll')
+        items = body.get('rows') or []
+        errors = self._insert_all(datasetId, tableId,
+                                  rows=[item.get('json') or {} for item in items],
+                                  insert_ids=[item.get('insertId') for item in items],
+                                  skip_invalid_rows=body.get('skipInvalidRows'),
+                                  ignore_unknown_values=body.get('ignoreUnknownValues'))
+        response = {'kind': 'bigquery#tableDataInsertAllResponse'}
+        if errors:
+            response['insertErrors'] = errors
+        return response
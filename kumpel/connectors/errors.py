@@ -0,0 +1,28 @@
+class BigQueryError(Exception):
+    """
+    Abstract Exception for BigQuery.
+    """
+
+    def __init__(self, expression, message):
+        self.expression = expression
+        self.message = message
+
+
+class BigQuerySchemaParsingError(BigQueryError):
+    pass
+
+
+class BigQueryJobError(BigQueryError):
+    pass
+
+
+class BigQueryJobTimeout(BigQueryJobError):
+    pass
+
+
+class BigQueryRowError(BigQueryError):
+    pass
+
+
+class SchemaFileNotFound(FileNotFoundError):
+    pass
@@ -0,0 +1,402 @@
+import calendar
+import csv
+import fnmatch
+import gzip
+import io
+import json
+import os
+import queue
+import shutil
+import tempfile
+import threading
+from abc import ABCMeta, abstractmethod
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import Callable, Iterator, List
+
+EXPORT_FORMATS = ('CSV', 'NEWLINE_DELIMITED_JSON', 'AVRO')
+
+# rows of a shard decoded at once by a worker
+CHUNK_ROWS = 10000
+
+# bytes of a downloaded shard kept in memory before spilling to disk
+SPOOL_BYTES = 64 * 1024 * 1024
+
+ExportJob = namedtuple('ExportJob', ['job_id', 'uris', 'files', 'fields', 'destination_format',
+                                     'compression', 'field_delimiter', 'print_header', 'elapsed'])
+ExportJob.__doc__ = """
+Completed export of a table to storage:
+
+ * job_id: id of the extract job,
+ * uris: destination uris given to the job, possibly with a wildcard,
+ * files: uris of the files written, in shard order,
+ * fields: schema fields of the exported table,
+ * destination_format, compression, field_delimiter, print_header: the
+   options of the export, needed to decode the files,
+ * elapsed: seconds from submission to completion of the job.
+"""
+
+
+def parse_uri(uri: str):
+    """
+    :param uri: gs://bucket/path
+    :return: tuple (bucket, path)
+    """
+    if not uri.startswith('gs://'):
+        raise ValueError('Storage uris must start with gs://, got %s' % uri)
+    bucket, _sep, path = uri[len('gs://'):].partition('/')
+    return bucket, path
+
+
+def shard_uri(uri: str, shard: int) -> str:
+    """
+    Name of a file written by BigQuery for a wildcard uri.
+
+    :param uri: destination uri, with at most one '*'
+    :param shard: index of the file
+    :return: uri with the wildcard replaced by the 12 digit shard index
+    """
+    return uri.replace('*', '%012d' % shard, 1)
+
+
+class Storage(metaclass=ABCMeta):
+    """
+    Object storage the exports are written to and read from. GCSStorage
+    is Google Cloud Storage, LocalStorage a local directory standing in
+    for it in tests and with the emulator.
+    """
+
+    @abstractmethod
+    def list(self, uri: str) -> List[str]:
+        """
+        :param uri: gs://bucket/path, possibly with '*' wildcards
+        :return: sorted uris of the existing files matching it
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def open(self, uri: str, mode: str = 'rb'):
+        """
+        :param uri: gs://bucket/path
+        :param mode: 'rb' or 'wb'
+        :return: binary file object
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, uri: str) -> None:
+        raise NotImplementedError
+
+    def download(self, uri: str, path: str) -> str:
+        """
+        Copy a file to the local filesystem.
+
+        :param uri: gs://bucket/path
+        :param path: local file
+        :return: path
+        """
+        with self.open(uri) as fin, open(path, 'wb') as fout:
+            shutil.copyfileobj(fin, fout)
+        return path
+
+
+class LocalStorage(Storage):
+    """
+    Storage in a local directory: gs://bucket/path is the file
+    root/bucket/path. Without root, a temporary directory is created on
+    first use.
+    """
+
+    def __init__(self, root: str = None):
+        """
+        :param root: directory holding one directory per bucket
+        """
+        self.root = root
+        self._lock = threading.Lock()
+
+    def _path(self, uri: str) -> str:
+        if self.root is None:
+            with self._lock:
+                if self.root is None:
+                    self.root = tempfile.mkdtemp(prefix='kumpel-storage-')
+        bucket, path = parse_uri(uri)
+        return os.path.join(self.root, bucket, *path.split('/'))
+
+    def list(self, uri: str) -> List[str]:
+        bucket, pattern = parse_uri(uri)
+        base = self._path('gs://%s' % bucket)
+        uris = []
+        for directory, _dirs, files in os.walk(base):
+            for name in files:
+                path = os.path.relpath(os.path.join(directory, name), base).replace(os.sep, '/')
+                if fnmatch.fnmatchcase(path, pattern):
+                    uris.append('gs://%s/%s' % (bucket, path))
+        return sorted(uris)
+
+    def open(self, uri: str, mode: str = 'rb'):
+        path = self._path(uri)
+        if 'w' in mode:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        return open(path, mode)
+
+    def delete(self, uri: str) -> None:
+        os.remove(self._path(uri))
+
+
+class GCSStorage(Storage):
+    """
+    Google Cloud Storage, through the google-cloud-storage library, an
+    optional dependency imported on first use.
+    """
+
+    def __init__(self, credentials_file: str = None, project_id: str = None, client=None):
+        """
+        :param credentials_file: path to the service account json key,
+            None for the default credentials
+        :param project_id: project of the buckets
+        :param client: already built google.cloud.storage.Client
+        """
+        self.credentials_file = credentials_file
+        self.project_id = project_id
+        self._client = client
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        with self._lock:
+            if self._client is None:
+                try:
+                    from google.cloud import storage
+                except ImportError:
+                    raise ImportError('Exports to Google Cloud Storage require '
+                                      'google-cloud-storage, install it with: '
+                                      'pip install kumpel[storage]')
+                if self.credentials_file:
+                    self._client = storage.Client.from_service_account_json(
+                        self.credentials_file, project=self.project_id)
+                else:
+                    self._client = storage.Client(project=self.project_id)
+        return self._client
+
+    def _blob(self, uri: str):
+        bucket, path = parse_uri(uri)
+        return self.client.bucket(bucket).blob(path)
+
+    def list(self, uri: str) -> List[str]:
+        bucket, pattern = parse_uri(uri)
+        prefix = pattern.split('*', 1)[0]
+        return sorted('gs://%s/%s' % (bucket, blob.name)
+                      for blob in self.client.list_blobs(bucket, prefix=prefix)
+                      if fnmatch.fnmatchcase(blob.name, pattern))
+
+    def open(self, uri: str, mode: str = 'rb'):
+        if mode != 'rb':
+            raise ValueError('GCSStorage files can only be opened for reading.')
+        fileobj = tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES)
+        self._blob(uri).download_to_file(fileobj)
+        fileobj.seek(0)
+        return fileobj
+
+    def delete(self, uri: str) -> None:
+        self._blob(uri).delete()
+
+    def download(self, uri: str, path: str) -> str:
+        self._blob(uri).download_to_filename(path)
+        return path
+
+
+def _timestamp(value) -> float:
+    """
+    :param value: exported TIMESTAMP, e.g. '2017-01-01 12:00:00.5 UTC'
+    :return: seconds since epoch, as the API returns it
+    """
+    if isinstance(value, datetime):
+        return calendar.timegm(value.utctimetuple()) + value.microsecond / 1e6
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = value.replace(' UTC', '').replace('T', ' ').rstrip('Z')
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    seconds, _sep, fraction = text.partition('.')
+    parsed = datetime.strptime(seconds, '%Y-%m-%d %H:%M:%S')
+    return calendar.timegm(parsed.timetuple()) + (float('0.' + fraction) if fraction else 0.0)
+
+
+def _to_api(value, field: dict, repeated: bool = True):
+    """
+    Exported value (JSON or Avro) in the form of the cells returned by
+    the API, so it is decoded by decode_cell like any result.
+    """
+    if value is None:
+        return None
+    if repeated and field.get('mode') == 'REPEATED':
+        return [{'v': _to_api(item, field, False)} for item in value]
+    col_type = field.get('type')
+    if col_type in ('RECORD', 'STRUCT'):
+        return {'f': [{'v': _to_api(value.get(sub['name']), sub)}
+                      for sub in field.get('fields', [])]}
+    if col_type == 'TIMESTAMP':
+        return _timestamp(value)
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    return value
+
+
+def _csv_cells(fileobj, fields: List[dict], export: ExportJob) -> Iterator[list]:
+    text = io.TextIOWrapper(fileobj, encoding='utf-8', newline='')
+    reader = csv.reader(text, delimiter=export.field_delimiter or ',')
+    if export.print_header is not False:
+        next(reader, None)
+    timestamps = [position for position, field in enumerate(fields)
+                  if field.get('type') == 'TIMESTAMP']
+    for values in reader:
+        # BigQuery writes nulls as empty values
+        cells = [value if value != '' else None for value in values]
+        for position in timestamps:
+            if cells[position] is not None:
+                cells[position] = _timestamp(cells[position])
+        yield cells
+
+
+def _json_cells(fileobj, fields: List[dict]) -> Iterator[list]:
+    for line in io.TextIOWrapper(fileobj, encoding='utf-8'):
+        if line.strip():
+            row = json.loads(line)
+            yield [_to_api(row.get(field['name']), field) for field in fields]
+
+
+def _avro_cells(fileobj, fields: List[dict]) -> Iterator[list]:
+    try:
+        import fastavro
+    except ImportError:
+        raise ImportError('Reading AVRO exports requires fastavro, '
+                          'install it with: pip install fastavro')
+    for row in fastavro.reader(fileobj):
+        yield [_to_api(row.get(field['name']), field) for field in fields]
+
+
+def shard_cells(fileobj, export: ExportJob) -> Iterator[list]:
+    """
+    Decode an exported file.
+
+    :param fileobj: binary file object of the file
+    :param export: ExportJob the file belongs to
+    :return: generator of rows as lists of cell values, in the form of
+        the API (see tabledata.decode_cell), in the order of the fields
+    """
+    fields = export.fields
+    if export.destination_format == 'AVRO':
+        # avro blocks carry their own compression
+        return _avro_cells(fileobj, fields)
+    if (export.compression or 'NONE').upper() == 'GZIP':
+        fileobj = gzip.GzipFile(fileobj=fileobj, mode='rb')
+    if export.destination_format == 'NEWLINE_DELIMITED_JSON':
+        return _json_cells(fileobj, fields)
+    return _csv_cells(fileobj, fields, export)
+
+
+_DONE = object()
+
+
+class ShardReader:
+    """
+    Read the files of an export on a thread pool. Each worker downloads
+    a file, decodes it and converts its rows in chunks, up to read_ahead
+    chunks ahead of the consumer, while the chunks are still yielded in
+    the order of the files.
+    """
+
+    def __init__(self, storage: Storage, export: ExportJob, workers: int = 4,
+                 read_ahead: int = 2, chunk_rows: int = CHUNK_ROWS):
+        """
+        :param storage: Storage holding the files
+        :param export: ExportJob
+        :param workers: number of files read at the same time
+        :param read_ahead: maximum number of chunks of a file decoded and
+            not yet consumed
+        :param chunk_rows: number of rows per chunk
+        """
+        if workers < 1 or read_ahead < 1 or chunk_rows < 1:
+            raise ValueError('workers, read_ahead and chunk_rows must be positive integers.')
+        self.storage = storage
+        self.export = export
+        self.workers = workers
+        self.read_ahead = read_ahead
+        self.chunk_rows = chunk_rows
+
+    def chunks(self, convert: Callable[[List[list]], object] = list) -> Iterator:
+        """
+        :param convert: callable applied by the workers to each list of
+            rows (lists of cells) before it is yielded
+        :return: generator of converted chunks, in order
+        """
+        files = list(self.export.files)
+        queues = [queue.Queue(self.read_ahead) for _ in files]
+        stop = threading.Event()
+
+        def put(chunks, item):
+            while not stop.is_set():
+                try:
+                    chunks.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def read(index):
+            chunks = queues[index]
+            try:
+                if stop.is_set():
+                    return
+                with self.storage.open(files[index]) as fileobj:
+                    chunk = []
+                    for cells in shard_cells(fileobj, self.export):
+                        chunk.append(cells)
+                        if len(chunk) >= self.chunk_rows:
+                            if not put(chunks, convert(chunk)):
+                                return
+                            chunk = []
+                    if chunk and not put(chunks, convert(chunk)):
+                        return
+                put(chunks, _DONE)
+            except BaseException as e:
+                put(chunks, e)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                for index in range(len(files)):
+                    pool.submit(read, index)
+                for chunks in queues:
+                    while True:
+                        item = chunks.get()
+                        if item is _DONE:
+                            break
+                        if isinstance(item, BaseException):
+                            raise item
+                        yield item
+            finally:
+                stop.set()
+
+
+def download_files(storage: Storage, uris: List[str], directory: str,
+                   workers: int = 4) -> List[str]:
+    """
+    Download files concurrently into a local directory.
+
+    :param storage: Storage holding the files
+    :param uris: uris of the files
+    :param directory: created if it does not exist
+    :param workers: number of files downloaded at the same time
+    :return: local paths, in the order of uris
+    """
+    os.makedirs(directory, exist_ok=True)
+    paths = [os.path.join(directory, parse_uri(uri)[1].rsplit('/', 1)[-1]) for uri in uris]
+    if len(set(paths)) < len(paths):
+        # same file name in several folders
+        paths = [os.path.join(directory, '%05d-%s' % (index, os.path.basename(path)))
+                 for index, path in enumerate(paths)]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(storage.download, uris, paths))
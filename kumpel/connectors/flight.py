@@ -0,0 +1,192 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Iterator, List, Tuple
+
+from .paging import PagePrefetcher, read_range
+
+
+class SharedQuery:
+    """
+    A query job shared by the callers running the same query at the
+    same time. The job is submitted by the first caller only; the others
+    wait for it and read the same result. Each page of the result is
+    downloaded once and kept in memory for the other readers, within
+    max_rows rows: pages all readers went past are dropped first, and a
+    reader missing a page dropped to stay under the limit downloads it
+    again.
+
+    Rows are shared between the readers and must not be modified.
+    """
+
+    def __init__(self, key: str, page_size: int = 1000, max_rows: int = 100000):
+        """
+        :param key: normalized query, see cache.cache_key()
+        :param page_size: number of rows per page, the same for all readers
+        :param max_rows: maximum number of rows kept in memory
+        """
+        self.key = key
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.job_id = None
+        self.row_count = None
+        self.error = None
+        self.readers = 0
+        self.downloads = 0
+        self._ready = threading.Event()
+        self._cond = threading.Condition()
+        self._pages = OrderedDict()
+        self._buffered = 0
+        self._fetching = set()
+        self._cursors = {}
+
+    def start(self, run: Callable[[], Tuple[str, int]]) -> None:
+        """
+        Run the job, called by the first caller only.
+
+        :param run: callable submitting the job and waiting for it,
+            returning (job id, number of rows)
+        """
+        try:
+            self.job_id, self.row_count = run()
+        except BaseException as e:
+            self.error = e
+            raise
+        finally:
+            self._ready.set()
+
+    def wait(self) -> Tuple[str, int]:
+        """
+        Block until the job is complete, raise the error of the job if
+        it failed.
+
+        :return: tuple (job id, number of rows)
+        """
+        self._ready.wait()
+        if self.error is not None:
+            raise self.error
+        return self.job_id, self.row_count
+
+    def page(self, offset: int, limit: int, fetch: Callable[[int, int], List[dict]]) -> List[dict]:
+        """
+        Rows of a page, downloaded by the first reader asking for it.
+        Other readers asking for it meanwhile wait for that download.
+
+        :param offset: index of the first row of the page
+        :param limit: number of rows of the page
+        :param fetch: callable (offset, limit) downloading rows
+        :return: list of rows
+        """
+        with self._cond:
+            while offset in self._fetching:
+                self._cond.wait()
+            page = self._pages.get(offset)
+            if page is not None:
+                return page
+            self._fetching.add(offset)
+        try:
+            page = read_range(fetch, offset, limit)
+        finally:
+            with self._cond:
+                self._fetching.discard(offset)
+                self._cond.notify_all()
+        with self._cond:
+            self.downloads += 1
+            self._pages[offset] = page
+            self._buffered += len(page)
+            self._evict()
+        return page
+
+    def _evict(self) -> None:
+        if self._buffered <= self.max_rows:
+            return
+        passed = min(self._cursors.values()) if self._cursors else 0
+        for offset in sorted(self._pages):
+            page = self._pages[offset]
+            if self._buffered <= self.max_rows or offset + len(page) > passed:
+                break
+            del self._pages[offset]
+            self._buffered -= len(page)
+        while self._buffered > self.max_rows and len(self._pages) > 1:
+            # a slow reader downloads these pages again
+            _offset, page = self._pages.popitem(last=False)
+            self._buffered -= len(page)
+
+    def read(self, fetch: Callable[[int, int], List[dict]],
+             workers: int = 2, read_ahead: int = None) -> Iterator[dict]:
+        """
+        Independent iterator over the result, from its first row.
+
+        :param fetch: callable (offset, limit) downloading rows of the job
+        :param workers: number of pages downloaded at the same time
+        :param read_ahead: maximum number of pages downloaded and not yet
+            consumed, defaults to 2 * workers
+        :return: generator of rows
+        """
+        reader = object()
+        with self._cond:
+            self._cursors[reader] = 0
+        try:
+            _job_id, row_count = self.wait()
+            pages = PagePrefetcher(lambda offset, limit: self.page(offset, limit, fetch),
+                                   row_count=row_count,
+                                   page_size=self.page_size,
+                                   workers=workers,
+                                   read_ahead=read_ahead)
+            offset = 0
+            for page in pages.pages():
+                offset += len(page)
+                with self._cond:
+                    self._cursors[reader] = offset
+                for row in page:
+                    yield row
+        finally:
+            with self._cond:
+                del self._cursors[reader]
+
+
+class SingleFlight:
+    """
+    Registry of the queries running in a process, so that callers
+    running a query already running attach to its job instead of
+    submitting another one. A query leaves the registry once its last
+    reader is done; calls made after that run a new job.
+    """
+
+    def __init__(self, max_rows: int = 100000):
+        """
+        :param max_rows: maximum number of rows kept in memory per query
+        """
+        self.max_rows = max_rows
+        self.submitted = 0
+        self.joined = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def join(self, key: str, page_size: int = 1000) -> Tuple[SharedQuery, bool]:
+        """
+        :param key: normalized query, see cache.cache_key()
+        :param page_size: number of rows per page if the query is new
+        :return: tuple (SharedQuery, True if the caller must start its job)
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = SharedQuery(key, page_size, self.max_rows)
+                self.submitted += 1
+            else:
+                self.joined += 1
+            flight.readers += 1
+        return flight, leader
+
+    def leave(self, flight: SharedQuery) -> None:
+        """
+        Called by each caller of join() once it is done reading.
+        """
+        with self._lock:
+            flight.readers -= 1
+            if flight.readers == 0 and self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+
+    def __len__(self) -> int:
+        return len(self._flights)
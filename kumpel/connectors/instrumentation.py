@@ -0,0 +1,260 @@
+import io
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter, time
+
+
+class CallEvent:
+    """
+    Structured description of a call made by a connector to its backend.
+
+     * method: name of the client call ('push_rows', 'query', ...)
+     * dataset, table: target of the call, when known
+     * job_id: id of the job the call belongs to, when known
+     * rows: number of rows sent or received
+     * bytes: number of bytes sent or received, when known
+     * retries: number of times the call was retried
+     * queue_wait: seconds the call waited before being sent
+     * network_time: seconds spent in the call
+     * poll_time: seconds spent checking the status of a job
+     * error: class name of the exception raised by the call, if any
+     * timestamp: epoch of the end of the call
+    """
+
+    __slots__ = ('method', 'dataset', 'table', 'job_id', 'rows', 'bytes',
+                 'retries', 'queue_wait', 'network_time', 'poll_time',
+                 'error', 'timestamp')
+
+    def __init__(self, method, dataset=None, table=None, job_id=None, rows=None,
+                 bytes=None, retries=0, queue_wait=0.0, network_time=0.0,
+                 poll_time=0.0, error=None, timestamp=None):
+        self.method = method
+        self.dataset = dataset
+        self.table = table
+        self.job_id = job_id
+        self.rows = rows
+        self.bytes = bytes
+        self.retries = retries
+        self.queue_wait = queue_wait
+        self.network_time = network_time
+        self.poll_time = poll_time
+        self.error = error
+        self.timestamp = time() if timestamp is None else timestamp
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return '<CallEvent %s>' % ', '.join('%s=%r' % item for item in self.as_dict().items()
+                                            if item[1] is not None)
+
+
+class Hook:
+    """
+    Base class of instrumentation hooks. Hooks are attached to a
+    connector with add_hook() and receive an event after every call.
+    on_event is called from the thread which made the call, so hooks
+    must be thread safe and fast.
+    """
+
+    def on_event(self, event: CallEvent) -> None:
+        raise NotImplementedError
+
+
+class Instrumented:
+    """
+    Mixin giving a connector instrumentation hooks. When no hook is
+    attached, api_call() only adds a function call and a truth test.
+    With a throttle (see throttling.Throttle), every call goes through it.
+    """
+
+    hooks = ()
+    throttle = None
+
+    def add_hook(self, hook: Hook) -> Hook:
+        """
+        Attach a hook to the connector.
+
+        :param hook: Hook instance
+        :return: the same hook
+        """
+        self.hooks = tuple(self.hooks) + (hook,)
+        return hook
+
+    def remove_hook(self, hook: Hook) -> None:
+        self.hooks = tuple(h for h in self.hooks if h is not hook)
+
+    def emit(self, event: CallEvent) -> None:
+        for hook in self.hooks:
+            hook.on_event(event)
+
+    def api_call(self, method, func, count_rows=False, retry=None, **info):
+        """
+        Execute a backend call and report it to the hooks.
+
+        :param method: name of the call
+        :param func: callable without arguments making the call
+        :param count_rows: True to report len() of the returned value as
+            the number of rows
+        :param retry: see throttling.Throttle.call
+        :param info: CallEvent fields known before the call (dataset,
+            table, job_id, rows, bytes, queue_wait ...)
+        :return: value returned by func
+        """
+        throttle = self.throttle
+        if not self.hooks:
+            return func() if throttle is None else throttle.call(method, func, retry=retry)
+        start = perf_counter()
+        error = None
+        result = None
+        stats = {}
+        try:
+            result = func() if throttle is None else throttle.call(method, func, stats, retry)
+            return result
+        except Exception as e:
+            error = e.__class__.__name__
+            raise
+        finally:
+            if count_rows and result is not None:
+                info['rows'] = len(result)
+            if stats:
+                info['retries'] = stats['retries']
+                info['queue_wait'] = info.get('queue_wait', 0.0) + stats['queue_wait']
+            self.emit(CallEvent(method, network_time=perf_counter() - start,
+                                error=error, **info))
+
+
+class InMemoryAggregator(Hook):
+    """
+    Hook summing events per method and, optionally, keeping the last
+    max_events events.
+    """
+
+    FIELDS = ('rows', 'bytes', 'retries', 'queue_wait', 'network_time', 'poll_time')
+
+    def __init__(self, max_events: int = 0):
+        """
+        :param max_events: number of raw events to keep, 0 for none
+        """
+        self.max_events = max_events
+        self.events = []
+        self._totals = defaultdict(lambda: defaultdict(float))
+        self._lock = threading.Lock()
+
+    def on_event(self, event: CallEvent) -> None:
+        with self._lock:
+            totals = self._totals[event.method]
+            totals['calls'] += 1
+            if event.error:
+                totals['errors'] += 1
+            for name in self.FIELDS:
+                value = getattr(event, name)
+                if value:
+                    totals[name] += value
+            if self.max_events:
+                self.events.append(event)
+                if len(self.events) > self.max_events:
+                    del self.events[:len(self.events) - self.max_events]
+
+    def snapshot(self) -> dict:
+        """
+        :return: dict method -> dict of totals (calls, errors, rows,
+            bytes, retries, queue_wait, network_time, poll_time)
+        """
+        with self._lock:
+            return {method: dict(totals) for method, totals in self._totals.items()}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._totals.clear()
+            self.events = []
+
+
+class PrometheusExporter:
+    """
+    Render the totals of an InMemoryAggregator in the Prometheus text
+    exposition format, e.g. to be served on a /metrics endpoint.
+    """
+
+    METRICS = (
+        ('calls', 'kumpel_calls_total', 'counter', 'Number of backend calls.'),
+        ('errors', 'kumpel_errors_total', 'counter', 'Number of failed backend calls.'),
+        ('rows', 'kumpel_rows_total', 'counter', 'Rows sent or received.'),
+        ('bytes', 'kumpel_bytes_total', 'counter', 'Bytes sent or received.'),
+        ('retries', 'kumpel_retries_total', 'counter', 'Retried backend calls.'),
+        ('queue_wait', 'kumpel_queue_wait_seconds_total', 'counter',
+         'Seconds calls waited before being sent.'),
+        ('network_time', 'kumpel_network_seconds_total', 'counter',
+         'Seconds spent in backend calls.'),
+        ('poll_time', 'kumpel_poll_seconds_total', 'counter',
+         'Seconds spent polling job status.'),
+    )
+
+    def __init__(self, aggregator: InMemoryAggregator, labels: dict = None):
+        """
+        :param aggregator: source of the totals
+        :param labels: constant labels added to every sample
+        """
+        self.aggregator = aggregator
+        self.labels = labels or {}
+
+    def _labels(self, method):
+        labels = dict(self.labels, method=method)
+        return ','.join('%s="%s"' % (k, str(v).replace('"', '\\"'))
+                        for k, v in sorted(labels.items()))
+
+    def render(self) -> str:
+        snapshot = self.aggregator.snapshot()
+        lines = []
+        for field, name, kind, description in self.METRICS:
+            lines.append('# HELP %s %s' % (name, description))
+            lines.append('# TYPE %s %s' % (name, kind))
+            for method in sorted(snapshot):
+                lines.append('%s{%s} %s' % (name, self._labels(method),
+                                            repr(float(snapshot[method].get(field, 0)))))
+        return '\n'.join(lines) + '\n'
+
+
+class ProfileCapture:
+    """
+    Result of profile(): the cProfile statistics of the profiled block.
+    """
+
+    def __init__(self):
+        import cProfile
+
+        self.profiler = cProfile.Profile()
+        self.stats = None
+
+    def report(self, sort: str = 'cumulative', limit: int = 30) -> str:
+        """
+        :return: text report of the most expensive functions
+        """
+        import pstats
+
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+
+@contextmanager
+def profile():
+    """
+    Profile a block with cProfile, e.g. a single connector call:
+
+        with profile() as capture:
+            rows = list(bq.read_query(sql))
+        print(capture.report())
+
+    Generators must be consumed inside the block to be measured.
+    """
+    capture = ProfileCapture()
+    capture.profiler.enable()
+    try:
+        yield capture
+    finally:
+        capture.profiler.disable()
+        import pstats
+
+        capture.stats = pstats.Stats(capture.profiler)
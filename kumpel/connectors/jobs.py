@@ -0,0 +1,160 @@
+import logging
+import random
+from collections import namedtuple
+from time import perf_counter, sleep
+from typing import Awaitable, Callable, Optional, Tuple
+
+from .errors import BigQueryJobTimeout
+
+JobWaitStats = namedtuple('JobWaitStats', [
+    'job_id', 'polls', 'elapsed', 'poll_time', 'sleep_time', 'max_overshoot'
+])
+JobWaitStats.__doc__ = """
+Timings collected while waiting for a BigQuery job.
+
+ * job_id: id of the job
+ * polls: number of status checks sent to BigQuery
+ * elapsed: seconds between the start of the wait and the job completion
+ * poll_time: seconds spent in status checks (network round trips)
+ * sleep_time: seconds spent sleeping between checks
+ * max_overshoot: upper bound of the seconds the job was already done
+   before it was noticed, i.e. the duration of the last sleep
+"""
+
+
+class JobWaiter:
+    """
+    Wait for a BigQuery job to complete. The status is checked right
+    away, then with exponentially growing intervals, randomized with
+    jitter so that many waiters do not poll in lockstep, and capped at
+    max_delay seconds.
+    """
+
+    def __init__(self,
+                 initial_delay: float = 0.1,
+                 max_delay: float = 5.0,
+                 multiplier: float = 2.0,
+                 timeout: float = None):
+        """
+        :param initial_delay: seconds to sleep after the first check
+        :param max_delay: upper bound of the interval between two checks
+        :param multiplier: growth factor of the interval between checks
+        :param timeout: seconds after which BigQueryJobTimeout is raised,
+            None to wait forever
+        """
+        self.initial_delay = min(initial_delay, max_delay)
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.timeout = timeout
+
+    def delays(self):
+        """
+        Generator of the intervals between two checks.
+        """
+        delay = self.initial_delay
+        while True:
+            # equal jitter: half fixed, half random
+            yield delay / 2 + random.uniform(0, delay / 2)
+            delay = min(delay * self.multiplier, self.max_delay)
+
+    def wait(self,
+             job_id: str,
+             check: Callable[[], Tuple[bool, object]]) -> Tuple[object, JobWaitStats]:
+        """
+        Call check until it reports the job as complete.
+
+        :param job_id: id of the job, used in logs and stats
+        :param check: callable returning a tuple (complete, result)
+        :return: tuple with the result returned by the last check and
+            the JobWaitStats of the wait
+        """
+        state = _WaitState(self, job_id)
+        while True:
+            before = perf_counter()
+            complete, result = check()
+            delay = state.checked(complete, perf_counter() - before)
+            if delay is None:
+                return result, state.stats()
+            sleep(delay)
+
+    async def wait_async(self,
+                         job_id: str,
+                         check: Callable[[], Awaitable]) -> Tuple[object, JobWaitStats]:
+        """
+        Same as wait(), for an event loop: check is a coroutine function
+        and the intervals between checks do not block the loop.
+
+        :param job_id: id of the job, used in logs and stats
+        :param check: coroutine function returning a tuple (complete, result)
+        :return: tuple with the result returned by the last check and
+            the JobWaitStats of the wait
+        """
+        import asyncio
+
+        state = _WaitState(self, job_id)
+        while True:
+            before = perf_counter()
+            complete, result = await check()
+            delay = state.checked(complete, perf_counter() - before)
+            if delay is None:
+                return result, state.stats()
+            await asyncio.sleep(delay)
+
+
+class _WaitState:
+    """
+    Bookkeeping of a single wait, shared by the blocking and the asyncio
+    waits: counts checks, picks the next interval and enforces the timeout.
+    """
+
+    def __init__(self, waiter: JobWaiter, job_id: str):
+        self.waiter = waiter
+        self.job_id = job_id
+        self.start = perf_counter()
+        self.polls = 0
+        self.poll_time = 0.0
+        self.sleep_time = 0.0
+        self.delay = 0.0
+        self.delays = waiter.delays()
+
+    def checked(self, complete: bool, duration: float) -> Optional[float]:
+        """
+        Record a check.
+
+        :param complete: True if the check found the job complete
+        :param duration: seconds the check took
+        :return: seconds to sleep before the next check, None when done
+        """
+        self.poll_time += duration
+        self.polls += 1
+        if complete:
+            return None
+
+        elapsed = perf_counter() - self.start
+        delay = next(self.delays)
+        timeout = self.waiter.timeout
+        if timeout is not None:
+            if elapsed >= timeout:
+                raise BigQueryJobTimeout(
+                    expression='Job %s did not complete.' % self.job_id,
+                    message='Job %s still running after %.1f seconds.'
+                            % (self.job_id, elapsed)
+                )
+            delay = min(delay, timeout - elapsed)
+        logging.debug('BQ: job %s still running, next check in %.2f seconds.'
+                      % (self.job_id, delay))
+        self.sleep_time += delay
+        self.delay = delay
+        return delay
+
+    def stats(self) -> JobWaitStats:
+        stats = JobWaitStats(job_id=self.job_id,
+                             polls=self.polls,
+                             elapsed=perf_counter() - self.start,
+                             poll_time=self.poll_time,
+                             sleep_time=self.sleep_time,
+                             max_overshoot=self.delay)
+        logging.info('BQ: job %s done in %.2fs (%i checks, %.2fs polling, %.2fs sleeping).'
+                     % (self.job_id, stats.elapsed, stats.polls, stats.poll_time,
+                        stats.sleep_time))
+        return stats
@@ -0,0 +1,141 @@
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+from .errors import BigQueryRowError
+
+
+def to_ranges(positions: Iterable[int]) -> List[Tuple[int, int]]:
+    """
+    Compress row positions in ranges [start, stop).
+
+    :param positions: iterable of integers
+    :return: sorted list of tuples (start, stop)
+    """
+    ranges = []
+    for position in sorted(positions):
+        if ranges and ranges[-1][1] == position:
+            ranges[-1][1] = position + 1
+        elif not ranges or ranges[-1][1] < position:
+            ranges.append([position, position + 1])
+    return [tuple(item) for item in ranges]
+
+
+def merge_ranges(ranges: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """
+    :param ranges: iterable of (start, stop)
+    :return: sorted list of non overlapping (start, stop)
+    """
+    merged = []
+    for start, stop in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], stop)
+        else:
+            merged.append([start, stop])
+    return [tuple(item) for item in merged]
+
+
+class LoadJournal:
+    """
+    Local sqlite journal of the rows of a load acknowledged by BigQuery,
+    as ranges of positions in the source. A load started again with the
+    same load_id skips those rows.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: sqlite file, created if it does not exist
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS acknowledged ('
+                       'load_id TEXT, start INTEGER, stop INTEGER, committed REAL)')
+            db.execute('CREATE INDEX IF NOT EXISTS acknowledged_load '
+                       'ON acknowledged (load_id)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def record(self, load_id: str, positions: Iterable[int]) -> None:
+        """
+        Record rows as acknowledged.
+
+        :param load_id: name of the load
+        :param positions: positions of the rows in the source
+        """
+        now = time.time()
+        with self._lock, self._connect() as db:
+            db.executemany('INSERT INTO acknowledged VALUES (?, ?, ?, ?)',
+                           [(load_id, start, stop, now) for start, stop in to_ranges(positions)])
+
+    def acknowledged(self, load_id: str) -> List[Tuple[int, int]]:
+        """
+        :param load_id: name of the load
+        :return: sorted list of (start, stop) ranges of acknowledged rows
+        """
+        with self._lock, self._connect() as db:
+            rows = db.execute('SELECT start, stop FROM acknowledged WHERE load_id = ?',
+                              (load_id,)).fetchall()
+        return merge_ranges(rows)
+
+    def compact(self, load_id: str) -> None:
+        """
+        Replace the ranges of a load by their merged version.
+        """
+        ranges = self.acknowledged(load_id)
+        now = time.time()
+        with self._lock, self._connect() as db:
+            db.execute('DELETE FROM acknowledged WHERE load_id = ?', (load_id,))
+            db.executemany('INSERT INTO acknowledged VALUES (?, ?, ?, ?)',
+                           [(load_id, start, stop, now) for start, stop in ranges])
+
+    def clear(self, load_id: str) -> None:
+        """
+        Forget a load, once it is complete.
+        """
+        with self._lock, self._connect() as db:
+            db.execute('DELETE FROM acknowledged WHERE load_id = ?', (load_id,))
+
+
+def pending_rows(data: Iterable[dict],
+                 acknowledged: List[Tuple[int, int]],
+                 encode: Callable[[dict], dict] = None,
+                 on_invalid: Callable[[dict, BigQueryRowError], None] = None
+                 ) -> Iterator[Tuple[int, dict]]:
+    """
+    Rows of a source not acknowledged yet, with their position. A first
+    range of acknowledged rows starting at 0 is skipped with islice,
+    without looking at the rows.
+
+    :param data: iterable of dicts, in the same order as for the first run
+    :param acknowledged: sorted, non overlapping (start, stop) ranges
+    :param encode: optional RowEncoder.encode applied to the pending rows
+    :param on_invalid: called with each invalid row and its error, None
+        to raise the error
+    :return: generator of tuples (position, row)
+    """
+    ranges = list(acknowledged)
+    position = 0
+    iterator = iter(data)
+    if ranges and ranges[0][0] == 0:
+        position = ranges.pop(0)[1]
+        iterator = itertools.islice(iterator, position, None)
+    for row in iterator:
+        while ranges and ranges[0][1] <= position:
+            ranges.pop(0)
+        if not ranges or position < ranges[0][0]:
+            if encode is None:
+                yield position, row
+            else:
+                try:
+                    yield position, encode(row)
+                except BigQueryRowError as e:
+                    if on_invalid is None:
+                        raise
+                    on_invalid(row, e)
+        position += 1
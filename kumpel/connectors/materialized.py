@@ -0,0 +1,285 @@
+import json
+import os
+import shutil
+from typing import Iterator, List
+
+from .columnar import ColumnBatch, column_dtype, numpy
+from .records import format_rows
+
+META_FILE = 'meta.json'
+
+# rows converted to python objects at once when iterating
+CHUNK_ROWS = 10000
+
+
+def _column_kind(field: dict, dtype: str) -> str:
+    """
+    How a column is stored: 'fixed' width values in a numpy array,
+    'text' as utf-8 strings or 'json' for RECORD and REPEATED values.
+    """
+    if dtype != 'object':
+        return 'fixed'
+    if field.get('mode') == 'REPEATED' or field.get('type') in ('RECORD', 'STRUCT'):
+        return 'json'
+    return 'text'
+
+
+class ColumnarWriter:
+    """
+    Append batches of columns to a directory holding one file per
+    column (plus a null mask, and offsets for variable length values),
+    to be opened as a MaterializedResult once complete.
+    """
+
+    def __init__(self, directory: str, fields: List[dict]):
+        """
+        :param directory: created if it does not exist, must not hold
+            another result
+        :param fields: schema fields of the result
+        """
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fields = [dict(field) for field in fields]
+        self.rows = 0
+        self.columns = []
+        self._files = []
+        self._offsets = []
+        for index, field in enumerate(self.fields):
+            dtype = column_dtype(field)
+            kind = _column_kind(field, dtype)
+            self.columns.append({'name': field['name'], 'dtype': dtype, 'kind': kind,
+                                 'file': 'c%i' % index})
+            files = {'data': open(self._path(index, 'data'), 'wb'),
+                     'mask': open(self._path(index, 'mask'), 'wb')}
+            if kind != 'fixed':
+                files['offsets'] = open(self._path(index, 'offsets'), 'wb')
+            self._files.append(files)
+            self._offsets.append(0)
+
+    def _path(self, index: int, part: str) -> str:
+        return os.path.join(self.directory, 'c%i.%s' % (index, part))
+
+    def append(self, batch: ColumnBatch) -> None:
+        """
+        :param batch: ColumnBatch with the columns of the schema
+        """
+        np = numpy()
+        for index, column in enumerate(self.columns):
+            files = self._files[index]
+            values = batch.columns[column['name']]
+            mask = batch.masks[column['name']]
+            files['mask'].write(np.ascontiguousarray(mask, dtype=bool).tobytes())
+            if column['kind'] == 'fixed':
+                files['data'].write(np.ascontiguousarray(values).tobytes())
+                continue
+            ends = np.empty(len(values), dtype='int64')
+            for position, value in enumerate(values):
+                if value is not None:
+                    if column['kind'] == 'json':
+                        value = json.dumps(value)
+                    data = value.encode('utf-8') if isinstance(value, str) else bytes(value)
+                    files['data'].write(data)
+                    self._offsets[index] += len(data)
+                ends[position] = self._offsets[index]
+            files['offsets'].write(ends.tobytes())
+        self.rows += len(batch)
+
+    def close(self) -> None:
+        """
+        Flush the files and write the metadata of the result.
+        """
+        for files in self._files:
+            for handle in files.values():
+                handle.close()
+        with open(os.path.join(self.directory, META_FILE), 'w') as fout:
+            json.dump({'rows': self.rows, 'fields': self.fields, 'columns': self.columns}, fout)
+
+
+class TextColumn:
+    """
+    Read only sequence of the variable length values of a column, decoded
+    on access from the memory mapped files.
+    """
+
+    def __init__(self, data, ends, mask, kind: str, first: int = 0):
+        """
+        :param data: bytes of all the values of the column
+        :param ends: offset in data of the end of each value in the range
+        :param mask: True for null values in the range
+        :param kind: 'text' or 'json'
+        :param first: offset in data of the first value in the range
+        """
+        self._data = data
+        self._ends = ends
+        self._mask = mask
+        self._kind = kind
+        self._first = first
+
+    def __len__(self):
+        return len(self._ends)
+
+    def _value(self, position: int):
+        if self._mask[position]:
+            return None
+        start = int(self._ends[position - 1]) if position else self._first
+        text = bytes(self._data[start:int(self._ends[position])]).decode('utf-8')
+        return json.loads(text) if self._kind == 'json' else text
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self._value(position) for position in range(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(key)
+        return self._value(key)
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self._value(position)
+
+
+class MaterializedResult:
+    """
+    Result set stored column by column in local files and memory mapped,
+    so it can be larger than the memory and read any number of times.
+
+     * len(result), iteration over its rows (again and again),
+     * result[i] for a row, result[a:b] for a MaterializedResult of a
+       range of rows, sharing the same files,
+     * result.column(name) for the values of a column: a read only numpy
+       view on the file for numbers, booleans and dates (nulls being
+       marked by result.mask(name)), a TextColumn for the others.
+
+    Requires numpy.
+    """
+
+    def __init__(self, directory: str, owned: bool = False, _view=None):
+        """
+        :param directory: directory written by a ColumnarWriter
+        :param owned: True to delete the directory on close()
+        """
+        self.directory = directory
+        self.owned = owned
+        if _view is not None:
+            parent, self.start, self.stop = _view
+            self.fields = parent.fields
+            self._columns = parent._columns
+            self._maps = parent._maps
+            return
+        with open(os.path.join(directory, META_FILE)) as fin:
+            meta = json.load(fin)
+        self.fields = meta['fields']
+        self._columns = {column['name']: column for column in meta['columns']}
+        self.start = 0
+        self.stop = meta['rows']
+        self._maps = {}
+
+    @property
+    def names(self) -> List[str]:
+        return [field['name'] for field in self.fields]
+
+    def _map(self, column: dict, part: str, dtype: str):
+        key = (column['file'], part)
+        array = self._maps.get(key)
+        if array is None:
+            np = numpy()
+            path = os.path.join(self.directory, '%s.%s' % (column['file'], part))
+            if os.path.getsize(path) == 0:
+                array = np.empty(0, dtype=dtype)
+            else:
+                array = np.memmap(path, dtype=dtype, mode='r')
+            self._maps[key] = array
+        return array
+
+    def mask(self, name: str):
+        """
+        :param name: column name
+        :return: read only numpy bool array, True for null values
+        """
+        return self._map(self._columns[name], 'mask', 'bool')[self.start:self.stop]
+
+    def column(self, name: str):
+        """
+        :param name: column name
+        :return: read only numpy array (memory mapped) or TextColumn
+        """
+        column = self._columns[name]
+        if column['kind'] == 'fixed':
+            return self._map(column, 'data', column['dtype'])[self.start:self.stop]
+        ends = self._map(column, 'offsets', 'int64')
+        return TextColumn(self._map(column, 'data', 'uint8'),
+                          ends[self.start:self.stop],
+                          self._map(column, 'mask', 'bool')[self.start:self.stop],
+                          column['kind'],
+                          int(ends[self.start - 1]) if self.start else 0)
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def _python_values(self, name: str, start: int, stop: int) -> list:
+        column = self._columns[name]
+        if column['kind'] != 'fixed':
+            return self.column(name)[start:stop]
+        np = numpy()
+        values = self.column(name)[start:stop]
+        if column['dtype'].startswith('datetime64'):
+            values = np.datetime_as_string(values).tolist()
+        else:
+            values = values.tolist()
+        mask = self.mask(name)[start:stop]
+        if mask.any():
+            for position in np.flatnonzero(mask).tolist():
+                values[position] = None
+        return values
+
+    def _rows(self) -> Iterator[dict]:
+        names = self.names
+        for start in range(0, len(self), CHUNK_ROWS):
+            stop = min(start + CHUNK_ROWS, len(self))
+            columns = [self._python_values(name, start, stop) for name in names]
+            for values in zip(*columns):
+                yield dict(zip(names, values))
+
+    def rows(self, row_format: str = 'dict'):
+        """
+        :param row_format: 'dict', 'record' or 'tuple', see records.Rows
+        :return: iterator over the rows
+        """
+        return format_rows(self._rows(), row_format)
+
+    def __iter__(self) -> Iterator[dict]:
+        return self._rows()
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError('Slices of a MaterializedResult must be contiguous.')
+            return MaterializedResult(self.directory,
+                                      _view=(self, self.start + start,
+                                             self.start + max(start, stop)))
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError(key)
+        return {name: self._python_values(name, key, key + 1)[0] for name in self.names}
+
+    def close(self) -> None:
+        """
+        Release the memory maps, and delete the files of a result in a
+        temporary directory.
+        """
+        self._maps.clear()
+        if self.owned:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return '<MaterializedResult %i rows x %i columns in %s>' % (
+            len(self), len(self.fields), self.directory)
@@ -0,0 +1,88 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List
+
+
+def read_range(fetch: Callable[[int, int], List[dict]],
+               offset: int,
+               limit: int) -> List[dict]:
+    """
+    Read limit rows starting at offset. BigQuery may return fewer rows
+    than asked for when a page exceeds the response size limit, in which
+    case the rest of the range is requested again.
+
+    :param fetch: callable (offset, limit) returning a list of rows
+    :param offset: index of the first row
+    :param limit: number of rows to read
+    :return: list of rows
+    """
+    rows = []
+    while len(rows) < limit:
+        page = fetch(offset + len(rows), limit - len(rows))
+        if not page:
+            break
+        rows.extend(page)
+    return rows
+
+
+class PagePrefetcher:
+    """
+    Read the pages of a result set on a thread pool. Up to read_ahead
+    pages are requested before the consumer gets to them, while the rows
+    are still yielded in their original order.
+    """
+
+    def __init__(self,
+                 fetch: Callable[[int, int], List[dict]],
+                 row_count: int,
+                 page_size: int = 1000,
+                 workers: int = 4,
+                 read_ahead: int = None):
+        """
+        :param fetch: callable (offset, limit) returning a list of rows,
+            usually a closure around client.get_query_rows
+        :param row_count: total number of rows in the result set
+        :param page_size: number of rows per request
+        :param workers: number of requests executed at the same time
+        :param read_ahead: maximum number of pages requested and not yet
+            consumed, defaults to 2 * workers
+        """
+        if page_size < 1 or workers < 1:
+            raise ValueError('page_size and workers must be positive integers.')
+        self.fetch = fetch
+        self.row_count = row_count
+        self.page_size = page_size
+        self.workers = workers
+        self.read_ahead = max(read_ahead or 2 * workers, workers)
+
+    def pages(self) -> Iterator[List[dict]]:
+        """
+        Generator of pages, in order.
+        """
+        offsets = iter(range(0, self.row_count, self.page_size))
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        pending = deque()
+
+        def submit():
+            offset = next(offsets, None)
+            if offset is not None:
+                limit = min(self.page_size, self.row_count - offset)
+                pending.append(executor.submit(read_range, self.fetch, offset, limit))
+
+        try:
+            for _ in range(self.read_ahead):
+                submit()
+            while pending:
+                page = pending.popleft().result()
+                submit()
+                yield page
+        finally:
+            # the consumer may stop early, do not download the rest
+            for future in pending:
+                future.cancel()
+            executor.shutdown(wait=True)
+
+    def __iter__(self) -> Iterator[dict]:
+        for page in self.pages():
+            for row in page:
+                yield row
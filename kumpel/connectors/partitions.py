@@ -0,0 +1,113 @@
+from datetime import date, datetime, timedelta, timezone
+from typing import Callable, Iterable, Iterator, List
+
+from .batching import AdaptiveBatcher, row_size
+
+# rows buffered by partition_batches() before the largest partition is
+# sent, whatever the size of its batch
+MAX_BUFFERED_ROWS = 100000
+
+
+def _to_date(value) -> date:
+    if isinstance(value, datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if isinstance(value, (int, float)):
+        # seconds since epoch, as TIMESTAMP values of BigQuery-Python
+        return datetime.fromtimestamp(value, timezone.utc).date()
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+def partition_id(value) -> str:
+    """
+    Day partition of a value, as used in table decorators.
+
+    :param value: date, datetime, seconds since epoch or string starting
+        with YYYY-MM-DD
+    :return: 'YYYYMMDD', None for a null value
+    """
+    if value is None:
+        return None
+    return _to_date(value).strftime('%Y%m%d')
+
+
+def decorate(table: str, partition: str) -> str:
+    """
+    :param table: table name
+    :param partition: 'YYYYMMDD', None for the table itself
+    :return: table$YYYYMMDD
+    """
+    return table if partition is None else '%s$%s' % (table, partition)
+
+
+def partition_range(start, end) -> List[str]:
+    """
+    Day partitions between two dates, both included.
+
+    :param start: first day, date, datetime or 'YYYY-MM-DD'
+    :param end: last day
+    :return: list of 'YYYYMMDD'
+    """
+    first, last = _to_date(start), _to_date(end)
+    return [(first + timedelta(days=day)).strftime('%Y%m%d')
+            for day in range((last - first).days + 1)]
+
+
+def partition_filter(start, end) -> str:
+    """
+    Condition restricting a query on an ingestion time partitioned table
+    to the partitions between two dates, both included, valid in legacy
+    and standard sql.
+
+    :param start: first day, date, datetime or 'YYYY-MM-DD'
+    :param end: last day
+    :return: sql condition
+    """
+    return "_PARTITIONTIME BETWEEN TIMESTAMP('%s') AND TIMESTAMP('%s')" % (
+        _to_date(start).isoformat(), _to_date(end).isoformat())
+
+
+def partition_batches(data: Iterable[dict],
+                      key: Callable[[dict], str],
+                      batcher: AdaptiveBatcher,
+                      size: Callable[[dict], int] = row_size,
+                      max_buffered_rows: int = MAX_BUFFERED_ROWS) -> Iterator[List[dict]]:
+    """
+    Split a stream of rows in requests holding rows of a single
+    partition. Rows are buffered by partition until a batch is full, so
+    rows of many partitions interleaved in data still make full batches;
+    when more than max_buffered_rows rows are buffered, the largest
+    partition is sent anyway.
+
+    :param data: iterable of rows
+    :param key: callable returning the partition of a row
+    :param batcher: AdaptiveBatcher giving the limits of a batch
+    :param size: callable returning the size in bytes of a row
+    :param max_buffered_rows: maximum number of rows held in memory
+    :return: generator of lists of rows
+    """
+    buffers = {}
+    buffered = 0
+    for row in data:
+        partition = key(row)
+        row_bytes = size(row)
+        batch, batch_bytes = buffers.get(partition, ([], 0))
+        if batch and (batch_bytes + row_bytes > batcher.max_bytes
+                      or len(batch) >= batcher.target_rows):
+            yield batch
+            buffered -= len(batch)
+            batch, batch_bytes = [], 0
+        batch.append(row)
+        buffers[partition] = (batch, batch_bytes + row_bytes)
+        buffered += 1
+        if buffered > max_buffered_rows:
+            largest = max(buffers, key=lambda name: len(buffers[name][0]))
+            batch, _batch_bytes = buffers.pop(largest)
+            buffered -= len(batch)
+            yield batch
+    for batch, _batch_bytes in buffers.values():
+        yield batch
+
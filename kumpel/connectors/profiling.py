@@ -0,0 +1,162 @@
+import json
+from collections import OrderedDict, namedtuple
+from typing import List, Tuple
+
+ColumnProfile = namedtuple('ColumnProfile', [
+    'name', 'type', 'null_count', 'distinct_count', 'min', 'max', 'top_values',
+    'min_length', 'max_length', 'avg_length'
+])
+ColumnProfile.__doc__ = """
+Statistics of a column, None when they do not apply to its type.
+
+ * null_count: number of null values
+ * distinct_count: approximate number of distinct values
+ * min, max: smallest and largest values
+ * top_values: list of (value, count) of the most frequent values,
+   counts are approximate
+ * min_length, max_length, avg_length: lengths of STRING and BYTES values
+"""
+
+TableProfile = namedtuple('TableProfile', [
+    'dataset', 'table', 'row_count', 'last_modified', 'columns', 'jobs'
+])
+TableProfile.__doc__ = """
+Result of BigQuery.profile_table().
+
+ * row_count: number of rows of the table
+ * last_modified: lastModifiedTime of the table when it was profiled
+ * columns: ordered dict column name -> ColumnProfile
+ * jobs: number of query jobs the profile took
+"""
+
+# types without an order or a length
+UNORDERED_TYPES = ('RECORD', 'STRUCT', 'GEOGRAPHY')
+LENGTH_TYPES = ('STRING', 'BYTES')
+
+
+def _quote(name: str) -> str:
+    return '`%s`' % name
+
+
+def column_expressions(index: int, field: dict, top_k: int) -> List[Tuple[str, str]]:
+    """
+    Aggregates computed for a column, as (alias, standard sql expression).
+
+    :param index: position of the column, used in the aliases
+    :param field: schema field
+    :param top_k: number of most frequent values to keep, 0 for none
+    :return: list of tuples
+    """
+    column = _quote(field['name'])
+    prefix = 'c%i_' % index
+    expressions = [(prefix + 'nulls', 'COUNTIF(%s IS NULL)' % column)]
+    if field.get('mode') == 'REPEATED' or field.get('type') in UNORDERED_TYPES:
+        return expressions
+    expressions += [
+        (prefix + 'distinct', 'APPROX_COUNT_DISTINCT(%s)' % column),
+        (prefix + 'min', 'MIN(%s)' % column),
+        (prefix + 'max', 'MAX(%s)' % column),
+    ]
+    if top_k:
+        expressions.append((prefix + 'top', 'APPROX_TOP_COUNT(%s, %i)' % (column, top_k)))
+    if field.get('type') in LENGTH_TYPES:
+        length = 'LENGTH(%s)' % column
+        expressions += [
+            (prefix + 'min_length', 'MIN(%s)' % length),
+            (prefix + 'max_length', 'MAX(%s)' % length),
+            (prefix + 'avg_length', 'AVG(%s)' % length),
+        ]
+    return expressions
+
+
+def profile_queries(dataset: str,
+                    table: str,
+                    fields: List[dict],
+                    top_k: int = 5,
+                    columns_per_query: int = 250) -> List[Tuple[str, List[int]]]:
+    """
+    Standard sql queries computing the statistics of all the columns of
+    a table, each query scanning the table once for up to
+    columns_per_query columns.
+
+    :param dataset: BQ dataset name
+    :param table: BQ table name
+    :param fields: schema fields of the columns to profile
+    :param top_k: number of most frequent values to keep, 0 for none
+    :param columns_per_query: maximum number of columns per query
+    :return: list of tuples (query, indexes of the fields it profiles)
+    """
+    queries = []
+    for start in range(0, max(1, len(fields)), columns_per_query):
+        indexes = list(range(start, min(start + columns_per_query, len(fields))))
+        expressions = ['COUNT(*) AS row_count']
+        for index in indexes:
+            expressions += ['%s AS %s' % (sql, alias)
+                            for alias, sql in column_expressions(index, fields[index], top_k)]
+        queries.append(('SELECT\n  %s\nFROM `%s.%s`' % (',\n  '.join(expressions), dataset, table),
+                        indexes))
+    return queries
+
+
+def _top_values(value) -> list:
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+    return [(item.get('value'), int(item.get('count'))) for item in value]
+
+
+def _number(value, convert):
+    return None if value is None else convert(value)
+
+
+def column_profile(index: int, field: dict, row: dict) -> ColumnProfile:
+    """
+    Read the statistics of a column from the result of its query.
+
+    :param index: position of the column, see column_expressions()
+    :param field: schema field
+    :param row: result row of the query
+    :return: ColumnProfile
+    """
+    prefix = 'c%i_' % index
+    return ColumnProfile(
+        name=field['name'],
+        type=field.get('type'),
+        null_count=_number(row.get(prefix + 'nulls'), int),
+        distinct_count=_number(row.get(prefix + 'distinct'), int),
+        min=row.get(prefix + 'min'),
+        max=row.get(prefix + 'max'),
+        top_values=_top_values(row.get(prefix + 'top')),
+        min_length=_number(row.get(prefix + 'min_length'), int),
+        max_length=_number(row.get(prefix + 'max_length'), int),
+        avg_length=_number(row.get(prefix + 'avg_length'), float),
+    )
+
+
+def build_profile(dataset: str,
+                  table: str,
+                  fields: List[dict],
+                  results: List[Tuple[List[int], dict]],
+                  last_modified: str = None) -> TableProfile:
+    """
+    :param dataset: BQ dataset name
+    :param table: BQ table name
+    :param fields: schema fields of the profiled columns
+    :param results: list of (indexes of the fields, result row) per query
+    :param last_modified: lastModifiedTime of the table
+    :return: TableProfile with the columns in schema order
+    """
+    profiles = {}
+    row_count = 0
+    for indexes, row in results:
+        row_count = int(row.get('row_count') or 0)
+        for index in indexes:
+            profiles[index] = column_profile(index, fields[index], row)
+    columns = OrderedDict((fields[index]['name'], profiles[index]) for index in sorted(profiles))
+    return TableProfile(dataset=dataset,
+                        table=table,
+                        row_count=row_count,
+                        last_modified=last_modified,
+                        columns=columns,
+                        jobs=len(results))
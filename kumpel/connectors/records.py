@@ -0,0 +1,161 @@
+import keyword
+from operator import itemgetter
+from typing import Iterable, Iterator, List
+
+ROW_FORMATS = ('dict', 'record', 'tuple')
+
+# record classes by column names, shared by all result sets with the same
+# columns and needed to unpickle records
+_classes = {}
+
+
+class Record(tuple):
+    """
+    Row stored as a tuple, without the column names: they are kept once,
+    by the class. Values are read by position, by column name or as
+    attributes (row[0], row['name'] or row.name).
+    """
+
+    __slots__ = ()
+    _fields = ()
+    _index = {}
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            try:
+                key = self._index[key]
+            except KeyError:
+                raise KeyError(key)
+        return tuple.__getitem__(self, key)
+
+    def get(self, key: str, default=None):
+        position = self._index.get(key)
+        return default if position is None else tuple.__getitem__(self, position)
+
+    def keys(self) -> tuple:
+        return self._fields
+
+    def values(self) -> tuple:
+        return tuple(self)
+
+    def items(self) -> list:
+        return list(zip(self._fields, self))
+
+    def as_dict(self) -> dict:
+        return dict(zip(self._fields, self))
+
+    def __repr__(self):
+        return 'Record(%s)' % ', '.join('%s=%r' % item for item in zip(self._fields, self))
+
+    def __reduce__(self):
+        return _rebuild, (self._fields, tuple(self))
+
+
+def record_class(names: List[str]) -> type:
+    """
+    Record subclass for rows with the given columns. Columns named like
+    valid identifiers, not starting with '_' and not hiding a method,
+    are readable as attributes.
+
+    :param names: column names, in the order of the values
+    :return: class
+    """
+    names = tuple(names)
+    cls = _classes.get(names)
+    if cls is None:
+        namespace = {'__slots__': (),
+                     '_fields': names,
+                     '_index': {name: position for position, name in enumerate(names)}}
+        for position, name in enumerate(names):
+            if (name.isidentifier() and not keyword.iskeyword(name)
+                    and not name.startswith('_') and not hasattr(Record, name)):
+                namespace[name] = property(itemgetter(position))
+        cls = _classes.setdefault(names, type('Record', (Record,), namespace))
+    return cls
+
+
+def _rebuild(names, values):
+    return record_class(names)(values)
+
+
+class RowSchema:
+    """
+    Column names of a result set, shared by all its rows.
+    """
+
+    def __init__(self, names: List[str]):
+        """
+        :param names: column names, in the order of the values
+        """
+        self.names = tuple(names)
+        self.index = {name: position for position, name in enumerate(self.names)}
+        self.record = record_class(self.names)
+        if len(self.names) == 1:
+            name = self.names[0]
+            self._values = lambda row: (row[name],)
+        else:
+            self._values = itemgetter(*self.names)
+
+    def to_tuple(self, row: dict) -> tuple:
+        """
+        :param row: dict with at least the columns of the schema
+        :return: tuple of values in the order of the schema
+        """
+        return self._values(row)
+
+    def to_record(self, row: dict) -> Record:
+        """
+        :param row: dict with at least the columns of the schema
+        :return: Record
+        """
+        return self.record(self._values(row))
+
+    def __len__(self):
+        return len(self.names)
+
+    def __repr__(self):
+        return '<RowSchema %s>' % ', '.join(self.names)
+
+
+class Rows:
+    """
+    Iterator turning rows read as dicts into Records or plain tuples,
+    each dict being dropped as soon as it is converted. All the rows
+    share self.schema, known once the first row is read (None for an
+    empty result).
+    """
+
+    def __init__(self, rows: Iterable[dict], row_format: str = 'record'):
+        """
+        :param rows: iterable of dicts with the same columns
+        :param row_format: 'record' or 'tuple'
+        """
+        if row_format not in ('record', 'tuple'):
+            raise ValueError('row_format must be one of: %s.' % ', '.join(ROW_FORMATS))
+        self.row_format = row_format
+        self.schema = None
+        self._rows = iter(rows)
+        self._convert = None
+
+    def __iter__(self) -> Iterator:
+        return self
+
+    def __next__(self):
+        row = next(self._rows)
+        if self._convert is None:
+            self.schema = RowSchema(list(row))
+            self._convert = (self.schema.to_record if self.row_format == 'record'
+                             else self.schema.to_tuple)
+        return self._convert(row)
+
+
+def format_rows(rows: Iterable[dict], row_format: str = 'dict'):
+    """
+    :param rows: iterable of dicts
+    :param row_format: 'dict' to keep the rows as they are, 'record' or
+        'tuple', see Rows
+    :return: rows, or Rows
+    """
+    if row_format == 'dict':
+        return rows
+    return Rows(rows, row_format)
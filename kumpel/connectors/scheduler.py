@@ -0,0 +1,164 @@
+import logging
+from collections import namedtuple
+from time import perf_counter, sleep
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+from .cache import tables_in_query
+from .errors import BigQueryJobTimeout
+from .jobs import JobWaiter, JobWaitStats
+
+QueryStep = namedtuple('QueryStep', [
+    'query', 'dataset', 'table', 'write_disposition', 'use_legacy_sql', 'name', 'depends_on'
+])
+QueryStep.__new__.__defaults__ = (None, None, None, None, None, ())
+QueryStep.__doc__ = """
+A query run by JobScheduler.
+
+ * query: sql query
+ * dataset, table: destination of the result, None for a query whose
+   rows are read back
+ * write_disposition: WRITE_TRUNCATE, WRITE_APPEND or WRITE_EMPTY
+ * use_legacy_sql: dialect of the query, None for the API default
+ * name: name used by other steps to depend on this one, defaults to
+   'dataset.table' for writes and to the query for reads
+ * depends_on: names of the steps which must complete before this one
+   is submitted. Queries reading a table written by an earlier step
+   depend on it without being told.
+"""
+
+
+def step_name(step: QueryStep) -> str:
+    if step.name:
+        return step.name
+    if step.dataset is not None:
+        return '%s.%s' % (step.dataset, step.table)
+    return step.query
+
+
+def dependencies(steps: List[QueryStep]) -> List[set]:
+    """
+    Indexes of the steps each step waits for: the explicit depends_on
+    and the earlier steps writing a table the step reads.
+
+    :param steps: list of QueryStep
+    :return: list of sets of indexes, one per step
+    """
+    names = {}
+    for index, step in enumerate(steps):
+        names.setdefault(step_name(step), index)
+    writers = {}
+    result = []
+    for index, step in enumerate(steps):
+        waits_for = set()
+        for name in step.depends_on:
+            if name not in names:
+                raise ValueError('Step %s depends on unknown step %s.'
+                                 % (step_name(step), name))
+            waits_for.add(names[name])
+        for table in tables_in_query(step.query):
+            if table in writers:
+                waits_for.add(writers[table])
+        waits_for.discard(index)
+        result.append(waits_for)
+        if step.dataset is not None:
+            # tables_in_query() returns lower case names
+            writers[('%s.%s' % (step.dataset, step.table)).lower()] = index
+    return result
+
+
+class JobScheduler:
+    """
+    Run many BigQuery jobs at once: jobs are submitted as soon as their
+    dependencies are complete, up to max_running at the same time, and
+    a single loop checks all running jobs, with the same backoff as
+    JobWaiter. Total time is close to the one of the slowest chain of
+    dependent jobs instead of the sum of all jobs.
+    """
+
+    def __init__(self,
+                 submit: Callable[[QueryStep], str],
+                 check: Callable[[str], Tuple[bool, object]],
+                 max_running: int = 10,
+                 waiter: JobWaiter = None):
+        """
+        :param submit: callable starting the job of a step, returns its id
+        :param check: callable job id -> (complete, result)
+        :param max_running: maximum number of jobs running at the same time
+        :param waiter: JobWaiter giving the intervals between checks and
+            the timeout of each job
+        """
+        if max_running < 1:
+            raise ValueError('max_running must be at least 1')
+        self.submit = submit
+        self.check = check
+        self.max_running = max_running
+        self.waiter = waiter or JobWaiter()
+        self.stats = {}
+
+    def run(self, steps: Iterable[QueryStep],
+            skip: Iterable[int] = ()) -> Iterator[Tuple[int, str, object]]:
+        """
+        Run the steps and yield them in completion order. The loop is
+        paused while the caller handles a yielded step, jobs keep running
+        in BigQuery meanwhile.
+
+        :param steps: iterable of QueryStep
+        :param skip: indexes of steps not to run, considered complete
+        :return: generator of tuples (index of the step, job id, result
+            of the last check)
+        """
+        steps = list(steps)
+        waits_for = dependencies(steps)
+        done = set(skip)
+        pending = [index for index in range(len(steps)) if index not in done]
+        running = {}   # index -> [job_id, submitted, polls, poll_time, sleep_time, delay]
+        delays = self.waiter.delays()
+
+        while pending or running:
+            ready = [index for index in pending if waits_for[index] <= done]
+            for index in ready[:self.max_running - len(running)]:
+                pending.remove(index)
+                job_id = self.submit(steps[index])
+                logging.info('BQ: running job %s ...' % job_id)
+                running[index] = [job_id, perf_counter(), 0, 0.0, 0.0, 0.0]
+            if not running:
+                raise ValueError('Circular dependencies between steps: %s'
+                                 % ', '.join(step_name(steps[i]) for i in pending))
+
+            finished = []
+            for index in sorted(running):
+                job = running[index]
+                before = perf_counter()
+                complete, result = self.check(job[0])
+                now = perf_counter()
+                job[2] += 1
+                job[3] += now - before
+                if complete:
+                    finished.append((index, result))
+                elif self.waiter.timeout is not None and now - job[1] >= self.waiter.timeout:
+                    raise BigQueryJobTimeout(
+                        expression='Job %s did not complete.' % job[0],
+                        message='Job %s still running after %.1f seconds.'
+                                % (job[0], now - job[1])
+                    )
+
+            if not finished:
+                delay = next(delays)
+                for job in running.values():
+                    job[4] += delay
+                    job[5] = delay
+                sleep(delay)
+                continue
+
+            # something changed: new jobs may be ready, start polling fast again
+            delays = self.waiter.delays()
+            for index, result in finished:
+                job_id, submitted, polls, poll_time, sleep_time, delay = running.pop(index)
+                done.add(index)
+                self.stats[index] = JobWaitStats(job_id=job_id,
+                                                 polls=polls,
+                                                 elapsed=perf_counter() - submitted,
+                                                 poll_time=poll_time,
+                                                 sleep_time=sleep_time,
+                                                 max_overshoot=delay)
+                yield index, job_id, result
@@ -0,0 +1,354 @@
+import base64
+import datetime
+import math
+import numbers
+import re
+from typing import Callable, Iterable, Iterator, List, Tuple, Union
+
+from .batching import dumps
+from .errors import BigQueryRowError
+from .tabledata import to_fields
+
+UNKNOWN_COLUMNS = ('drop', 'flag', 'keep')
+
+_DATE = re.compile(r'^\d{4}-\d{1,2}-\d{1,2}$')
+_TIME = re.compile(r'^\d{1,2}:\d{1,2}:\d{1,2}(\.\d{1,6})?$')
+_DATETIME = re.compile(r'^\d{4}-\d{1,2}-\d{1,2}([ T]\d{1,2}:\d{1,2}:\d{1,2}(\.\d{1,6})?)?$')
+_TIMESTAMP = re.compile(r'^\d{4}-\d{1,2}-\d{1,2}([ T]\d{1,2}:\d{1,2}(:\d{1,2}(\.\d{1,6})?)?)?'
+                        r'( ?(Z|UTC|[+-]\d{1,2}(:\d{2})?))?$')
+
+
+def _integer(value):
+    if type(value) is int:
+        return value
+    if isinstance(value, bool):
+        raise TypeError('boolean is not an INTEGER')
+    if isinstance(value, numbers.Integral):
+        # numpy integers among others
+        return int(value)
+    if isinstance(value, numbers.Real):
+        if float(value).is_integer():
+            return int(value)
+        raise ValueError('%r is not an integer' % value)
+    if isinstance(value, str):
+        return int(value)
+    raise TypeError('%s is not an INTEGER' % type(value).__name__)
+
+
+def _float(value):
+    if type(value) is float:
+        # json has no NaN or Infinity, BigQuery accepts them as strings
+        if math.isnan(value) or math.isinf(value):
+            return 'NaN' if math.isnan(value) else ('Infinity' if value > 0 else '-Infinity')
+        return value
+    if isinstance(value, bool):
+        raise TypeError('boolean is not a FLOAT')
+    if isinstance(value, (numbers.Real, str)):
+        return _float(float(value))
+    raise TypeError('%s is not a FLOAT' % type(value).__name__)
+
+
+def _boolean(value):
+    if value is True or value is False:
+        return value
+    if isinstance(value, str):
+        lowered = value.lower()
+        if lowered in ('true', '1'):
+            return True
+        if lowered in ('false', '0'):
+            return False
+        raise ValueError('%r is not a boolean' % value)
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    raise TypeError('%r is not a BOOLEAN' % (value,))
+
+
+def _string(value):
+    if type(value) is str:
+        return value
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if isinstance(value, (dict, list, tuple)):
+        raise TypeError('%s is not a STRING' % type(value).__name__)
+    return str(value)
+
+
+def _bytes(value):
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(value).decode('ascii')
+    if isinstance(value, str):
+        return value
+    raise TypeError('%s is not BYTES' % type(value).__name__)
+
+
+def _matching(pattern, type_name):
+    def check(value):
+        if not pattern.match(value):
+            raise ValueError('%r is not a valid %s' % (value, type_name))
+        return value
+    return check
+
+
+_check_date = _matching(_DATE, 'DATE')
+_check_time = _matching(_TIME, 'TIME')
+_check_datetime = _matching(_DATETIME, 'DATETIME')
+_check_timestamp = _matching(_TIMESTAMP, 'TIMESTAMP')
+
+
+def _timestamp(value):
+    if isinstance(value, str):
+        return _check_timestamp(value)
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return value.strftime('%Y-%m-%d %H:%M:%S.%f UTC')
+    if isinstance(value, datetime.date):
+        return value.isoformat() + ' 00:00:00 UTC'
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        # seconds since epoch
+        return value
+    raise TypeError('%s is not a TIMESTAMP' % type(value).__name__)
+
+
+def _date(value):
+    if isinstance(value, str):
+        return _check_date(value)
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    raise TypeError('%s is not a DATE' % type(value).__name__)
+
+
+def _datetime(value):
+    if isinstance(value, str):
+        return _check_datetime(value)
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is not None:
+            raise ValueError('DATETIME values have no time zone')
+        return value.isoformat(' ')
+    if isinstance(value, datetime.date):
+        return value.isoformat() + ' 00:00:00'
+    raise TypeError('%s is not a DATETIME' % type(value).__name__)
+
+
+def _time(value):
+    if isinstance(value, str):
+        return _check_time(value)
+    if isinstance(value, datetime.time):
+        return value.isoformat()
+    raise TypeError('%s is not a TIME' % type(value).__name__)
+
+
+CONVERTERS = {
+    'INTEGER': _integer,
+    'INT64': _integer,
+    'FLOAT': _float,
+    'FLOAT64': _float,
+    'NUMERIC': _string,
+    'BOOLEAN': _boolean,
+    'BOOL': _boolean,
+    'STRING': _string,
+    'BYTES': _bytes,
+    'TIMESTAMP': _timestamp,
+    'DATE': _date,
+    'DATETIME': _datetime,
+    'TIME': _time,
+}
+
+# python type stored as is for a BigQuery type
+NATIVE_TYPES = {
+    'INTEGER': 'int',
+    'INT64': 'int',
+    'BOOLEAN': 'bool',
+    'BOOL': 'bool',
+    'STRING': 'str',
+}
+
+
+def _repeated(convert):
+    def check(value):
+        if not isinstance(value, (list, tuple)):
+            raise TypeError('%s is not a list' % type(value).__name__)
+        if None in value:
+            raise ValueError('REPEATED values can not contain null')
+        return [convert(item) for item in value]
+    return check
+
+
+def _record(encode):
+    def check(value):
+        if not isinstance(value, dict):
+            raise TypeError('%s is not a RECORD' % type(value).__name__)
+        return encode(value)
+    return check
+
+
+def compile_encoder(fields: List[dict], unknown: str = 'drop') -> Callable[[dict], dict]:
+    """
+    Generate the source of a function converting a row of the given
+    schema and compile it, so the per row cost is a straight sequence
+    of dict lookups and converter calls, without looping on the schema.
+
+    :param fields: schema fields, format of the API
+    :param unknown: what to do with columns missing from the schema,
+        'drop' them, 'flag' the row as invalid or 'keep' them unchanged
+    :return: function row -> converted row, raising BigQueryRowError
+    """
+    if unknown not in UNKNOWN_COLUMNS:
+        raise ValueError('unknown must be one of %s' % ', '.join(UNKNOWN_COLUMNS))
+    names = frozenset(field['name'] for field in fields)
+    env = {'BigQueryRowError': BigQueryRowError, 'names': names, '_invalid': _invalid}
+    lines = ['def encode(row):']
+    if unknown == 'flag':
+        lines += ['    if not names.issuperset(row):',
+                  '        raise BigQueryRowError(expression=", ".join(sorted(set(row) - names)),',
+                  '                               message="Unknown columns.")']
+    lines.append('    out = {k: v for k, v in row.items() if k not in names}'
+                 if unknown == 'keep' else '    out = {}')
+    for index, field in enumerate(fields):
+        col_type = field.get('type', 'STRING').upper()
+        if col_type in ('RECORD', 'STRUCT'):
+            convert = _record(compile_encoder(field.get('fields', []), unknown))
+        elif col_type in CONVERTERS:
+            convert = CONVERTERS[col_type]
+        else:
+            raise ValueError('%s is not a valid BigQuery type.' % col_type)
+        if field.get('mode') == 'REPEATED':
+            convert = _repeated(convert)
+        env['key%i' % index] = field['name']
+        env['convert%i' % index] = convert
+        lines.append('    value = row.get(key%i)' % index)
+        if field.get('mode') == 'REQUIRED':
+            lines += ['    if value is None:',
+                      '        raise _invalid(key%i, value, ValueError("value is required"))' % index]
+        lines.append('    if value is not None:')
+        if col_type in NATIVE_TYPES and field.get('mode') != 'REPEATED':
+            # values already of the right type are stored without a call
+            lines += ['        if type(value) is %s:' % NATIVE_TYPES[col_type],
+                      '            out[key%i] = value' % index,
+                      '        else:']
+        else:
+            lines.append('        if True:')
+        lines += ['            try:',
+                  '                out[key%i] = convert%i(value)' % (index, index),
+                  '            except (TypeError, ValueError, OverflowError, BigQueryRowError) as e:',
+                  '                raise _invalid(key%i, value, e)' % index]
+    lines.append('    return out')
+    exec(compile('\n'.join(lines), '<row encoder>', 'exec'), env)
+    return env['encode']
+
+
+def _invalid(column, value, error):
+    # expression is the path of the invalid column, e.g. 'address.zip'
+    if isinstance(error, BigQueryRowError):
+        return BigQueryRowError(expression='%s.%s' % (column, error.expression),
+                                message=error.message)
+    return BigQueryRowError(expression=column,
+                            message='%r is not valid: %s' % (value, error))
+
+
+class RowEncoder:
+    """
+    Row validator and encoder compiled for one schema. Rows are checked
+    and converted to the values BigQuery expects in an insertAll request:
+    numbers from strings, datetimes to strings, bytes to base64 ...
+    """
+
+    def __init__(self, fields: List[dict], unknown: str = 'drop'):
+        """
+        :param fields: schema fields, format of the API
+        :param unknown: what to do with columns missing from the schema,
+            'drop' them, 'flag' the row as invalid or 'keep' them unchanged
+        """
+        self.fields = fields
+        self.unknown = unknown
+        self.encode = compile_encoder(fields, unknown)
+
+    def encode_json(self, row: dict) -> bytes:
+        """
+        :param row: dict
+        :return: converted row, serialized to json
+        """
+        return dumps(self.encode(row))
+
+    def encode_lines(self, rows: Iterable[dict],
+                     on_invalid: Callable[[dict, BigQueryRowError], None] = None
+                     ) -> Iterator[Tuple[dict, bytes]]:
+        """
+        Convert and serialize rows for a load job, dropping the invalid
+        ones.
+
+        :param rows: iterable of dicts
+        :param on_invalid: called with each invalid row and its error,
+            None to raise the error instead
+        :return: generator of tuples (row, converted row serialized to json)
+        """
+        encode_json = self.encode_json
+        for row in rows:
+            try:
+                yield row, encode_json(row)
+            except BigQueryRowError as e:
+                if on_invalid is None:
+                    raise
+                on_invalid(row, e)
+
+    def is_valid(self, row: dict) -> bool:
+        try:
+            self.encode(row)
+        except BigQueryRowError:
+            return False
+        return True
+
+    def filter(self, rows: Iterable[dict],
+               on_invalid: Callable[[dict, BigQueryRowError], None] = None) -> Iterator[dict]:
+        """
+        Convert rows, dropping the invalid ones.
+
+        :param rows: iterable of dicts
+        :param on_invalid: called with each invalid row and its error,
+            None to raise the error instead
+        :return: generator of converted rows
+        """
+        encode = self.encode
+        for row in rows:
+            try:
+                yield encode(row)
+            except BigQueryRowError as e:
+                if on_invalid is None:
+                    raise
+                on_invalid(row, e)
+
+
+class Schema:
+    """
+    Schema of a table, as returned by parse_schema_from_string() or by
+    the API. Encoders are compiled on first use and kept, so a schema
+    object can be shared by every write to its table.
+    """
+
+    def __init__(self, schema: Union[dict, List[dict]]):
+        """
+        :param schema: dict column name -> type or list of schema fields
+        """
+        self.fields = to_fields(schema)
+        self._encoders = {}
+
+    @property
+    def names(self) -> List[str]:
+        return [field['name'] for field in self.fields]
+
+    def encoder(self, unknown: str = 'drop') -> RowEncoder:
+        """
+        :param unknown: what to do with columns missing from the schema,
+            'drop' them, 'flag' the row as invalid or 'keep' them unchanged
+        :return: RowEncoder compiled for this schema
+        """
+        encoder = self._encoders.get(unknown)
+        if encoder is None:
+            encoder = self._encoders[unknown] = RowEncoder(self.fields, unknown)
+        return encoder
+
+    def __repr__(self):
+        return '<Schema %s>' % ', '.join('%s:%s' % (field['name'], field.get('type'))
+                                         for field in self.fields)
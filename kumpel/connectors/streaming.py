@@ -0,0 +1,185 @@
+import itertools
+import logging
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import Callable, Iterable, Iterator, List
+
+from .batching import AdaptiveBatcher, is_payload_rejection
+
+BatchResult = namedtuple('BatchResult', ['index', 'rows', 'failed', 'latency'])
+BatchResult.__doc__ = """
+Outcome of a single insertAll request.
+
+ * index: position of the batch in the stream (0 based)
+ * rows: number of rows sent in the request
+ * failed: number of rows BigQuery did not accept
+ * latency: seconds spent waiting for the request to return
+"""
+
+
+def split_in_batches(data: Iterable[dict], batch_size: int) -> Iterator[List[dict]]:
+    """
+    Group a stream of rows in lists of at most batch_size rows.
+    Empty batches are never produced.
+
+    :param data: iterable of dicts
+    :param batch_size: maximum number of rows per batch
+    :return: generator of lists of dicts
+    """
+    batch = []
+    for row in data:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def count_failed_rows(response, rows: int) -> int:
+    """
+    Number of rows rejected by a push_rows call. The BigQuery-Python
+    client returns True/False when swallowing results, otherwise the raw
+    insertAll response with an optional 'insertErrors' list.
+
+    :param response: value returned by client.push_rows
+    :param rows: number of rows sent in the request
+    :return: number of failed rows
+    """
+    if response is True:
+        return 0
+    if isinstance(response, dict):
+        errors = response.get('insertErrors') or []
+        indexes = {error.get('index') for error in errors}
+        if None in indexes:
+            return rows
+        return len(indexes)
+    return rows
+
+
+def request_failure(error: Exception) -> dict:
+    """
+    insertAll response for a request which failed as a whole, as
+    BigQuery-Python returns it when not swallowing results.
+
+    :param error: exception raised by the request
+    :return: dict with an 'insertErrors' entry without row index
+    """
+    return {'insertErrors': [{'errors': [{'reason': 'httperror', 'message': str(error)}]}]}
+
+
+class ConcurrentWriter:
+    """
+    Push batches of rows through a worker pool while keeping a bounded
+    number of requests in flight. When the source is faster than
+    BigQuery, reading from it blocks until one of the pending requests
+    returns, so memory usage stays at roughly max_pending batches.
+
+    A request rejected as too large is split in two halves which are
+    sent again, recursively, until BigQuery accepts them.
+    """
+
+    def __init__(self,
+                 push: Callable[[List[dict], float], object],
+                 workers: int = 4,
+                 max_pending: int = None,
+                 batcher: AdaptiveBatcher = None):
+        """
+        :param push: callable (batch, queue_wait) sending one batch,
+            usually a closure around client.push_rows, queue_wait being
+            the seconds the batch waited for a free worker
+        :param workers: number of requests executed at the same time
+        :param max_pending: maximum number of batches read from the
+            source and not yet acknowledged, defaults to 2 * workers
+        :param batcher: optional AdaptiveBatcher informed about the
+            latency and the rejections of each request
+        """
+        if workers < 1:
+            raise ValueError('workers must be a positive integer.')
+        self.push = push
+        self.workers = workers
+        self.max_pending = max(max_pending or 2 * workers, workers)
+        self.batcher = batcher
+
+    def _push(self, batch: List[dict], queue_wait: float = 0.0) -> int:
+        """
+        Send a batch, bisecting it while it is rejected as too large.
+
+        :return: number of failed rows
+        """
+        try:
+            response = self.push(batch, queue_wait)
+        except Exception as e:
+            if len(batch) < 2 or not is_payload_rejection(e):
+                raise
+            response = e
+
+        if len(batch) > 1 and is_payload_rejection(response):
+            logging.info('BQ: request of %i rows rejected as too large, splitting it.'
+                         % len(batch))
+            if self.batcher is not None:
+                self.batcher.shrink(len(batch))
+            middle = len(batch) // 2
+            return self._push(batch[:middle]) + self._push(batch[middle:])
+
+        return count_failed_rows(response, len(batch))
+
+    def send(self, index: int, batch: List[dict], submitted: float = None) -> BatchResult:
+        """
+        Send one batch and report its outcome to the batcher.
+
+        :param index: position of the batch in the stream
+        :param batch: list of rows
+        :param submitted: perf_counter() when the batch was queued
+        :return: BatchResult
+        """
+        start = perf_counter()
+        queue_wait = 0.0 if submitted is None else start - submitted
+        failed = self._push(batch, queue_wait)
+        latency = perf_counter() - start
+        if self.batcher is not None:
+            self.batcher.observe(len(batch), latency)
+        result = BatchResult(index=index,
+                             rows=len(batch),
+                             failed=failed,
+                             latency=latency)
+        if result.failed:
+            logging.warning('BQ: %i of %i rows failed in batch %i.'
+                            % (result.failed, result.rows, index))
+        return result
+
+    def write(self, batches: Iterable[List[dict]]) -> List[BatchResult]:
+        """
+        Send all batches and wait for every request to return.
+
+        :param batches: iterable of lists of rows
+        :return: list of BatchResult ordered by batch index
+        """
+        if self.workers == 1:
+            return [self.send(index, batch) for index, batch in enumerate(batches)]
+
+        slots = threading.BoundedSemaphore(self.max_pending)
+        failed = threading.Event()
+
+        def release(future):
+            if future.exception() is not None:
+                failed.set()
+            slots.release()
+
+        futures = []
+        batches = iter(batches)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for index in itertools.count():
+                # the next batch is only read once a slot is free
+                slots.acquire()
+                batch = None if failed.is_set() else next(batches, None)
+                if batch is None:
+                    # source exhausted, or stop reading it: the error is raised below
+                    slots.release()
+                    break
+                future = executor.submit(self.send, index, batch, perf_counter())
+                future.add_done_callback(release)
+                futures.append(future)
+        return [future.result() for future in futures]
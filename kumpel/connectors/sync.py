@@ -0,0 +1,225 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from time import perf_counter
+
+from .abstract import SQLConnector
+from .errors import BigQueryError
+
+SyncResult = namedtuple('SyncResult', [
+    'source', 'target', 'column', 'low', 'high', 'rows', 'failed', 'elapsed'
+])
+SyncResult.__doc__ = """
+Outcome of a TableSync run.
+
+ * source, target: 'dataset.table' names
+ * column: watermark column
+ * low: watermark before the run, None for the first run
+ * high: watermark committed by the run, equal to low when there was
+   nothing new
+ * rows: number of rows copied
+ * failed: number of rows the target rejected, the watermark is not
+   committed when it is not 0
+ * elapsed: seconds the run took
+"""
+
+
+class WatermarkStore:
+    """
+    Local sqlite file keeping the last synced watermark of each table,
+    with the time it was committed.
+    """
+
+    def __init__(self, path: str):
+        """
+        :param path: sqlite file, created if it does not exist
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS watermarks ('
+                       'key TEXT PRIMARY KEY, value TEXT, updated REAL)')
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def get(self, key: str):
+        """
+        :param key: see TableSync.state_key()
+        :return: the watermark, None if nothing was synced yet
+        """
+        with self._lock, self._connect() as db:
+            row = db.execute('SELECT value FROM watermarks WHERE key = ?', (key,)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def set(self, key: str, value) -> None:
+        """
+        :param key: see TableSync.state_key()
+        :param value: watermark, any json serializable value
+        """
+        with self._lock, self._connect() as db:
+            db.execute('INSERT OR REPLACE INTO watermarks VALUES (?, ?, ?)',
+                       (key, json.dumps(value), time.time()))
+
+    def delete(self, key: str) -> None:
+        """
+        Forget a watermark, the next run copies the whole table again.
+        """
+        with self._lock, self._connect() as db:
+            db.execute('DELETE FROM watermarks WHERE key = ?', (key,))
+
+    def items(self) -> dict:
+        """
+        :return: dict key -> watermark
+        """
+        with self._lock, self._connect() as db:
+            rows = db.execute('SELECT key, value FROM watermarks').fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+
+def sql_literal(value, col_type: str) -> str:
+    """
+    Standard sql literal of a watermark, as returned by a query on a
+    column of type col_type.
+
+    :param value: watermark
+    :param col_type: BigQuery type of the watermark column
+    :return: sql expression
+    """
+    if col_type in ('INTEGER', 'INT64'):
+        return '%i' % int(value)
+    if col_type in ('FLOAT', 'FLOAT64', 'NUMERIC'):
+        return repr(float(value))
+    if col_type == 'TIMESTAMP' and isinstance(value, (int, float)):
+        # BigQuery-Python returns timestamps as seconds since epoch
+        return 'TIMESTAMP_MICROS(%i)' % round(value * 1000000)
+    return "'%s'" % str(value).replace('\\', '\\\\').replace("'", "\\'")
+
+
+class TableSync:
+    """
+    Incremental copy of tables from a source to a target connector.
+
+    Each run reads the greatest value of the watermark column (an
+    increasing timestamp or id) and copies only the rows between the
+    watermark of the previous run and that value, so the cost of a run
+    depends on the new rows, not on the size of the table. Rows are
+    streamed to the target in batches. The new watermark is committed
+    to the store only once the target accepted all of them; a failed
+    run is repeated entirely by the next one.
+
+    Rows whose watermark is null are never copied, and rows inserted
+    with a watermark lower than the committed one are missed.
+    """
+
+    def __init__(self, source: SQLConnector, target: SQLConnector, store: WatermarkStore,
+                 read_options: dict = None):
+        """
+        :param source: connector the tables are read from, queries are
+            standard sql quoted with source.quote_table() and
+            source.quote_column()
+        :param target: connector the rows are written to
+        :param store: where watermarks are kept between runs
+        :param read_options: keyword arguments of source.read_query(),
+            defaults to source.standard_sql_options()
+        """
+        self.source = source
+        self.target = target
+        self.store = store
+        self.read_options = (source.standard_sql_options() if read_options is None
+                             else read_options)
+
+    @staticmethod
+    def state_key(dataset, table, target_dataset, target_table, column) -> str:
+        return '%s.%s>%s.%s:%s' % (dataset, table, target_dataset, target_table, column)
+
+    def _column_type(self, dataset, table, column):
+        for field in self.source.get_schema_from_table(dataset, table) or []:
+            if field['name'] == column:
+                return field['type']
+        raise BigQueryError(expression='Unknown watermark column.',
+                            message='%s.%s has no column %s.' % (dataset, table, column))
+
+    def _read_query(self, sql):
+        return self.source.read_query(sql, **self.read_options)
+
+    def _high(self, dataset, table, column, low_sql):
+        quoted = self.source.quote_column(column)
+        sql = 'SELECT MAX(%s) AS high FROM %s' % (quoted, self.source.quote_table(dataset, table))
+        if low_sql is not None:
+            sql += ' WHERE %s > %s' % (quoted, low_sql)
+        rows = list(self._read_query(sql))
+        return rows[0]['high'] if rows else None
+
+    def sync(self, dataset, table, column, target_dataset=None, target_table=None,
+             batch_size=10000, workers=4, primary_key=None) -> SyncResult:
+        """
+        Copy the rows of a table added since the previous run.
+
+        :param dataset: source dataset
+        :param table: source table
+        :param column: watermark column, increasing with new rows
+        :param target_dataset: target dataset, defaults to dataset
+        :param target_table: target table, defaults to table, created
+            with the schema of the source table if it does not exist
+        :param batch_size: maximum number of rows per insert request
+        :param workers: number of insert requests sent at the same time
+        :param primary_key: column used as insert id, so that rows sent
+            again after a failed run are deduplicated by BigQuery
+        :return: SyncResult
+        """
+        start = perf_counter()
+        target_dataset = target_dataset or dataset
+        target_table = target_table or table
+        key = self.state_key(dataset, table, target_dataset, target_table, column)
+        col_type = self._column_type(dataset, table, column)
+        low = self.store.get(key)
+        low_sql = None if low is None else sql_literal(low, col_type)
+
+        def result(high, rows=0, failed=0):
+            return SyncResult(source='%s.%s' % (dataset, table),
+                              target='%s.%s' % (target_dataset, target_table),
+                              column=column, low=low, high=high, rows=rows,
+                              failed=failed, elapsed=perf_counter() - start)
+
+        high = self._high(dataset, table, column, low_sql)
+        if high is None:
+            logging.info('BQ: nothing new in %s.%s since %s=%r.' % (dataset, table, column, low))
+            return result(low)
+
+        if not self.target.exists(target_dataset, target_table):
+            self.target.create_table(target_dataset, target_table,
+                                     self.source.get_schema_from_table(dataset, table))
+
+        quoted = self.source.quote_column(column)
+        sql = 'SELECT * FROM %s WHERE %s <= %s' % (self.source.quote_table(dataset, table),
+                                                   quoted, sql_literal(high, col_type))
+        if low_sql is not None:
+            sql += ' AND %s > %s' % (quoted, low_sql)
+        rows = self._read_query(sql)
+        if hasattr(self.target, 'stream_to_table'):
+            batches = self.target.stream_to_table(target_dataset, target_table, rows,
+                                                  primary_key=primary_key,
+                                                  batch_write=batch_size,
+                                                  workers=workers)
+            copied = sum(batch.rows for batch in batches)
+            failed = sum(batch.failed for batch in batches)
+        else:
+            # connectors without per batch results raise on failures
+            copied = self.target.write_to_table(target_dataset, target_table, rows)
+            failed = 0
+        if failed:
+            logging.error('BQ: %i of %i rows rejected by %s.%s, watermark of %s.%s kept at %r.'
+                          % (failed, copied, target_dataset, target_table, dataset, table, low))
+            return result(low, copied, failed)
+
+        self.store.set(key, high)
+        logging.info('BQ: %i rows of %s.%s synced to %s.%s, %s=%r.'
+                     % (copied, dataset, table, target_dataset, target_table, column, high))
+        return result(high, copied)
@@ -0,0 +1,111 @@
+from collections import namedtuple
+from typing import List, Union
+
+TableShard = namedtuple('TableShard', ['dataset', 'table', 'start', 'stop', 'fields'])
+TableShard.__doc__ = """
+Range of rows [start, stop) of a table, restricted to some fields (all
+fields when None). Shards are plain tuples, so they can be sent to
+worker processes which read them with their own connector.
+"""
+
+
+def to_fields(schema: Union[dict, List[dict]]) -> List[dict]:
+    """
+    Schema as a list of fields, the format of the API. Accepts the dicts
+    returned by parse_schema_from_string() ({'column': 'TYPE'}) as well.
+
+    :param schema: dict column name -> type or list of schema fields
+    :return: list of schema fields
+    """
+    if isinstance(schema, dict):
+        return [{'name': name, 'type': col_type, 'mode': 'NULLABLE'}
+                for name, col_type in schema.items()]
+    return [dict(field) for field in schema]
+
+
+def _decode_value(value, field: dict):
+    if value is None:
+        return None
+    col_type = field.get('type')
+    if col_type in ('RECORD', 'STRUCT'):
+        return decode_row(value, field.get('fields', []))
+    if col_type in ('INTEGER', 'INT64'):
+        return int(value)
+    if col_type in ('FLOAT', 'FLOAT64'):
+        return float(value)
+    if col_type in ('BOOLEAN', 'BOOL'):
+        return value in ('true', 'True', True)
+    if col_type == 'TIMESTAMP':
+        return float(value)
+    return value
+
+
+def decode_cell(value, field: dict):
+    """
+    Convert the value of a cell as returned by the API.
+
+    :param value: the 'v' member of a cell
+    :param field: schema field of the cell
+    :return: python value, a list for REPEATED fields
+    """
+    if field.get('mode') == 'REPEATED':
+        return [_decode_value(item['v'], field) for item in value or []]
+    return _decode_value(value, field)
+
+
+def decode_row(row: dict, fields: List[dict]) -> dict:
+    """
+    Convert a row as returned by the API, {'f': [{'v': value}, ...]},
+    into a dict with the same value types as BigQuery-Python.
+
+    :param row: row resource
+    :param fields: schema fields of the row, in the order of the values
+    :return: dict with column names as keys
+    """
+    return {field['name']: decode_cell(cell['v'], field)
+            for cell, field in zip(row['f'], fields)}
+
+
+def select_fields(schema: List[dict], fields: List[str] = None) -> List[dict]:
+    """
+    Schema fields returned by tabledata.list when projecting on some
+    columns: the selected ones, in the order of the table schema.
+
+    :param schema: list of schema fields of the table
+    :param fields: column names, None for all columns
+    :return: list of schema fields
+    """
+    if not fields:
+        return list(schema)
+    missing = set(fields) - {field['name'] for field in schema}
+    if missing:
+        raise KeyError('Unknown columns: %s' % ', '.join(sorted(missing)))
+    return [field for field in schema if field['name'] in fields]
+
+
+def split_in_shards(dataset: str,
+                    table: str,
+                    row_count: int,
+                    shards: int,
+                    fields: List[str] = None) -> List[TableShard]:
+    """
+    Split the rows of a table in contiguous ranges of equal size.
+
+    :param dataset: dataset name
+    :param table: table name
+    :param row_count: number of rows in the table
+    :param shards: number of ranges
+    :param fields: columns to read, None for all
+    :return: list of TableShard, empty if the table has no rows
+    """
+    shards = max(1, min(shards, row_count))
+    size, remainder = divmod(row_count, shards)
+    ranges = []
+    start = 0
+    for index in range(shards):
+        stop = start + size + (1 if index < remainder else 0)
+        if stop > start:
+            ranges.append(TableShard(dataset, table, start, stop,
+                                     tuple(fields) if fields else None))
+        start = stop
+    return ranges
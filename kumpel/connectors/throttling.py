@@ -0,0 +1,323 @@
+import logging
+import random
+import threading
+import time
+from typing import Callable, Dict
+
+# http statuses after which the same call succeeds once BigQuery recovers
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+# reasons and messages of errors without a usable http status
+RETRYABLE_HINTS = (
+    'ratelimitexceeded',
+    'backenderror',
+    'internalerror',
+    'exceeded rate limits',
+    'httperror 429',
+    'httperror 500',
+    'httperror 502',
+    'httperror 503',
+    'httperror 504',
+    'timed out',
+    'connection reset',
+)
+
+# calls per second BigQuery accepts per method and user
+DEFAULT_RATE = 100.0
+
+# calls which can be made again without side effect: reads only. Calls
+# creating a job, a table or rows are retried only when the caller
+# makes them idempotent (insert ids, client generated job ids)
+IDEMPOTENT_METHODS = frozenset((
+    'check_dataset',
+    'check_job',
+    'check_table',
+    'get_all_tables',
+    'get_datasets',
+    'get_query_rows',
+    'get_query_schema',
+    'get_table',
+    'get_table_schema',
+    'jobs.get',
+    'jobs.getQueryResults',
+    'tabledata.list',
+))
+
+
+def error_status(outcome) -> int:
+    """
+    :param outcome: exception raised by a client call
+    :return: http status of the error, None if it has none
+    """
+    status = getattr(getattr(outcome, 'resp', None), 'status', None)
+    return None if status is None else int(status)
+
+
+def is_retryable(outcome) -> bool:
+    """
+    Check if a call failed because of a rate limit or a transient server
+    error, so that the same call can be made again. Handles exceptions
+    and the insertAll responses of BigQuery-Python, which turns request
+    errors into an 'insertErrors' entry without row index.
+
+    :param outcome: exception raised or value returned by a client call
+    :return: True if the call can be retried
+    """
+    if isinstance(outcome, Exception):
+        status = error_status(outcome)
+        if status is not None:
+            return status in RETRYABLE_STATUSES or (
+                status == 403 and 'ratelimitexceeded' in str(outcome).lower())
+        if isinstance(outcome, (ConnectionError, TimeoutError)):
+            return True
+        text = str(outcome)
+    elif isinstance(outcome, dict):
+        errors = outcome.get('insertErrors') or []
+        if not errors or any(error.get('index') is not None for error in errors):
+            # errors on single rows, retrying sends the same invalid rows
+            return False
+        text = str(errors)
+    else:
+        return False
+    text = text.lower()
+    return any(hint in text for hint in RETRYABLE_HINTS)
+
+
+def is_overload(outcome) -> bool:
+    """
+    Check if a retryable failure means BigQuery is overloaded (rate
+    limit or server error) rather than a network hiccup.
+    """
+    status = error_status(outcome) if isinstance(outcome, Exception) else None
+    if status is not None:
+        return status == 403 or status in RETRYABLE_STATUSES
+    return not isinstance(outcome, (ConnectionError, TimeoutError))
+
+
+class TokenBucket:
+    """
+    Limit the rate of calls: a call takes a token, tokens are added at
+    rate per second up to burst. A call without token waits for the
+    next one; waiting calls are served in the order they arrived.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        """
+        :param rate: tokens added per second
+        :param burst: maximum number of tokens, defaults to rate
+        """
+        if rate <= 0:
+            raise ValueError('rate must be positive.')
+        self.rate = rate
+        self.burst = max(1.0, burst if burst is not None else rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Take a token, waiting for it if needed.
+
+        :return: seconds waited
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class AdaptiveLimit:
+    """
+    Number of calls allowed in flight at the same time, adapted with
+    AIMD: each successful call adds increase / limit (about increase per
+    round of calls), a call rejected by an overloaded BigQuery multiplies
+    the limit by decrease. Calls started before a decrease do not
+    decrease it again, so a burst of errors halves the limit only once.
+    """
+
+    def __init__(self, initial: int = 16, minimum: int = 1, maximum: int = 128,
+                 increase: float = 1.0, decrease: float = 0.5):
+        """
+        :param initial: limit before any call
+        :param minimum: lowest limit
+        :param maximum: highest limit
+        :param increase: additive increase per round of successful calls
+        :param decrease: multiplicative decrease after an overload error
+        """
+        if not 1 <= minimum <= initial <= maximum:
+            raise ValueError('limits must verify 1 <= minimum <= initial <= maximum.')
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.in_flight = 0
+        self._decreased = 0.0
+        self._cond = threading.Condition()
+
+    def acquire(self) -> float:
+        """
+        Wait for a free slot.
+
+        :return: time the slot was granted, to pass to release()
+        """
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            return time.monotonic()
+
+    def release(self, granted: float, overloaded: bool = False) -> None:
+        """
+        Free a slot and adapt the limit to the outcome of the call.
+
+        :param granted: value returned by acquire()
+        :param overloaded: True if BigQuery rejected the call because of
+            a rate limit or a server error
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if overloaded:
+                if granted >= self._decreased:
+                    self.limit = max(self.minimum, self.limit * self.decrease)
+                    self._decreased = time.monotonic()
+                    logging.info('BQ: BigQuery overloaded, %i calls in flight at most.'
+                                 % int(self.limit))
+            else:
+                self.limit = min(self.maximum, self.limit + self.increase / self.limit)
+            self._cond.notify_all()
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter between the attempts of a call.
+    """
+
+    def __init__(self, retries: int = 5, initial_delay: float = 1.0,
+                 max_delay: float = 32.0, multiplier: float = 2.0):
+        """
+        :param retries: number of attempts after the first one
+        :param initial_delay: maximum seconds before the first retry
+        :param max_delay: maximum seconds between two attempts
+        :param multiplier: growth of the delay after each attempt
+        """
+        self.retries = retries
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+
+    def delay(self, attempt: int) -> float:
+        """
+        :param attempt: number of the retry, from 1
+        :return: seconds to wait before it
+        """
+        ceiling = min(self.max_delay, self.initial_delay * self.multiplier ** (attempt - 1))
+        return random.uniform(0, ceiling)
+
+
+class Throttle:
+    """
+    Pacing shared by every call of the connectors it is given to:
+
+     * a token bucket per method caps the calls per second,
+     * an AdaptiveLimit caps the calls in flight, shrinking when
+       BigQuery answers with rate limit or server errors and growing
+       while calls succeed,
+     * idempotent calls failing with a retryable error are made again
+       after an exponential backoff, see IDEMPOTENT_METHODS.
+
+    A single Throttle shared by all the threads (and connectors) of a
+    process keeps the throughput close to the quotas without error
+    storms.
+    """
+
+    def __init__(self,
+                 rates: Dict[str, float] = None,
+                 default_rate: float = DEFAULT_RATE,
+                 burst: float = 1.0,
+                 limit: AdaptiveLimit = None,
+                 retry: RetryPolicy = None):
+        """
+        :param rates: calls per second by method name ('push_rows',
+            'check_job', 'get_query_rows' ...), overriding default_rate
+        :param default_rate: calls per second of the other methods, None
+            for no rate limit
+        :param burst: calls a method can make at once after being idle;
+            quotas counted over a sliding second are exceeded when it is
+            large
+        :param limit: AdaptiveLimit, defaults to AdaptiveLimit()
+        :param retry: RetryPolicy, defaults to RetryPolicy()
+        """
+        self.rates = dict(rates or {})
+        self.default_rate = default_rate
+        self.burst = burst
+        self.limit = limit or AdaptiveLimit()
+        self.retry = retry or RetryPolicy()
+        self.retried = 0
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, method: str) -> TokenBucket:
+        """
+        :return: token bucket of a method, None when it is not limited
+        """
+        bucket = self._buckets.get(method)
+        if bucket is None:
+            rate = self.rates.get(method, self.default_rate)
+            if rate is None:
+                return None
+            with self._lock:
+                bucket = self._buckets.setdefault(method, TokenBucket(rate, self.burst))
+        return bucket
+
+    def call(self, method: str, func: Callable[[], object], stats: dict = None,
+             retry: bool = None):
+        """
+        Make a call within the rate and concurrency limits, retrying it
+        on retryable errors when it is idempotent.
+
+        :param method: name of the call
+        :param func: callable without arguments making the call
+        :param stats: optional dict receiving 'retries' and 'queue_wait'
+            (seconds spent waiting for a token or a slot)
+        :param retry: True if the call can be made again safely, defaults
+            to method being in IDEMPOTENT_METHODS
+        :return: value returned by func
+        """
+        if retry is None:
+            retry = method in IDEMPOTENT_METHODS
+        retries = self.retry.retries if retry else 0
+        bucket = self.bucket(method)
+        attempt = 0
+        waited = 0.0
+        while True:
+            start = time.monotonic()
+            if bucket is not None:
+                bucket.acquire()
+            granted = self.limit.acquire()
+            waited += time.monotonic() - start
+            try:
+                outcome = func()
+            except Exception as e:
+                outcome = e
+            retryable = is_retryable(outcome)
+            self.limit.release(granted, overloaded=retryable and is_overload(outcome))
+            if not retryable or attempt >= retries:
+                if stats is not None:
+                    stats['retries'] = attempt
+                    stats['queue_wait'] = waited
+                if isinstance(outcome, Exception):
+                    raise outcome
+                return outcome
+            attempt += 1
+            with self._lock:
+                self.retried += 1
+            delay = self.retry.delay(attempt)
+            logging.warning('BQ: %s failed (%s), retry %i of %i in %.1f s.'
+                            % (method, str(outcome)[:200], attempt, retries, delay))
+            time.sleep(delay)
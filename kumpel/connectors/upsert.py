@@ -0,0 +1,52 @@
+from collections import namedtuple
+from typing import List
+
+UpsertResult = namedtuple('UpsertResult', [
+    'dataset', 'table', 'rows', 'affected', 'job_id', 'elapsed'
+])
+UpsertResult.__doc__ = """
+Outcome of BigQuery.upsert_to_table().
+
+ * rows: number of rows staged
+ * affected: number of rows of the table updated or inserted by the
+   MERGE statement
+ * job_id: id of the MERGE query job, None when there was nothing to merge
+ * elapsed: seconds the upsert took
+"""
+
+
+def _quote(name: str) -> str:
+    return '`%s`' % name
+
+
+def merge_query(dataset: str,
+                table: str,
+                staging_dataset: str,
+                staging_table: str,
+                fields: List[dict],
+                keys: List[str]) -> str:
+    """
+    Standard sql MERGE statement applying the rows of a staging table to
+    a table: rows matching on the key columns are updated, the others
+    are inserted.
+
+    :param dataset: dataset of the target table
+    :param table: target table
+    :param staging_dataset: dataset of the staging table
+    :param staging_table: staging table, with the schema of the target
+    :param fields: schema fields of the target table
+    :param keys: names of the key columns
+    :return: sql
+    """
+    names = [field['name'] for field in fields]
+    condition = ' AND '.join('T.%s = S.%s' % (_quote(key), _quote(key)) for key in keys)
+    sql = 'MERGE `%s.%s` T\nUSING `%s.%s` S\nON %s\n' % (dataset, table, staging_dataset,
+                                                          staging_table, condition)
+    updated = [name for name in names if name not in keys]
+    if updated:
+        sql += 'WHEN MATCHED THEN UPDATE SET %s\n' % ', '.join(
+            '%s = S.%s' % (_quote(name), _quote(name)) for name in updated)
+    sql += 'WHEN NOT MATCHED THEN INSERT (%s) VALUES (%s)' % (
+        ', '.join(_quote(name) for name in names),
+        ', '.join('S.%s' % _quote(name) for name in names))
+    return sql
@@ -8,7 +8,7 @@ setup(
     classifiers=[
         'Development Status :: 3 - Alpha',
         'License :: OSI Approved :: MIT License',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3.7',
         'Topic :: Database',
     ],
     keywords='etl business intelligence bigquery data',
@@ -17,9 +17,14 @@ setup(
     author_email='avram.dames@gmail.com',
     license='MIT',
     packages=find_packages(),
+    python_requires='>=3.7',
     install_requires=[
         'bigquery-python',
     ],
+    extras_require={
+        'columnar': ['numpy'],
+        'storage': ['google-cloud-storage'],
+    },
     include_package_data=True,
     zip_safe=False
 )
@@ -0,0 +1,56 @@
+import asyncio
+import subprocess
+import sys
+import unittest
+
+from kumpel import AsyncBigQuery
+
+from helpers import dummy_bigquery, make_rows
+
+
+class AsyncBigQueryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bq = AsyncBigQuery(connector=dummy_bigquery(), max_calls=4)
+
+    def tearDown(self):
+        self.bq.close()
+
+    def test_rows_written_are_read_back(self):
+        async def main():
+            sent = await self.bq.write_to_table('ds', 'events', make_rows(250),
+                                                batch_write=50, workers=3)
+            rows = await self.bq.read_data('ds', 'events', batch=40).fetch_all()
+            return sent, sorted(row['id'] for row in rows)
+
+        sent, ids = asyncio.run(main())
+        self.assertEqual(sent, 250)
+        self.assertEqual(ids, list(range(250)))
+
+    def test_read_query(self):
+        self.bq.sync.write_to_table('ds', 'events', make_rows(30))
+
+        async def main():
+            rows = self.bq.read_query('SELECT id FROM [ds.events] WHERE id < 10', batch_read=3)
+            return [row['id'] async for row in rows]
+
+        self.assertEqual(sorted(asyncio.run(main())), list(range(10)))
+
+    def test_write_query_to_table(self):
+        self.bq.sync.write_to_table('ds', 'events', make_rows(30))
+
+        async def main():
+            await self.bq.write_query_to_table('SELECT * FROM [ds.events] WHERE id < 5',
+                                               'ds', 'copy')
+            return await self.bq.get_table('ds', 'copy')
+
+        self.assertEqual(int(asyncio.run(main())['numRows']), 5)
+
+    def test_asyncio_is_imported_on_first_use(self):
+        code = 'import sys, kumpel; print("asyncio" in sys.modules)'
+        output = subprocess.check_output([sys.executable, '-c', code])
+        self.assertEqual(output.strip(), b'False')
+
+
+if __name__ == '__main__':
+    unittest.main()
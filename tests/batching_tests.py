@@ -0,0 +1,61 @@
+import unittest
+
+from kumpel.connectors.batching import AdaptiveBatcher, is_payload_rejection, row_size
+from kumpel.connectors.emulator import EmulatedHttpError
+
+from helpers import dummy_bigquery, make_rows
+
+
+class AdaptiveBatcherTests(unittest.TestCase):
+
+    def test_batches_are_bounded_in_bytes(self):
+        rows = make_rows(100)
+        limit = 10 * row_size(rows[0])
+        batches = list(AdaptiveBatcher(max_bytes=limit).batches(rows))
+        self.assertTrue(all(sum(row_size(row) for row in batch) <= limit for batch in batches))
+        self.assertEqual(sum(len(batch) for batch in batches), 100)
+
+    def test_batches_are_bounded_in_rows(self):
+        batches = list(AdaptiveBatcher(max_rows=30).batches(make_rows(100)))
+        self.assertEqual([len(batch) for batch in batches], [30, 30, 30, 10])
+
+    def test_payload_rejection(self):
+        self.assertTrue(is_payload_rejection(EmulatedHttpError(413, 'too large')))
+        self.assertFalse(is_payload_rejection(EmulatedHttpError(503, 'unavailable')))
+        self.assertFalse(is_payload_rejection(EmulatedHttpError(400, 'invalid value in row 4130')))
+        self.assertFalse(is_payload_rejection(
+            {'insertErrors': [{'index': 0, 'errors': [{'reason': 'invalid'}]}]}))
+
+
+class BisectTests(unittest.TestCase):
+    """
+    Requests rejected as too large by a client swallowing results, the
+    default of BigQuery-Python, are split until they are accepted.
+    """
+
+    def setUp(self):
+        self.bq = dummy_bigquery()
+        self.assertTrue(self.bq.client.swallow_results)
+        # BigQuery accepts fewer bytes than the writer puts in a request
+        self.bq.client.max_request_bytes = 8 * row_size(make_rows(1)[0])
+
+    def test_rejected_requests_are_bisected(self):
+        results = self.bq.stream_to_table('ds', 'events', make_rows(100), batch_write=50)
+        self.assertFalse(any(result.failed for result in results))
+        ids = sorted(row['id'] for row in self.bq.read_data('ds', 'events'))
+        self.assertEqual(ids, list(range(100)))
+
+    def test_rejected_requests_are_bisected_concurrently(self):
+        sent = self.bq.write_to_table('ds', 'events', make_rows(200), batch_write=50, workers=4)
+        self.assertEqual(sent, 200)
+        self.assertEqual(int(self.bq.get_table('ds', 'events')['numRows']), 200)
+
+    def test_single_row_too_large_fails(self):
+        self.bq.client.max_request_bytes = 1
+        results = self.bq.stream_to_table('ds', 'events', make_rows(4), batch_write=4)
+        self.assertEqual(sum(result.failed for result in results), 4)
+        self.assertEqual(int(self.bq.get_table('ds', 'events')['numRows']), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import threading
+import time
+import unittest
+
+from kumpel.connectors.streaming import ConcurrentWriter, count_failed_rows, split_in_batches
+
+from helpers import dummy_bigquery, make_rows
+
+
+def table_rows(bq, dataset, table):
+    return int(bq.get_table(dataset, table)['numRows'])
+
+
+class WriteToTableTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bq = dummy_bigquery()
+
+    def test_rows_written_are_read_back(self):
+        sent = self.bq.write_to_table('ds', 'events', make_rows(2500),
+                                      batch_write=300, workers=4)
+        self.assertEqual(sent, 2500)
+        ids = sorted(row['id'] for row in self.bq.read_data('ds', 'events'))
+        self.assertEqual(ids, list(range(2500)))
+
+    def test_stream_to_table_reports_each_batch(self):
+        results = self.bq.stream_to_table('ds', 'events', make_rows(1000),
+                                          batch_write=250, workers=3)
+        self.assertEqual([result.index for result in results], [0, 1, 2, 3])
+        self.assertEqual([result.rows for result in results], [250] * 4)
+        self.assertFalse(any(result.failed for result in results))
+        self.assertEqual(table_rows(self.bq, 'ds', 'events'), 1000)
+
+    def test_invalid_rows_are_counted_as_failed(self):
+        rows = [{'id': 1, 'name': 'a'}, {'id': 'not a number', 'name': 'b'}]
+        results = self.bq.stream_to_table('ds', 'events', rows, workers=1)
+        self.assertEqual(results[0].failed, 2)
+        self.assertEqual(table_rows(self.bq, 'ds', 'events'), 0)
+
+
+class ConcurrentWriterTests(unittest.TestCase):
+
+    def test_split_in_batches(self):
+        self.assertEqual([len(batch) for batch in split_in_batches(range(7), 3)], [3, 3, 1])
+        self.assertEqual(list(split_in_batches([], 3)), [])
+
+    def test_count_failed_rows(self):
+        self.assertEqual(count_failed_rows(True, 10), 0)
+        self.assertEqual(count_failed_rows(False, 10), 10)
+        self.assertEqual(count_failed_rows({'insertErrors': [{'index': 1}, {'index': 4}]}, 10), 2)
+        self.assertEqual(count_failed_rows({'insertErrors': [{'errors': []}]}, 10), 10)
+        self.assertEqual(count_failed_rows({'kind': 'response'}, 10), 0)
+
+    def test_requests_in_flight_and_memory_are_bounded(self):
+        lock = threading.Lock()
+        state = {'running': 0, 'max_running': 0, 'read': 0, 'done': 0, 'max_ahead': 0}
+
+        def push(batch, queue_wait):
+            with lock:
+                state['running'] += 1
+                state['max_running'] = max(state['max_running'], state['running'])
+            time.sleep(0.01)
+            with lock:
+                state['running'] -= 1
+                state['done'] += 1
+            return True
+
+        def batches():
+            for index in range(40):
+                with lock:
+                    state['read'] += 1
+                    state['max_ahead'] = max(state['max_ahead'], state['read'] - state['done'])
+                yield [{'id': index}]
+
+        writer = ConcurrentWriter(push, workers=4, max_pending=6)
+        results = writer.write(batches())
+        self.assertEqual(len(results), 40)
+        self.assertEqual([result.index for result in results], list(range(40)))
+        self.assertLessEqual(state['max_running'], 4)
+        self.assertGreater(state['max_running'], 1)
+        self.assertLessEqual(state['max_ahead'], 6)
+
+    def test_error_stops_reading_the_source(self):
+        read = []
+
+        def push(batch, queue_wait):
+            raise RuntimeError('boom')
+
+        def batches():
+            for index in range(1000):
+                read.append(index)
+                yield [{'id': index}]
+
+        writer = ConcurrentWriter(push, workers=2, max_pending=2)
+        with self.assertRaises(RuntimeError):
+            writer.write(batches())
+        self.assertLess(len(read), 1000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,103 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from kumpel import QueryResultCache
+from kumpel.connectors.cache import cache_key, normalize_query, tables_in_query
+
+from helpers import dummy_bigquery
+
+ROWS = [{'id': 1, 'name': 'a', 'score': 0.5, 'ok': True, 'tags': ['x'], 'rec': {'k': 1}},
+        {'id': 2, 'name': None, 'score': 1.5, 'ok': False, 'tags': [], 'rec': None}]
+
+
+class QueryHelpersTests(unittest.TestCase):
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query(' SELECT  1\n FROM t ;'), 'SELECT 1 FROM t')
+
+    def test_cache_key_ignores_white_spaces(self):
+        self.assertEqual(cache_key('SELECT 1', 'p', True), cache_key(' SELECT  1;', 'p', True))
+        self.assertNotEqual(cache_key('SELECT 1', 'p', True), cache_key('SELECT 1', 'p', False))
+
+    def test_tables_in_query(self):
+        query = 'SELECT * FROM [p:ds.a] JOIN `p.ds.B` ON 1 = 1 JOIN ds.c ON 1 = 1'
+        self.assertEqual(tables_in_query(query), ['ds.a', 'ds.b', 'ds.c'])
+
+
+class QueryResultCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = QueryResultCache(self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_rows_are_read_back(self):
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(list(self.cache.store('key', ROWS)), ROWS)
+        self.assertEqual(list(self.cache.get('key')), ROWS)
+
+    def test_files_hold_json_lines(self):
+        list(self.cache.store('key', ROWS))
+        with open(os.path.join(self.directory, 'key.jsonl'), 'rb') as fin:
+            self.assertTrue(fin.read().startswith(b'[["id",'))
+
+    def test_partially_read_result_is_not_cached(self):
+        rows = self.cache.store('key', ROWS)
+        next(rows)
+        rows.close()
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_expired_entry(self):
+        list(self.cache.store('key', ROWS, ttl=-1))
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_invalidate(self):
+        list(self.cache.store('a', ROWS, tables=['ds.events']))
+        list(self.cache.store('b', ROWS, tables=['ds.users']))
+        self.assertEqual(self.cache.invalidate('ds', 'events'), 1)
+        self.assertIsNone(self.cache.get('a'))
+        self.assertIsNotNone(self.cache.get('b'))
+        self.assertEqual(self.cache.invalidate('ds'), 1)
+
+    def test_eviction(self):
+        list(self.cache.store('a', ROWS))
+        size = os.path.getsize(os.path.join(self.directory, 'a.jsonl'))
+        self.cache.max_bytes = size * 2
+        list(self.cache.store('b', ROWS))
+        self.cache.get('a')
+        list(self.cache.store('c', ROWS))
+        self.assertIsNotNone(self.cache.get('a'))
+        self.assertIsNone(self.cache.get('b'))
+
+
+class CachedQueryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.bq = dummy_bigquery({'id': 'INTEGER'}, [{'id': 1}, {'id': 2}],
+                                 cache=QueryResultCache(self.directory))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def count(self):
+        return list(self.bq.read_query('SELECT COUNT(1) AS n FROM [ds.events]'))[0]['n']
+
+    def test_cached_result_skips_the_query(self):
+        self.assertEqual(self.count(), 2)
+        self.assertEqual(self.count(), 2)
+        self.assertEqual(self.bq.client.calls['query'], 1)
+
+    def test_entry_is_invalidated_after_write_to_table(self):
+        self.assertEqual(self.count(), 2)
+        self.bq.write_to_table('ds', 'events', [{'id': 3}])
+        self.assertEqual(self.count(), 3)
+        self.assertEqual(self.bq.client.calls['query'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import threading
+import unittest
+
+from kumpel.connectors.catalog import MetadataCatalog
+
+
+class Clock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class MetadataCatalogTests(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = Clock()
+        self.catalog = MetadataCatalog(ttl=10, clock=self.clock)
+
+    def test_value_is_cached_until_expired(self):
+        loads = []
+        loader = lambda: loads.append(1) or len(loads)
+        self.assertEqual(self.catalog.get(('datasets',), loader), 1)
+        self.assertEqual(self.catalog.get(('datasets',), loader), 1)
+        self.clock.now = 11
+        self.assertEqual(self.catalog.get(('datasets',), loader), 2)
+
+    def test_invalidate_table(self):
+        self.catalog.get(('schema', 'ds', 't'), lambda: 'old')
+        self.catalog.get(('schema', 'ds', 'u'), lambda: 'old')
+        self.catalog.invalidate('ds', 't')
+        self.assertEqual(self.catalog.get(('schema', 'ds', 't'), lambda: 'new'), 'new')
+        self.assertEqual(self.catalog.get(('schema', 'ds', 'u'), lambda: 'new'), 'old')
+
+    def test_invalidate_dataset(self):
+        self.catalog.get(('tables', 'ds'), lambda: 'old')
+        self.catalog.get(('schema', 'ds', 't'), lambda: 'old')
+        self.catalog.invalidate('ds')
+        self.assertEqual(self.catalog.get(('tables', 'ds'), lambda: 'new'), 'new')
+        self.assertEqual(self.catalog.get(('schema', 'ds', 't'), lambda: 'new'), 'new')
+
+    def test_disabled(self):
+        self.catalog.ttl = 0
+        self.catalog.get(('datasets',), lambda: 'old')
+        self.assertEqual(self.catalog.get(('datasets',), lambda: 'new'), 'new')
+
+    def check_invalidated_during_load(self, key, invalidate):
+        loading = threading.Event()
+        invalidated = threading.Event()
+
+        def slow_loader():
+            loading.set()
+            invalidated.wait(5)
+            return 'stale'
+
+        thread = threading.Thread(target=self.catalog.get, args=(key, slow_loader))
+        thread.start()
+        loading.wait(5)
+        invalidate()
+        invalidated.set()
+        thread.join()
+        # the value loaded before the invalidation is not kept
+        self.assertEqual(self.catalog.get(key, lambda: 'fresh'), 'fresh')
+
+    def test_invalidate_during_load(self):
+        self.check_invalidated_during_load(('schema', 'ds', 't'),
+                                           lambda: self.catalog.invalidate('ds', 't'))
+
+    def test_invalidate_dataset_during_load(self):
+        self.check_invalidated_during_load(('schema', 'ds', 't'),
+                                           lambda: self.catalog.invalidate('ds'))
+
+    def test_refresh_during_load(self):
+        self.check_invalidated_during_load(('datasets',), self.catalog.refresh)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import unittest
+
+from kumpel import AsyncBigQuery
+from kumpel.connectors.clients import ClientPool
+
+from helpers import dummy_bigquery
+
+PLAIN_TYPES = (dict, list, tuple, str, bytes, int, float, bool, type(None))
+
+
+class ThreadBound:
+    """
+    Proxy of a client, and of the resources and requests built from it,
+    failing when used from another thread than the one which created the
+    client, like the http connection of a real client must not be.
+    """
+
+    def __init__(self, target, owner):
+        self._target = target
+        self._owner = owner
+
+    def _check(self):
+        if threading.get_ident() != self._owner:
+            raise AssertionError('client of another thread used')
+
+    def __getattr__(self, name):
+        self._check()
+        return self._wrap(getattr(self._target, name))
+
+    def __call__(self, *args, **kwargs):
+        self._check()
+        return self._wrap(self._target(*args, **kwargs))
+
+    def _wrap(self, value):
+        if isinstance(value, PLAIN_TYPES):
+            return value
+        return ThreadBound(value, self._owner)
+
+
+def per_thread_clients(connector):
+    """
+    Give every thread its own ThreadBound view of the emulator of a
+    DummyBigQuery, and return the set of threads which got one.
+    """
+    emulator = connector.client
+    threads = set()
+
+    def factory():
+        threads.add(threading.get_ident())
+        return ThreadBound(emulator, threading.get_ident())
+
+    connector.client = None
+    connector.clients = ClientPool(factory, per_thread=True)
+    return threads
+
+
+class ClientPerThreadTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bq = dummy_bigquery({'id': 'INTEGER'}, [{'id': n} for n in range(100)])
+        self.threads = per_thread_clients(self.bq)
+
+    def test_read_data_in_batches(self):
+        rows = list(self.bq.read_data('ds', 'events', batch=10, workers=4))
+        self.assertEqual(len(rows), 100)
+        self.assertGreater(len(self.threads), 1)
+
+    def test_read_query(self):
+        rows = list(self.bq.read_query('SELECT id FROM [ds.events]', batch_read=10,
+                                       workers=4, use_legacy_sql=True))
+        self.assertEqual(len(rows), 100)
+
+    def test_read_query_batches(self):
+        batches = self.bq.read_query_batches('SELECT id FROM [ds.events]', batch_size=10,
+                                             workers=4)
+        self.assertEqual(sum(len(batch) for batch in batches), 100)
+
+    def test_write_to_table(self):
+        sent = self.bq.write_to_table('ds', 'events', [{'id': n} for n in range(50)],
+                                      batch_write=5, workers=4)
+        self.assertEqual(sent, 50)
+
+    def test_async_connector(self):
+        connector = AsyncBigQuery(connector=self.bq, max_calls=4)
+
+        async def main():
+            rows = await connector.read_query('SELECT id FROM [ds.events]',
+                                              batch_read=10).fetch_all()
+            data = await connector.read_data('ds', 'events', batch=10).fetch_all()
+            await connector.write_query_to_table('SELECT * FROM [ds.events]', 'ds', 'copy')
+            return len(rows), len(data)
+
+        try:
+            self.assertEqual(asyncio.run(main()), (100, 100))
+        finally:
+            connector.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
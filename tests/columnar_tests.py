@@ -0,0 +1,67 @@
+import unittest
+
+from kumpel.connectors.columnar import column_dtype, decode_columns
+from kumpel.connectors.tabledata import to_fields
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from helpers import WIDE_SCHEMA, dummy_bigquery
+
+
+
+def make_rows(count):
+    return [{'id': n, 'name': 'row %i' % n, 'score': None if n % 3 else n / 2,
+             'ok': n % 2 == 0} for n in range(count)]
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class DecodeColumnsTests(unittest.TestCase):
+
+    def test_columns_are_typed(self):
+        fields = to_fields(WIDE_SCHEMA)
+        rows = [{'f': [{'v': '1'}, {'v': 'a'}, {'v': '0.5'}, {'v': 'true'}]},
+                {'f': [{'v': None}, {'v': None}, {'v': None}, {'v': 'false'}]}]
+        batch = decode_columns(rows, fields)
+        self.assertEqual(len(batch), 2)
+        self.assertEqual(list(batch), ['id', 'name', 'score', 'ok'])
+        self.assertEqual(batch['id'].dtype, np.int64)
+        self.assertEqual(batch['ok'].tolist(), [True, False])
+        self.assertEqual(batch['name'].tolist(), ['a', None])
+        self.assertTrue(np.isnan(batch['score'][1]))
+        self.assertEqual(batch.masks['id'].tolist(), [False, True])
+
+    def test_column_dtype(self):
+        self.assertEqual(column_dtype({'name': 'd', 'type': 'DATE'}), 'datetime64[D]')
+        self.assertEqual(column_dtype({'name': 'i', 'type': 'INTEGER', 'mode': 'REPEATED'}),
+                         'object')
+        self.assertEqual(column_dtype({'name': 's', 'type': 'STRING'}), 'object')
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class ReadBatchesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bq = dummy_bigquery(WIDE_SCHEMA, make_rows(25))
+        
+    def test_read_query_batches(self):
+        batches = list(self.bq.read_query_batches('SELECT id, score FROM [ds.events] '
+                                                  'ORDER BY id', batch_size=10, workers=3))
+        self.assertEqual([len(batch) for batch in batches], [10, 10, 5])
+        ids = np.concatenate([batch['id'] for batch in batches])
+        self.assertEqual(ids.tolist(), list(range(25)))
+        nulls = np.concatenate([batch.masks['score'] for batch in batches])
+        self.assertEqual(int(nulls.sum()), 16)
+
+    def test_read_data_batches(self):
+        batches = list(self.bq.read_data_batches('ds', 'events', batch_size=10,
+                                                 fields=['ok']))
+        self.assertEqual([list(batch) for batch in batches], [['ok']] * 3)
+        self.assertEqual(int(sum(batch['ok'].sum() for batch in batches)), 13)
+        self.assertEqual(self.bq.client.calls['query'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
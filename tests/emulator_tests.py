@@ -0,0 +1,109 @@
+import unittest
+
+from kumpel import DummyBigQuery
+from kumpel.connectors.emulator import EmulatedHttpError, LocalBigQueryClient
+
+FIELDS = [{'name': 'id', 'type': 'INTEGER', 'mode': 'NULLABLE'},
+          {'name': 'name', 'type': 'STRING', 'mode': 'NULLABLE'}]
+
+
+def make_client(**kwargs):
+    client = LocalBigQueryClient(**kwargs)
+    client.create_dataset('ds')
+    client.create_table('ds', 't', FIELDS)
+    return client
+
+
+class SwallowedErrorsTests(unittest.TestCase):
+    """
+    The emulator reports request errors like BigQuery-Python does.
+    """
+
+    def test_rejected_insert_returns_false_when_swallowing(self):
+        client = make_client(max_request_bytes=1000)
+        rows = [{'id': n, 'name': 'x' * 50} for n in range(100)]
+        self.assertIs(client.push_rows('ds', 't', rows), False)
+
+    def test_rejected_insert_returns_insert_errors_otherwise(self):
+        client = make_client(max_request_bytes=1000, swallow_results=False)
+        rows = [{'id': n, 'name': 'x' * 50} for n in range(100)]
+        response = client.push_rows('ds', 't', rows)
+        self.assertIn('insertErrors', response)
+        self.assertIsNone(response['insertErrors'][0].get('index'))
+        self.assertIn('413', str(response['insertErrors']))
+
+    def test_rate_limited_insert_is_swallowed(self):
+        client = make_client()
+        client.max_calls_per_second = 1
+        self.assertIs(client.push_rows('ds', 't', [{'id': 1}]), True)
+        self.assertIs(client.push_rows('ds', 't', [{'id': 2}]), False)
+
+    def test_invalid_rows_reject_the_request(self):
+        client = make_client(swallow_results=False)
+        response = client.push_rows('ds', 't', [{'id': 1}, {'id': 'x'}])
+        reasons = [(error['index'], error['errors'][0]['reason'])
+                   for error in response['insertErrors']]
+        self.assertEqual(reasons, [(0, 'stopped'), (1, 'invalid')])
+        self.assertEqual(client.get_table('ds', 't')['numRows'], '0')
+
+    def test_create_table_failure_is_swallowed(self):
+        client = make_client()
+        self.assertIs(client.create_table('missing', 't', FIELDS), False)
+        self.assertEqual(make_client(swallow_results=False).create_table('missing', 't', FIELDS),
+                         {})
+
+    def test_raw_insert_all_raises(self):
+        client = make_client(max_request_bytes=1000)
+        body = {'rows': [{'json': {'id': n, 'name': 'x' * 50}} for n in range(100)]}
+        request = client.bigquery.tabledata().insertAll(projectId='local', datasetId='ds',
+                                                        tableId='t', body=body)
+        with self.assertRaises(EmulatedHttpError) as raised:
+            request.execute()
+        self.assertEqual(raised.exception.resp.status, 413)
+
+    def test_connector_reports_failed_creations(self):
+        bq = DummyBigQuery()
+        self.assertIs(bq.create_table('missing', 't', {'id': 'INTEGER'}), False)
+        self.assertFalse(bq.exists('missing', 't'))
+
+
+class EmulatorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.client = make_client()
+        self.client.push_rows('ds', 't', [{'id': n, 'name': 'n%i' % n} for n in range(10)])
+
+    def test_query_job(self):
+        job_id, _rows = self.client.query('SELECT id, name FROM [ds.t] WHERE id < 3 ORDER BY id')
+        self.assertEqual(self.client.check_job(job_id), (True, 3))
+        self.assertEqual(self.client.get_query_rows(job_id),
+                         [{'id': 0, 'name': 'n0'}, {'id': 1, 'name': 'n1'}, {'id': 2, 'name': 'n2'}])
+
+    def test_job_latency(self):
+        client = make_client(job_latency=60)
+        job_id, _rows = client.query('SELECT 1 AS one')
+        self.assertEqual(client.check_job(job_id), (False, 0))
+
+    def test_invalid_query_is_rejected(self):
+        with self.assertRaises(EmulatedHttpError) as raised:
+            self.client.query('SELECT FROM WHERE [ds.t]')
+        self.assertEqual(raised.exception.resp.status, 400)
+
+    def test_insert_ids_deduplicate_rows(self):
+        rows = [{'id': 100, 'name': 'a'}, {'id': 100, 'name': 'a'}]
+        self.client.push_rows('ds', 't', rows, insert_id_key='id')
+        self.client.push_rows('ds', 't', rows, insert_id_key='id')
+        self.assertEqual(self.client.get_table('ds', 't')['numRows'], '11')
+
+    def test_tabledata_list(self):
+        response = self.client.bigquery.tabledata().list(
+            projectId='local', datasetId='ds', tableId='t', startIndex=8, maxResults=5).execute()
+        self.assertEqual(response['totalRows'], '10')
+        self.assertEqual([row['f'][0]['v'] for row in response['rows']], ['8', '9'])
+
+    def test_call_counts(self):
+        self.assertEqual(self.client.calls['push_rows'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
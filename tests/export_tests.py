@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from kumpel import LocalStorage
+from kumpel.connectors.export import parse_uri, shard_uri
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from helpers import WIDE_SCHEMA, dummy_bigquery
+
+URI = 'gs://bucket/export/events-*'
+
+
+def make_rows(count):
+    return [{'id': n, 'name': None if n % 4 == 0 else 'row, "%i"' % n,
+             'score': n / 2, 'ok': n % 2 == 0} for n in range(count)]
+
+
+class UriTests(unittest.TestCase):
+
+    def test_parse_uri(self):
+        self.assertEqual(parse_uri('gs://bucket/a/b.csv'), ('bucket', 'a/b.csv'))
+        with self.assertRaises(ValueError):
+            parse_uri('/tmp/a.csv')
+
+    def test_shard_uri(self):
+        self.assertEqual(shard_uri(URI, 3), 'gs://bucket/export/events-000000000003')
+
+
+class ExportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.storage = LocalStorage(os.path.join(self.directory, 'storage'))
+        self.bq = dummy_bigquery(WIDE_SCHEMA, make_rows(35), storage=self.storage,
+                                 export_shard_rows=10)
+        
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_wildcard_export_is_sharded(self):
+        export = self.bq.export_to_storage(URI + '.csv', 'ds', 'events', delay=0.01)
+        self.assertEqual(len(export.files), 4)
+        self.assertEqual(export.files, self.storage.list(URI + '.csv'))
+
+    def test_read_csv_export(self):
+        export = self.bq.export_to_storage(URI + '.csv.gz', 'ds', 'events',
+                                           compression='GZIP', delay=0.01)
+        self.assertEqual(list(self.bq.read_export(export, workers=3, batch_size=4)),
+                         make_rows(35))
+
+    def test_read_json_export(self):
+        export = self.bq.export_to_storage(URI + '.json', 'ds', 'events',
+                                           destination_format='NEWLINE_DELIMITED_JSON',
+                                           delay=0.01)
+        rows = self.bq.read_export(export, workers=2, row_format='tuple')
+        self.assertEqual([row[0] for row in rows], list(range(35)))
+
+    def test_download_export(self):
+        export = self.bq.export_to_storage(URI + '.csv', 'ds', 'events', delay=0.01)
+        paths = self.bq.download_export(export, os.path.join(self.directory, 'local'))
+        self.assertEqual(len(paths), 4)
+        self.assertTrue(all(os.path.getsize(path) > 0 for path in paths))
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test_read_export_batches(self):
+        export = self.bq.export_to_storage(URI + '.csv', 'ds', 'events', delay=0.01)
+        batches = list(self.bq.read_export_batches(export, batch_size=10))
+        ids = np.concatenate([batch['id'] for batch in batches])
+        self.assertEqual(sorted(ids.tolist()), list(range(35)))
+
+    def test_invalid_format(self):
+        with self.assertRaises(ValueError):
+            self.bq.export_to_storage(URI, 'ds', 'events', destination_format='XML')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import threading
+import unittest
+
+from kumpel import SingleFlight
+from kumpel.connectors.flight import SharedQuery
+
+from helpers import dummy_bigquery, make_rows
+QUERY = 'SELECT id FROM [ds.events] ORDER BY id'
+
+
+def run_in_threads(count, target):
+    results = [None] * count
+    errors = []
+
+    def run(index):
+        try:
+            results[index] = target()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+class SharedQueryTests(unittest.TestCase):
+
+    def test_pages_are_downloaded_once(self):
+        rows = [{'id': n} for n in range(50)]
+        calls = []
+
+        def fetch(offset, limit):
+            calls.append(offset)
+            return rows[offset:offset + limit]
+
+        flight = SharedQuery('key', page_size=10)
+        flight.start(lambda: ('job', len(rows)))
+        self.assertEqual(list(flight.read(fetch)), rows)
+        self.assertEqual(list(flight.read(fetch)), rows)
+        self.assertEqual(sorted(calls), [0, 10, 20, 30, 40])
+
+    def test_pages_are_dropped_above_max_rows(self):
+        rows = [{'id': n} for n in range(50)]
+        flight = SharedQuery('key', page_size=10, max_rows=20)
+        flight.start(lambda: ('job', len(rows)))
+        self.assertEqual(list(flight.read(lambda offset, limit: rows[offset:offset + limit])),
+                         rows)
+        self.assertLessEqual(flight._buffered, 20)
+
+    def test_error_of_the_job_is_raised_to_all_readers(self):
+        flight = SharedQuery('key')
+
+        def run():
+            raise ValueError('job failed')
+
+        with self.assertRaises(ValueError):
+            flight.start(run)
+        with self.assertRaises(ValueError):
+            flight.wait()
+
+
+class SingleFlightTests(unittest.TestCase):
+
+    def test_join_and_leave(self):
+        registry = SingleFlight()
+        first, first_leads = registry.join('key')
+        second, second_leads = registry.join('key')
+        self.assertIs(first, second)
+        self.assertEqual((first_leads, second_leads), (True, False))
+        registry.leave(first)
+        registry.leave(second)
+        self.assertEqual(len(registry), 0)
+        self.assertTrue(registry.join('key')[1])
+
+
+class ReadQueryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bq = dummy_bigquery(rows=make_rows(30), single_flight=SingleFlight(),
+                                 job_latency=0.2)
+
+    def read(self):
+        return [row['id'] for row in self.bq.read_query(QUERY, delay=0.05, batch_read=10)]
+
+    def test_concurrent_calls_share_one_job(self):
+        results = run_in_threads(4, self.read)
+        self.assertEqual(results, [list(range(30))] * 4)
+        self.assertEqual(self.bq.client.calls['query'], 1)
+        self.assertEqual(self.bq.single_flight.joined, 3)
+        self.assertEqual(len(self.bq.single_flight), 0)
+
+    def test_later_calls_run_a_new_job(self):
+        self.read()
+        self.read()
+        self.assertEqual(self.bq.client.calls['query'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+"""
+Rows, schemas and connectors shared by the tests.
+"""
+from kumpel import DummyBigQuery
+
+SCHEMA = {'id': 'INTEGER', 'name': 'STRING'}
+WIDE_SCHEMA = {'id': 'INTEGER', 'name': 'STRING', 'score': 'FLOAT', 'ok': 'BOOLEAN'}
+
+
+def make_rows(count, start=0):
+    """
+    Rows of SCHEMA.
+    :param count: number of rows
+    :param start: id of the first row
+    :return: list of rows with consecutive ids
+    """
+    return [{'id': n, 'name': 'row %i' % n} for n in range(start, start + count)]
+
+
+def dummy_bigquery(schema=SCHEMA, rows=None, table='events', **kwargs):
+    """
+    DummyBigQuery with the dataset 'ds' and one table in it.
+    :param schema: schema of the table
+    :param rows: rows written to the table
+    :param table: name of the table
+    :param kwargs: arguments of DummyBigQuery
+    :return: DummyBigQuery
+    """
+    bq = DummyBigQuery(**kwargs)
+    bq.create_dataset('ds')
+    bq.create_table('ds', table, schema)
+    if rows:
+        bq.write_to_table('ds', table, rows)
+    return bq
@@ -0,0 +1,99 @@
+import unittest
+
+from kumpel import CallEvent, Hook, InMemoryAggregator, PrometheusExporter, profile
+from kumpel.connectors.emulator import EmulatedHttpError
+
+from helpers import dummy_bigquery, make_rows
+
+
+class Recorder(Hook):
+
+    def __init__(self):
+        self.events = []
+
+    def on_event(self, event):
+        self.events.append(event)
+
+
+class HooksTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bq = dummy_bigquery()
+        self.recorder = self.bq.add_hook(Recorder())
+
+    def methods(self):
+        return [event.method for event in self.recorder.events]
+
+    def test_write_to_table_reports_rows(self):
+        self.bq.write_to_table('ds', 'events', make_rows(30), batch_write=10)
+        pushes = [event for event in self.recorder.events if event.method == 'push_rows']
+        self.assertEqual([(event.dataset, event.table, event.rows) for event in pushes],
+                         [('ds', 'events', 10)] * 3)
+        self.assertTrue(all(event.network_time >= 0 and event.error is None
+                            for event in pushes))
+
+    def test_job_wait_reports_the_time_in_checks(self):
+        self.bq.client.job_latency = 0.1
+        list(self.bq.read_query('SELECT id FROM [ds.events]', delay=0.02))
+        self.assertIn('wait_for_job', self.methods())
+        wait = [event for event in self.recorder.events if event.method == 'wait_for_job'][0]
+        stats = self.bq.last_job_stats
+        self.assertGreater(stats.sleep_time, 0)
+        self.assertEqual(wait.network_time, stats.poll_time)
+        self.assertLess(wait.network_time, stats.elapsed)
+
+    def test_failed_call_reports_the_error(self):
+        def fail():
+            raise EmulatedHttpError(500, 'backend error')
+
+        with self.assertRaises(EmulatedHttpError):
+            self.bq.api_call('get_table', fail, dataset='ds')
+        self.assertEqual(self.recorder.events[-1].error, 'EmulatedHttpError')
+
+    def test_count_rows(self):
+        self.assertEqual(self.bq.api_call('list', lambda: [1, 2, 3], count_rows=True),
+                         [1, 2, 3])
+        self.assertEqual(self.recorder.events[-1].rows, 3)
+
+    def test_remove_hook(self):
+        self.bq.remove_hook(self.recorder)
+        self.bq.get_table('ds', 'events')
+        self.assertEqual(self.recorder.events, [])
+
+
+class AggregatorTests(unittest.TestCase):
+
+    def test_totals_per_method(self):
+        aggregator = InMemoryAggregator(max_events=2)
+        aggregator.on_event(CallEvent('push_rows', rows=10, network_time=0.5))
+        aggregator.on_event(CallEvent('push_rows', rows=5, error='HttpError'))
+        aggregator.on_event(CallEvent('query', poll_time=1.0))
+        snapshot = aggregator.snapshot()
+        self.assertEqual(snapshot['push_rows']['calls'], 2)
+        self.assertEqual(snapshot['push_rows']['errors'], 1)
+        self.assertEqual(snapshot['push_rows']['rows'], 15)
+        self.assertEqual(snapshot['query']['poll_time'], 1.0)
+        self.assertEqual([event.method for event in aggregator.events],
+                         ['push_rows', 'query'])
+        aggregator.reset()
+        self.assertEqual(aggregator.snapshot(), {})
+
+    def test_prometheus_exporter(self):
+        aggregator = InMemoryAggregator()
+        aggregator.on_event(CallEvent('query', rows=7))
+        text = PrometheusExporter(aggregator, labels={'app': 'etl'}).render()
+        self.assertIn('# TYPE kumpel_calls_total counter', text)
+        self.assertIn('kumpel_rows_total{app="etl",method="query"} 7.0', text)
+
+
+class ProfileTests(unittest.TestCase):
+
+    def test_report(self):
+        with profile() as capture:
+            sorted(range(1000))
+        self.assertIsNotNone(capture.stats)
+        self.assertIn('function calls', capture.report())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,44 @@
+import unittest
+
+from kumpel import BigQueryJobTimeout, DummyBigQuery
+from kumpel.connectors.jobs import JobWaiter
+
+
+class JobWaiterTests(unittest.TestCase):
+
+    def test_delays_grow_up_to_max_delay(self):
+        delays = JobWaiter(initial_delay=0.1, max_delay=0.4).delays()
+        values = [next(delays) for _ in range(6)]
+        self.assertTrue(0.05 <= values[0] <= 0.1)
+        self.assertTrue(all(0.2 <= value <= 0.4 for value in values[3:]))
+
+    def test_wait_checks_until_complete(self):
+        checks = iter([(False, None), (False, None), (True, 'result')])
+        result, stats = JobWaiter(initial_delay=0.001).wait('job', lambda: next(checks))
+        self.assertEqual(result, 'result')
+        self.assertEqual(stats.polls, 3)
+
+    def test_timeout(self):
+        waiter = JobWaiter(initial_delay=0.01, timeout=0.05)
+        with self.assertRaises(BigQueryJobTimeout):
+            waiter.wait('job', lambda: (False, None))
+
+
+class WaitForJobTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bq = DummyBigQuery(job_latency=0.05)
+
+    def test_query_job(self):
+        job_id, _results = self.bq.client.query('SELECT 1 AS one')
+        self.bq.wait_for_job(job_id, max_delay=0.01)
+        self.assertGreater(self.bq.last_job_stats.polls, 1)
+
+    def test_running_job_times_out(self):
+        job_id, _results = self.bq.client.query('SELECT 1 AS one')
+        with self.assertRaises(BigQueryJobTimeout):
+            self.bq.wait_for_job(job_id, max_delay=0.005, timeout=0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from kumpel import LoadJournal
+from kumpel.connectors.journal import merge_ranges, pending_rows, to_ranges
+
+from helpers import dummy_bigquery, make_rows
+
+
+def interrupted(rows, fail_at):
+    for position, row in enumerate(rows):
+        if position == fail_at:
+            raise IOError('source interrupted')
+        yield row
+
+
+class RangesTests(unittest.TestCase):
+
+    def test_to_ranges(self):
+        self.assertEqual(to_ranges([5, 0, 1, 2, 7, 6, 1]), [(0, 3), (5, 8)])
+
+    def test_merge_ranges(self):
+        self.assertEqual(merge_ranges([(5, 8), (0, 3), (2, 4), (4, 5), (10, 11)]),
+                         [(0, 8), (10, 11)])
+
+    def test_pending_rows(self):
+        rows = [{'id': n} for n in range(10)]
+        self.assertEqual([position for position, _row in pending_rows(rows, [(0, 3), (5, 8)])],
+                         [3, 4, 8, 9])
+
+
+class LoadJournalTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.journal = LoadJournal(os.path.join(self.directory, 'journal.db'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_record_compact_clear(self):
+        self.journal.record('load', [0, 1, 2])
+        self.journal.record('load', [3, 4, 8])
+        self.journal.record('other', [0])
+        self.assertEqual(self.journal.acknowledged('load'), [(0, 5), (8, 9)])
+        self.journal.compact('load')
+        self.assertEqual(self.journal.acknowledged('load'), [(0, 5), (8, 9)])
+        self.journal.clear('load')
+        self.assertEqual(self.journal.acknowledged('load'), [])
+        self.assertEqual(self.journal.acknowledged('other'), [(0, 1)])
+
+
+class ResumeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'journal.db')
+        self.bq = dummy_bigquery()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def ids(self):
+        return sorted(row['id'] for row in self.bq.read_data('ds', 'events'))
+
+    def test_interrupted_load_is_resumed(self):
+        with self.assertRaises(IOError):
+            self.bq.write_to_table('ds', 'events', interrupted(make_rows(50), 35),
+                                   batch_write=10, checkpoint=self.path)
+        acknowledged = LoadJournal(self.path).acknowledged('ds.events')
+        self.assertTrue(acknowledged)
+        self.assertEqual(acknowledged[0][0], 0)
+        skipped = acknowledged[0][1]
+
+        sent = self.bq.write_to_table('ds', 'events', make_rows(50),
+                                      batch_write=10, checkpoint=self.path)
+        self.assertEqual(sent, 50 - skipped)
+        self.assertEqual(self.ids(), list(range(50)))
+        self.assertEqual(LoadJournal(self.path).acknowledged('ds.events'), [])
+
+    def test_checkpoint_with_load_jobs(self):
+        with self.assertRaises(ValueError):
+            self.bq.write_to_table('ds', 'events', make_rows(5), checkpoint=self.path,
+                                   partition_by='day', replace_partitions=True)
+
+
+if __name__ == '__main__':
+    unittest.main()
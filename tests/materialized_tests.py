@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from kumpel import MaterializedResult
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from helpers import WIDE_SCHEMA, dummy_bigquery
+
+QUERY = 'SELECT id, name, score, ok FROM [ds.events] ORDER BY id'
+
+
+def make_rows(count):
+    return [{'id': n, 'name': None if n % 5 == 0 else 'row %i' % n,
+             'score': None if n % 3 == 0 else n / 4, 'ok': n % 2 == 0}
+            for n in range(count)]
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class MaterializeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bq = dummy_bigquery(WIDE_SCHEMA, make_rows(57))
+        self.result = self.bq.materialize(QUERY, batch_size=10, workers=3)
+
+    def tearDown(self):
+        self.result.close()
+
+    def test_rows_can_be_read_again(self):
+        self.assertEqual(len(self.result), 57)
+        self.assertEqual(list(self.result), make_rows(57))
+        self.assertEqual(list(self.result), make_rows(57))
+        self.assertEqual(self.bq.client.calls['query'], 1)
+
+    def test_columns_are_memory_mapped(self):
+        ids = self.result.column('id')
+        self.assertEqual(ids.dtype, np.int64)
+        self.assertEqual(ids.tolist(), list(range(57)))
+        self.assertEqual(int(self.result.mask('score').sum()), 19)
+        self.assertEqual(list(self.result.column('name'))[:2], [None, 'row 1'])
+
+    def test_slices(self):
+        part = self.result[10:20]
+        self.assertEqual(len(part), 10)
+        self.assertEqual(list(part), make_rows(57)[10:20])
+        self.assertEqual(part.column('name')[1], 'row 11')
+        self.assertEqual(self.result[-1], make_rows(57)[-1])
+        with self.assertRaises(IndexError):
+            self.result[57]
+
+    def test_row_format(self):
+        rows = list(self.result.rows('tuple'))
+        self.assertEqual(rows[1], (1, 'row 1', 0.25, False))
+
+    def test_temporary_directory_is_deleted(self):
+        directory = self.result.directory
+        self.result.close()
+        self.assertFalse(os.path.exists(directory))
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class MaterializeDirectoryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.bq = dummy_bigquery(WIDE_SCHEMA, make_rows(12))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_files_are_kept_and_reopened(self):
+        with self.bq.materialize(QUERY, directory=self.directory, batch_size=5):
+            pass
+        with MaterializedResult(self.directory) as result:
+            self.assertEqual(list(result), make_rows(12))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import threading
+import time
+import unittest
+
+from kumpel.connectors.paging import PagePrefetcher, read_range
+
+from helpers import dummy_bigquery, make_rows
+ROWS = [{'id': n} for n in range(95)]
+
+
+def fetcher(max_page=None, delay=0):
+    """
+    fetch callable reading ROWS, returning at most max_page rows per call
+    like BigQuery does for large responses, and recording its calls.
+    """
+    calls = []
+
+    def fetch(offset, limit):
+        calls.append((offset, limit))
+        time.sleep(delay)
+        return ROWS[offset:offset + min(limit, max_page or limit)]
+
+    return fetch, calls
+
+
+class ReadRangeTests(unittest.TestCase):
+
+    def test_short_pages_are_completed(self):
+        fetch, calls = fetcher(max_page=4)
+        self.assertEqual(read_range(fetch, 10, 10), ROWS[10:20])
+        self.assertEqual(calls, [(10, 10), (14, 6), (18, 2)])
+
+    def test_end_of_the_rows(self):
+        fetch, _calls = fetcher()
+        self.assertEqual(read_range(fetch, 90, 10), ROWS[90:])
+
+
+class PagePrefetcherTests(unittest.TestCase):
+
+    def test_rows_are_in_order(self):
+        fetch, calls = fetcher(delay=0.001)
+        rows = list(PagePrefetcher(fetch, len(ROWS), page_size=10, workers=4))
+        self.assertEqual(rows, ROWS)
+        self.assertEqual(sorted(calls), [(n, min(10, 95 - n)) for n in range(0, 95, 10)])
+
+    def test_pages_are_read_concurrently(self):
+        threads = set()
+        lock = threading.Lock()
+
+        def fetch(offset, limit):
+            with lock:
+                threads.add(threading.get_ident())
+            time.sleep(0.01)
+            return ROWS[offset:offset + limit]
+
+        self.assertEqual(list(PagePrefetcher(fetch, len(ROWS), page_size=10, workers=4)), ROWS)
+        self.assertGreater(len(threads), 1)
+
+    def test_read_ahead_is_bounded(self):
+        fetch, calls = fetcher()
+        pages = PagePrefetcher(fetch, len(ROWS), page_size=10, workers=2, read_ahead=3).pages()
+        next(pages)
+        time.sleep(0.05)
+        self.assertLessEqual(len(calls), 4)
+        pages.close()
+        self.assertLess(len(calls), 10)
+
+    def test_invalid_arguments(self):
+        with self.assertRaises(ValueError):
+            PagePrefetcher(lambda offset, limit: [], 10, page_size=0)
+
+
+class ReadQueryPagesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bq = dummy_bigquery(rows=make_rows(250))
+
+    def test_pages_are_read_in_order(self):
+        rows = self.bq.read_query('SELECT id FROM [ds.events] ORDER BY id', batch_read=30,
+                                  workers=4, read_ahead=6)
+        self.assertEqual([row['id'] for row in rows], list(range(250)))
+
+
+if __name__ == '__main__':
+    unittest.main()
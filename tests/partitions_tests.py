@@ -0,0 +1,95 @@
+import unittest
+from datetime import date, timedelta
+
+from kumpel import DummyBigQuery
+from kumpel.connectors.errors import BigQueryJobError
+from kumpel.connectors.partitions import decorate, partition_id, partition_range
+
+SCHEMA = {'id': 'INTEGER', 'day': 'STRING'}
+
+
+def make_rows(days, per_day, first_id=0):
+    return [{'id': first_id + index * per_day + n, 'day': day}
+            for index, day in enumerate(days) for n in range(per_day)]
+
+
+class PartitionHelperTests(unittest.TestCase):
+
+    def test_partition_id(self):
+        self.assertEqual(partition_id('2017-03-04 10:00:00'), '20170304')
+        self.assertEqual(partition_id(date(2017, 3, 4)), '20170304')
+        self.assertIsNone(partition_id(None))
+
+    def test_decorate(self):
+        self.assertEqual(decorate('events', '20170304'), 'events$20170304')
+        self.assertEqual(decorate('events', None), 'events')
+
+    def test_partition_range(self):
+        self.assertEqual(partition_range('2017-02-27', '2017-03-01'),
+                         ['20170227', '20170228', '20170301'])
+
+
+class LoadPartitionsTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bq = DummyBigQuery()
+        self.bq.create_dataset('ds')
+        self.bq.create_table('ds', 'events', SCHEMA, time_partitioning=True)
+
+    def partition_rows(self, day):
+        return int(self.bq.get_table('ds', decorate('events', partition_id(day)))['numRows'])
+
+    def test_old_partitions_are_loaded(self):
+        days = ['2015-01-01', '2015-01-02', '2015-06-30']
+        loaded = self.bq.write_to_table('ds', 'events', make_rows(days, 10),
+                                        partition_by='day', replace_partitions=True)
+        self.assertEqual(loaded, 30)
+        self.assertEqual([self.partition_rows(day) for day in days], [10, 10, 10])
+
+    def test_reload_replaces_the_partition(self):
+        days = ['2015-01-01', '2015-01-02']
+        self.bq.write_to_table('ds', 'events', make_rows(days, 10), partition_by='day',
+                               replace_partitions=True)
+        self.bq.write_to_table('ds', 'events', make_rows(days[1:], 4, first_id=100),
+                               partition_by='day', replace_partitions=True)
+        self.assertEqual(self.partition_rows(days[0]), 10)
+        self.assertEqual(self.partition_rows(days[1]), 4)
+        rows = self.bq.read_data('ds', 'events', date_range=(days[1], days[1]))
+        self.assertEqual(sorted(row['id'] for row in rows), [100, 101, 102, 103])
+
+    def test_rows_are_appended_by_default(self):
+        today = date.today().isoformat()
+        rows = make_rows([today], 5)
+        self.bq.write_to_table('ds', 'events', rows, partition_by='day',
+                               replace_partitions=True)
+        self.bq.write_to_table('ds', 'events', rows, partition_by='day')
+        self.assertEqual(self.partition_rows(today), 10)
+
+    def test_streaming_options_are_refused_with_replacement(self):
+        rows = make_rows(['2015-01-01'], 1)
+        for options in ({'checkpoint': 'journal'}, {'workers': 4}, {'primary_key': 'id'}):
+            with self.assertRaises(ValueError):
+                self.bq.write_to_table('ds', 'events', rows, partition_by='day',
+                                       replace_partitions=True, **options)
+        with self.assertRaises(ValueError):
+            self.bq.write_to_table('ds', 'events', rows, replace_partitions=True)
+
+    def test_invalid_rows_fail_the_load(self):
+        yesterday = (date.today() - timedelta(days=1)).isoformat()
+        self.bq.write_to_table('ds', 'events', make_rows([yesterday], 3), partition_by='day',
+                               replace_partitions=True)
+        with self.assertRaises(BigQueryJobError):
+            self.bq.write_to_table('ds', 'events', [{'id': 'x', 'day': yesterday}],
+                                   partition_by='day', replace_partitions=True)
+        self.assertEqual(self.partition_rows(yesterday), 3)
+
+    def test_load_to_table_creates_the_table(self):
+        fields = [{'name': 'id', 'type': 'INTEGER', 'mode': 'NULLABLE'}]
+        loaded = self.bq.load_to_table('ds', 'loaded', ({'id': n} for n in range(7)),
+                                       fields=fields)
+        self.assertEqual(loaded, 7)
+        self.assertEqual(int(self.bq.get_table('ds', 'loaded')['numRows']), 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+from kumpel.connectors.errors import BigQueryError
+from kumpel.connectors.profiling import profile_queries
+from kumpel.connectors.tabledata import to_fields
+
+from helpers import dummy_bigquery
+
+SCHEMA = {'id': 'INTEGER', 'name': 'STRING', 'score': 'FLOAT'}
+ROWS = [{'id': 1, 'name': 'a', 'score': 0.5},
+        {'id': 2, 'name': 'bbb', 'score': None},
+        {'id': 3, 'name': 'a', 'score': 2.5},
+        {'id': 4, 'name': None, 'score': 1.0}]
+
+
+class ProfileQueriesTests(unittest.TestCase):
+
+    def test_columns_are_split_in_queries(self):
+        queries = profile_queries('ds', 'events', to_fields(SCHEMA), columns_per_query=2)
+        self.assertEqual([indexes for _sql, indexes in queries], [[0, 1], [2]])
+        sql = queries[0][0]
+        self.assertIn('FROM `ds.events`', sql)
+        self.assertIn('APPROX_TOP_COUNT(`name`, 5) AS c1_top', sql)
+        self.assertIn('AVG(LENGTH(`name`)) AS c1_avg_length', sql)
+        self.assertNotIn('LENGTH(`id`)', sql)
+
+
+class ProfileTableTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bq = dummy_bigquery(SCHEMA, ROWS)
+
+    def test_statistics(self):
+        profile = self.bq.profile_table('ds', 'events', top_k=1)
+        self.assertEqual((profile.row_count, profile.jobs), (4, 1))
+        self.assertEqual(list(profile.columns), ['id', 'name', 'score'])
+        name = profile.columns['name']
+        self.assertEqual((name.null_count, name.distinct_count), (1, 2))
+        self.assertEqual((name.min, name.max), ('a', 'bbb'))
+        self.assertEqual(name.top_values, [('a', 2)])
+        self.assertEqual((name.min_length, name.max_length), (1, 3))
+        score = profile.columns['score']
+        self.assertEqual((score.null_count, score.min, score.max), (1, 0.5, 2.5))
+        self.assertIsNone(score.min_length)
+
+    def test_one_scan_per_group_of_columns(self):
+        profile = self.bq.profile_table('ds', 'events', columns_per_query=1)
+        self.assertEqual(profile.jobs, 3)
+        self.assertEqual(self.bq.client.calls['query'], 3)
+
+    def test_profile_is_kept_until_the_table_changes(self):
+        self.bq.profile_table('ds', 'events')
+        self.bq.profile_table('ds', 'events')
+        self.assertEqual(self.bq.client.calls['query'], 1)
+        self.bq.write_to_table('ds', 'events', [{'id': 5}])
+        self.assertEqual(self.bq.profile_table('ds', 'events').row_count, 5)
+        self.assertEqual(self.bq.client.calls['query'], 2)
+
+    def test_missing_table(self):
+        with self.assertRaises(BigQueryError):
+            self.bq.profile_table('ds', 'missing')
+
+
+if __name__ == '__main__':
+    unittest.main()
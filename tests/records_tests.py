@@ -0,0 +1,76 @@
+import pickle
+import unittest
+
+from kumpel import Record, Rows, RowSchema
+from kumpel.connectors.records import record_class
+
+from helpers import dummy_bigquery
+
+ROWS = [{'id': 1, 'name': 'a'}, {'id': 2, 'name': None}]
+
+
+class RecordTests(unittest.TestCase):
+
+    def test_access_by_position_name_and_attribute(self):
+        record = RowSchema(['id', 'name']).to_record(ROWS[0])
+        self.assertIsInstance(record, Record)
+        self.assertEqual((record[0], record['name'], record.id), (1, 'a', 1))
+        self.assertEqual(record.get('missing', 0), 0)
+        self.assertEqual(record.as_dict(), ROWS[0])
+        with self.assertRaises(KeyError):
+            record['missing']
+
+    def test_classes_are_shared(self):
+        self.assertIs(record_class(['id', 'name']), record_class(['id', 'name']))
+        self.assertIs(type(RowSchema(['id', 'name']).to_record(ROWS[0])),
+                      record_class(['id', 'name']))
+
+    def test_columns_hiding_methods_are_not_attributes(self):
+        record = record_class(['keys', 'class', '_private'])((1, 2, 3))
+        self.assertEqual(record.keys(), ('keys', 'class', '_private'))
+        self.assertEqual((record['keys'], record['class'], record['_private']), (1, 2, 3))
+
+    def test_pickle(self):
+        record = RowSchema(['id', 'name']).to_record(ROWS[0])
+        copy = pickle.loads(pickle.dumps(record))
+        self.assertEqual(copy, record)
+        self.assertEqual(copy.name, 'a')
+
+
+class RowsTests(unittest.TestCase):
+
+    def test_tuples(self):
+        rows = Rows(iter(ROWS), 'tuple')
+        self.assertEqual(list(rows), [(1, 'a'), (2, None)])
+        self.assertEqual(rows.schema.names, ('id', 'name'))
+
+    def test_single_column(self):
+        self.assertEqual(list(Rows([{'id': 1}], 'tuple')), [(1,)])
+
+    def test_empty_result(self):
+        rows = Rows([], 'record')
+        self.assertEqual(list(rows), [])
+        self.assertIsNone(rows.schema)
+
+    def test_invalid_format(self):
+        with self.assertRaises(ValueError):
+            Rows(ROWS, 'list')
+
+
+class RowFormatTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bq = dummy_bigquery(rows=ROWS)
+
+    def test_read_query(self):
+        rows = list(self.bq.read_query('SELECT id, name FROM [ds.events] ORDER BY id',
+                                       row_format='record'))
+        self.assertEqual([(row.id, row.name) for row in rows], [(1, 'a'), (2, None)])
+
+    def test_read_data(self):
+        rows = self.bq.read_data('ds', 'events', batch=10, row_format='tuple')
+        self.assertEqual(sorted(rows), [(1, 'a'), (2, None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
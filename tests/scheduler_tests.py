@@ -0,0 +1,127 @@
+import unittest
+
+from kumpel import JobScheduler, QueryStep
+from kumpel.connectors.errors import BigQueryJobTimeout
+from kumpel.connectors.jobs import JobWaiter
+from kumpel.connectors.scheduler import dependencies
+
+from helpers import dummy_bigquery, make_rows
+
+
+class FakeJobs:
+    """
+    submit and check callables of jobs completing after a number of
+    checks, recording the order of submissions and the greatest number
+    of jobs running at the same time.
+    """
+
+    def __init__(self, checks):
+        self.checks = checks
+        self.remaining = {}
+        self.submitted = []
+        self.running = 0
+        self.max_running = 0
+
+    def submit(self, step):
+        job_id = 'job_%s' % step.name
+        self.remaining[job_id] = self.checks.get(step.name, 1)
+        self.submitted.append(step.name)
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        return job_id
+
+    def check(self, job_id):
+        self.remaining[job_id] -= 1
+        if self.remaining[job_id] > 0:
+            return False, None
+        self.running -= 1
+        return True, job_id
+
+
+def waiter(timeout=None):
+    return JobWaiter(initial_delay=0.001, max_delay=0.001, timeout=timeout)
+
+
+class DependenciesTests(unittest.TestCase):
+
+    def test_explicit_and_table_dependencies(self):
+        steps = [QueryStep('SELECT 1', 'ds', 'a'),
+                 QueryStep('SELECT * FROM [ds.a]', 'ds', 'b'),
+                 QueryStep('SELECT 2', name='c', depends_on=('ds.b',))]
+        self.assertEqual(dependencies(steps), [set(), {0}, {1}])
+
+    def test_table_names_are_case_insensitive(self):
+        steps = [QueryStep('SELECT 1', 'Sales', 'Daily'),
+                 QueryStep('SELECT * FROM [Sales.Daily]'),
+                 QueryStep('SELECT * FROM `project.sales.DAILY`')]
+        self.assertEqual(dependencies(steps), [set(), {0}, {0}])
+
+    def test_unknown_dependency(self):
+        with self.assertRaises(ValueError):
+            dependencies([QueryStep('SELECT 1', depends_on=('missing',))])
+
+
+class JobSchedulerTests(unittest.TestCase):
+
+    def test_results_in_completion_order(self):
+        jobs = FakeJobs({'slow': 3, 'fast': 1})
+        scheduler = JobScheduler(jobs.submit, jobs.check, waiter=waiter())
+        steps = [QueryStep('SELECT 1', name='slow'), QueryStep('SELECT 2', name='fast')]
+        self.assertEqual([index for index, _job_id, _result in scheduler.run(steps)], [1, 0])
+        self.assertEqual(scheduler.stats[0].polls, 3)
+
+    def test_max_running(self):
+        jobs = FakeJobs({})
+        scheduler = JobScheduler(jobs.submit, jobs.check, max_running=2, waiter=waiter())
+        steps = [QueryStep('SELECT %i' % n, name=str(n)) for n in range(5)]
+        self.assertEqual(len(list(scheduler.run(steps))), 5)
+        self.assertEqual(jobs.max_running, 2)
+
+    def test_dependent_step_waits(self):
+        jobs = FakeJobs({'a': 3})
+        scheduler = JobScheduler(jobs.submit, jobs.check, waiter=waiter())
+        steps = [QueryStep('SELECT 1', name='b', depends_on=('a',)),
+                 QueryStep('SELECT 2', name='a')]
+        list(scheduler.run(steps))
+        self.assertEqual(jobs.submitted, ['a', 'b'])
+
+    def test_circular_dependencies(self):
+        jobs = FakeJobs({})
+        scheduler = JobScheduler(jobs.submit, jobs.check, waiter=waiter())
+        steps = [QueryStep('SELECT 1', name='a', depends_on=('b',)),
+                 QueryStep('SELECT 2', name='b', depends_on=('a',))]
+        with self.assertRaises(ValueError):
+            list(scheduler.run(steps))
+
+    def test_timeout(self):
+        jobs = FakeJobs({'a': 10 ** 6})
+        scheduler = JobScheduler(jobs.submit, jobs.check, waiter=waiter(timeout=0.01))
+        with self.assertRaises(BigQueryJobTimeout):
+            list(scheduler.run([QueryStep('SELECT 1', name='a')]))
+
+
+class RunQueriesTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bq = dummy_bigquery(rows=make_rows(10))
+
+    def test_reads_and_writes(self):
+        queries = ['SELECT COUNT(1) AS n FROM [ds.events]',
+                   QueryStep('SELECT * FROM [ds.events] WHERE id < 4', 'ds', 'small'),
+                   'SELECT COUNT(1) AS n FROM [ds.small]']
+        results = {}
+        for query, result in self.bq.run_queries(queries, delay=0.01):
+            results[queries.index(query)] = result if isinstance(result, int) else list(result)
+        self.assertEqual(results, {0: [{'n': 10}], 1: 4, 2: [{'n': 4}]})
+
+    def test_write_queries_to_tables(self):
+        steps = [('SELECT * FROM [ds.events] WHERE id < 3', 'ds', 'a'),
+                 ('SELECT * FROM [ds.a]', 'ds', 'b')]
+        self.assertEqual(dict(self.bq.write_queries_to_tables(steps, delay=0.01)),
+                         {steps[0]: 3, steps[1]: 3})
+        with self.assertRaises(ValueError):
+            list(self.bq.write_queries_to_tables([QueryStep('SELECT 1')]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import unittest
+from datetime import datetime
+from fractions import Fraction
+
+from kumpel import BigQueryRowError, Schema
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from helpers import dummy_bigquery
+
+SCHEMA = {'id': 'INTEGER', 'name': 'STRING', 'created': 'TIMESTAMP'}
+
+
+class RowEncoderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.encoder = Schema(SCHEMA).encoder()
+
+    def test_encode_converts_values(self):
+        row = self.encoder.encode({'id': '3', 'name': 'a', 'created': datetime(2017, 3, 4)})
+        self.assertEqual(row['id'], 3)
+        self.assertIsInstance(row['created'], str)
+
+    def test_invalid_row_raises(self):
+        with self.assertRaises(BigQueryRowError):
+            self.encoder.encode({'id': 'not a number'})
+
+    def test_numbers(self):
+        encoder = Schema({'n': 'INTEGER', 'x': 'FLOAT'}).encoder()
+        self.assertEqual(encoder.encode({'n': 4.0, 'x': Fraction(1, 4)}), {'n': 4, 'x': 0.25})
+        for row in ({'n': True}, {'x': False}, {'n': 1.5}):
+            with self.assertRaises(BigQueryRowError):
+                encoder.encode(row)
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test_numpy_numbers(self):
+        encoder = Schema({'n': 'INTEGER', 'x': 'FLOAT'}).encoder()
+        row = encoder.encode({'n': np.int64(3), 'x': np.float32(1.5)})
+        self.assertEqual(row, {'n': 3, 'x': 1.5})
+        self.assertIs(type(row['n']), int)
+        self.assertIs(type(row['x']), float)
+        self.assertEqual(encoder.encode({'n': np.float64(2.0), 'x': np.int32(7)}),
+                         {'n': 2, 'x': 7.0})
+        with self.assertRaises(BigQueryRowError):
+            encoder.encode({'n': np.bool_(True)})
+
+    def test_unknown_columns(self):
+        self.assertEqual(self.encoder.encode({'id': 1, 'extra': 2}), {'id': 1})
+        with self.assertRaises(BigQueryRowError):
+            Schema(SCHEMA).encoder('flag').encode({'id': 1, 'extra': 2})
+
+    def test_encode_lines_skips_invalid_rows(self):
+        invalid = []
+        rows = [{'id': 1}, {'id': 'x'}, {'id': '2'}]
+        lines = list(self.encoder.encode_lines(rows, lambda row, error: invalid.append(row)))
+        self.assertEqual([json.loads(line)['id'] for _row, line in lines], [1, 2])
+        self.assertEqual([row for row, _line in lines], [rows[0], rows[2]])
+        self.assertEqual(invalid, [rows[1]])
+
+
+class LoadWithSchemaTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bq = dummy_bigquery(SCHEMA)
+
+    def test_rows_are_converted_before_the_load(self):
+        invalid = []
+        loaded = self.bq.load_to_table('ds', 'events',
+                                       [{'id': '1', 'created': datetime(2017, 3, 4)},
+                                        {'id': 'x'}],
+                                       schema=True,
+                                       on_invalid=lambda row, error: invalid.append(row))
+        self.assertEqual(loaded, 1)
+        self.assertEqual(invalid, [{'id': 'x'}])
+        self.assertEqual([row['id'] for row in self.bq.read_data('ds', 'events')], [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
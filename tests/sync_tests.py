@@ -0,0 +1,92 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from kumpel import TableSync, WatermarkStore
+from kumpel.connectors.abstract import SQLConnector
+
+from helpers import dummy_bigquery, make_rows
+
+
+class PlainSource(SQLConnector):
+    """
+    Source with the default quoting and read options of SQLConnector,
+    whose read_query takes only the query, like a connector other than
+    BigQuery. Its queries are run by a DummyBigQuery.
+    """
+
+    def __init__(self, connector):
+        self.connector = connector
+        self.queries = []
+
+    def get_schema_from_table(self, dataset, table):
+        return self.connector.get_schema_from_table(dataset, table)
+
+    def read_query(self, query):
+        self.queries.append(query)
+        query = query.replace('"."', '.').replace('"', '`')
+        return self.connector.read_query(query, use_legacy_sql=False)
+
+    test_connection = create_table = drop_table = truncate_table = None
+    read_table = write_to_table = write_query_to_table = None
+
+
+class TableSyncTests(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = WatermarkStore(os.path.join(self.directory, 'watermarks.db'))
+        self.bq = dummy_bigquery(rows=make_rows(5))
+        self.bq.create_dataset('copy')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def copied(self):
+        return sorted(row['id'] for row in self.bq.read_data('copy', 'events'))
+
+    def test_runs_copy_only_new_rows(self):
+        sync = TableSync(self.bq, self.bq, self.store)
+        result = sync.sync('ds', 'events', 'id', target_dataset='copy')
+        self.assertEqual((result.low, result.high, result.rows), (None, 4, 5))
+        self.bq.write_to_table('ds', 'events', make_rows(3, start=5))
+        result = sync.sync('ds', 'events', 'id', target_dataset='copy')
+        self.assertEqual((result.low, result.high, result.rows), (4, 7, 3))
+        self.assertEqual(self.copied(), list(range(8)))
+
+    def test_nothing_new(self):
+        sync = TableSync(self.bq, self.bq, self.store)
+        sync.sync('ds', 'events', 'id', target_dataset='copy')
+        result = sync.sync('ds', 'events', 'id', target_dataset='copy')
+        self.assertEqual((result.low, result.high, result.rows), (4, 4, 0))
+
+    def test_source_without_bigquery_options(self):
+        source = PlainSource(self.bq)
+        result = TableSync(source, self.bq, self.store).sync('ds', 'events', 'id',
+                                                             target_dataset='copy')
+        self.assertEqual(result.rows, 5)
+        self.assertEqual(source.queries[0], 'SELECT MAX("id") AS high FROM "ds"."events"')
+        self.assertEqual(len(source.queries), 2)
+        self.assertEqual(self.copied(), list(range(5)))
+
+    def test_read_options(self):
+        calls = []
+        read_query = self.bq.read_query
+
+        def recording_read_query(query, **options):
+            calls.append(options)
+            return read_query(query, **options)
+
+        self.bq.read_query = recording_read_query
+        TableSync(self.bq, self.bq, self.store).sync('ds', 'events', 'id', target_dataset='copy')
+        sync = TableSync(self.bq, self.bq, self.store,
+                         read_options={'use_legacy_sql': False, 'batch_read': 2})
+        self.bq.write_to_table('ds', 'events', make_rows(3, start=5))
+        self.assertEqual(sync.sync('ds', 'events', 'id', target_dataset='copy').rows, 3)
+        self.assertEqual(calls, [{'use_legacy_sql': False, 'cache_ttl': 0}] * 2
+                         + [{'use_legacy_sql': False, 'batch_read': 2}] * 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
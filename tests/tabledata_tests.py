@@ -0,0 +1,63 @@
+import unittest
+
+from kumpel.connectors.tabledata import (TableShard, decode_row, select_fields,
+                                         split_in_shards, to_fields)
+
+from helpers import WIDE_SCHEMA, dummy_bigquery
+
+
+
+def make_rows(count):
+    return [{'id': n, 'name': 'row %i' % n, 'score': n / 2, 'ok': n % 2 == 0}
+            for n in range(count)]
+
+
+class HelpersTests(unittest.TestCase):
+
+    def test_split_in_shards(self):
+        shards = split_in_shards('ds', 'events', 10, 3)
+        self.assertEqual([(shard.start, shard.stop) for shard in shards],
+                         [(0, 4), (4, 7), (7, 10)])
+        self.assertEqual(split_in_shards('ds', 'events', 2, 4),
+                         [TableShard('ds', 'events', 0, 1, None),
+                          TableShard('ds', 'events', 1, 2, None)])
+        self.assertEqual(split_in_shards('ds', 'events', 0, 4), [])
+
+    def test_decode_row(self):
+        fields = to_fields(WIDE_SCHEMA) + [{'name': 'tags', 'type': 'STRING', 'mode': 'REPEATED'}]
+        row = {'f': [{'v': '3'}, {'v': None}, {'v': '1.5'}, {'v': 'true'},
+                     {'v': [{'v': 'a'}, {'v': 'b'}]}]}
+        self.assertEqual(decode_row(row, fields),
+                         {'id': 3, 'name': None, 'score': 1.5, 'ok': True, 'tags': ['a', 'b']})
+
+    def test_select_fields_keeps_the_schema_order(self):
+        fields = to_fields(WIDE_SCHEMA)
+        self.assertEqual([field['name'] for field in select_fields(fields, ['ok', 'id'])],
+                         ['id', 'ok'])
+        with self.assertRaises(KeyError):
+            select_fields(fields, ['missing'])
+
+
+class ReadDataTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bq = dummy_bigquery(WIDE_SCHEMA, make_rows(103))
+        
+    def test_batches_are_read_without_query(self):
+        rows = list(self.bq.read_data('ds', 'events', batch=10, workers=4))
+        self.assertEqual(rows, make_rows(103))
+        self.assertEqual(self.bq.client.calls['query'], 0)
+        self.assertEqual(self.bq.client.calls['tabledata.list'], 11)
+
+    def test_selected_fields(self):
+        rows = list(self.bq.read_data('ds', 'events', batch=50, fields=['name', 'id']))
+        self.assertEqual(rows[:2], [{'id': 0, 'name': 'row 0'}, {'id': 1, 'name': 'row 1'}])
+
+    def test_shards_cover_the_table(self):
+        shards = self.bq.table_shards('ds', 'events', shards=4)
+        rows = [row for shard in shards for row in self.bq.read_shard(shard, batch=7)]
+        self.assertEqual(rows, make_rows(103))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+
+from kumpel.connectors.emulator import EmulatedHttpError
+from kumpel.connectors.throttling import RetryPolicy, Throttle, is_retryable
+
+from helpers import dummy_bigquery
+
+
+def make_throttle():
+    return Throttle(default_rate=None, retry=RetryPolicy(retries=3, initial_delay=0.0))
+
+
+class Flaky:
+    """
+    Callable failing with the given errors before returning 'done'.
+    """
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'done'
+
+
+class ThrottleTests(unittest.TestCase):
+
+    def test_retryable_errors(self):
+        self.assertTrue(is_retryable(EmulatedHttpError(429, 'rate limit')))
+        self.assertTrue(is_retryable(EmulatedHttpError(503, 'unavailable')))
+        self.assertFalse(is_retryable(EmulatedHttpError(400, 'invalid query')))
+
+    def test_idempotent_calls_are_retried(self):
+        throttle = make_throttle()
+        call = Flaky(EmulatedHttpError(503, 'unavailable'), EmulatedHttpError(429, 'rate limit'))
+        stats = {}
+        self.assertEqual(throttle.call('get_table', call, stats), 'done')
+        self.assertEqual(call.calls, 3)
+        self.assertEqual(stats['retries'], 2)
+
+    def test_other_calls_are_not_retried(self):
+        throttle = make_throttle()
+        for method in ('query', 'write_to_table', 'create_table', 'push_rows'):
+            call = Flaky(EmulatedHttpError(503, 'unavailable'))
+            with self.assertRaises(EmulatedHttpError):
+                throttle.call(method, call)
+            self.assertEqual(call.calls, 1)
+        self.assertEqual(throttle.retried, 0)
+
+    def test_retry_forced_by_the_caller(self):
+        call = Flaky(EmulatedHttpError(503, 'unavailable'))
+        self.assertEqual(make_throttle().call('push_rows', call, retry=True), 'done')
+        self.assertEqual(call.calls, 2)
+
+
+class ThrottledStreamingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bq = dummy_bigquery({'id': 'INTEGER'}, throttle=make_throttle())
+
+    def test_rate_limited_inserts_are_retried(self):
+        client = self.bq.client
+        insert_all = client._api_insert_all
+        errors = [EmulatedHttpError(429, 'rate limit'), EmulatedHttpError(429, 'rate limit')]
+
+        def rate_limited(**kwargs):
+            # the first requests hit the rate limit
+            if errors:
+                raise errors.pop(0)
+            return insert_all(**kwargs)
+
+        client._api_insert_all = rate_limited
+        results = self.bq.stream_to_table('ds', 'events', [{'id': n} for n in range(10)])
+        self.assertFalse(any(result.failed for result in results))
+        self.assertEqual(self.bq.throttle.retried, 2)
+        self.assertEqual(int(self.bq.get_table('ds', 'events')['numRows']), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+from kumpel.connectors.errors import BigQueryError, BigQueryJobError
+from kumpel.connectors.upsert import merge_query
+
+from helpers import dummy_bigquery
+
+
+class UpsertTests(unittest.TestCase):
+
+    def setUp(self):
+        self.bq = dummy_bigquery(table='users')
+        self.bq.load_to_table('ds', 'users', [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'}])
+
+    def users(self):
+        return sorted((row['id'], row['name']) for row in self.bq.read_data('ds', 'users'))
+
+    def tables(self):
+        return sorted(self.bq.client.get_all_tables('ds'))
+
+    def test_merge_updates_and_inserts(self):
+        result = self.bq.upsert_to_table('ds', 'users',
+                                         [{'id': 2, 'name': 'B'}, {'id': 3, 'name': 'c'}],
+                                         keys='id')
+        self.assertEqual(result.rows, 2)
+        self.assertEqual(result.affected, 2)
+        self.assertEqual(self.users(), [(1, 'a'), (2, 'B'), (3, 'c')])
+
+    def test_staging_is_loaded_without_streaming(self):
+        self.bq.upsert_to_table('ds', 'users', [{'id': 3, 'name': 'c'}], keys='id')
+        self.assertEqual(self.bq.client.calls['tabledata.insertAll'], 0)
+        self.assertEqual(self.bq.client.calls['push_rows'], 0)
+        self.assertEqual(self.tables(), ['users'])
+
+    def test_nothing_to_upsert(self):
+        result = self.bq.upsert_to_table('ds', 'users', [], keys='id')
+        self.assertEqual((result.rows, result.job_id), (0, None))
+        self.assertEqual(self.tables(), ['users'])
+
+    def test_staging_is_dropped_when_the_load_fails(self):
+        with self.assertRaises(BigQueryJobError):
+            self.bq.upsert_to_table('ds', 'users', [{'id': 3, 'name': 'c', 'extra': 1}],
+                                    keys='id', unknown='keep')
+        self.assertEqual(self.users(), [(1, 'a'), (2, 'b')])
+        self.assertEqual(self.tables(), ['users'])
+
+    def test_staging_table_not_created(self):
+        with self.assertRaises(BigQueryError):
+            self.bq.upsert_to_table('ds', 'users', [{'id': 3, 'name': 'c'}], keys='id',
+                                    staging_dataset='missing')
+        self.assertEqual(self.users(), [(1, 'a'), (2, 'b')])
+
+    def test_unknown_key(self):
+        with self.assertRaises(BigQueryError):
+            self.bq.upsert_to_table('ds', 'users', [{'id': 3}], keys='email')
+
+    def test_merge_query(self):
+        sql = merge_query('ds', 'users', 'ds', 'staging',
+                          [{'name': 'id'}, {'name': 'name'}], ['id'])
+        self.assertIn('ON T.`id` = S.`id`', sql)
+        self.assertIn('UPDATE SET `name` = S.`name`', sql)
+
+
+if __name__ == '__main__':
+    unittest.main()